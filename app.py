@@ -6,35 +6,206 @@ import re
 import time
 import json
 import uuid
+import hmac
 import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
 from urllib.parse import urlparse, unquote
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, StreamingResponse, Response
+from fastapi.responses import HTMLResponse, StreamingResponse, Response, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import Optional
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
 import io
 import requests
 
 from modules.outline_client import OutlineClient
+from modules.cache import OutlineCache
+from modules.webhooks import verify_signature, apply_webhook_event, record_payload
+from modules.pdf_export import pdf_style, export_collection_pdf
+from modules.markdown_pipeline import prepare_document, document_revision, image_info
+from modules.admission import AdmissionController, Overloaded, after_body, run_admitted
+from modules.logging_setup import setup_logging, start_request, timed, RequestLogSampler
+from modules.fonts import FontService, FONT_FAMILIES, FONT_STYLES, GLYPH_HASH_PATTERN
+from modules.prefetch import Prefetcher
+from modules.profiling import (
+    SamplingProfiler, ProfilerBusy, MemoryTracker, LoopLagMonitor, format_collapsed, threadpool_metrics,
+)
 
 # ===== LOGGING SETUP =====
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+# Log-Records gehen ueber eine Queue an einen Hintergrund-Thread (JSON oder Text).
+# Erfolgreiche Requests werden mit LOG_SAMPLE_RATE gesampelt, langsame und fehlerhafte immer geloggt.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower().strip()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", 1000))
+
+setup_logging(LOG_LEVEL, LOG_FORMAT)
 logger = logging.getLogger("outline-pdf")
+request_log_sampler = RequestLogSampler(LOG_SAMPLE_RATE, LOG_SLOW_MS)
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
 
-app = FastAPI(title="Outline PDF Tool")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Hintergrund-Aufgaben beim Start/Stopp des Servers"""
+    if ENABLE_PROFILING and ADMIN_TOKEN:
+        loop_lag_monitor.start()
+    if prefetch_active():
+        prefetcher.start(prefetch_seed)
+    elif PREFETCH_ENABLED:
+        logger.warning("Prefetch deaktiviert: ohne Inhalts-Cache (OUTLINE_WEBHOOK_SECRET oder CACHE_TTL_SECONDS) "
+                       "wuerde jedes Vorwaermen Outline abfragen, ohne dass der Editor davon profitiert")
+    yield
+    loop_lag_monitor.stop()
+    prefetcher.stop()
+
+
+app = FastAPI(title="Outline PDF Tool", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 outline_client = OutlineClient()
 
+# ===== CACHE & WEBHOOKS =====
+# Mit konfiguriertem Webhook-Secret haelt Outline den Cache aktuell -> lange TTL.
+# Ohne Webhooks werden Dokumente und Listen nicht gecacht (immer aktuell wie ohne Cache).
+WEBHOOK_SECRET = os.getenv("OUTLINE_WEBHOOK_SECRET", "")
+WEBHOOK_RECORD_DIR = os.getenv("WEBHOOK_RECORD_DIR", "")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 86400 if WEBHOOK_SECRET else 0))
+# Bilder und vorbereitetes Markdown (Schluessel pro Revision) koennen nicht veralten
+CACHE_ASSET_TTL_SECONDS = float(os.getenv("CACHE_ASSET_TTL_SECONDS", 86400 if WEBHOOK_SECRET else 300))
+CACHE_IMAGE_MAX_MB = int(os.getenv("CACHE_IMAGE_MAX_MB", 200))
+
+outline_cache = OutlineCache(
+    outline_client,
+    ttl=CACHE_ASSET_TTL_SECONDS,
+    content_ttl=CACHE_TTL_SECONDS,
+    image_max_bytes=CACHE_IMAGE_MAX_MB * 1024 * 1024,
+)
+
+# Parallele Render-Threads pro Collection-Export
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", 4))
+# Gerenderte Dokumente + Manifest pro Collection (leer = jeder Export rendert alles neu)
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join("data", "exports"))
+
+# ===== FONTS =====
+# Verzeichnisse mit TTF-Dateien (getrennt mit ":"), Subsets werden im Speicher gecacht
+FONT_DIRS = os.getenv("FONT_DIRS", "fonts:/usr/share/fonts").split(":")
+FONT_CACHE_MAX_MB = int(os.getenv("FONT_CACHE_MAX_MB", 50))
+# Registrierte Zeichensaetze (Subset-URLs bleiben nach Neustart und ueber mehrere Worker gueltig; leer = nur im Speicher)
+FONT_GLYPH_DIR = os.getenv("FONT_GLYPH_DIR", os.path.join("data", "font_glyphs"))
+font_service = FontService(FONT_DIRS, max_bytes=FONT_CACHE_MAX_MB * 1024 * 1024, glyph_dir=FONT_GLYPH_DIR or None)
+
+# ===== ADMISSION CONTROL =====
+# Pro Routen-Klasse: gleichzeitige Anfragen und Warteschlange (per ENV ueberschreibbar)
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 10))
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower().strip() == "true"
+
+
+def admission_controller(name: str, concurrency: int, queue: int) -> AdmissionController:
+    return AdmissionController(
+        name,
+        max_concurrent=int(os.getenv(f"ADMISSION_{name.upper()}_CONCURRENCY", concurrency)),
+        max_queue=int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", queue)),
+        max_wait=ADMISSION_MAX_WAIT_SECONDS,
+    )
+
+
+admission = {
+    "image": admission_controller("image", 8, 64),
+    "document": admission_controller("document", 8, 64),
+    "export": admission_controller("export", 2, 4),
+}
+
+ADMISSION_ROUTES = [
+    ("export", re.compile(r"^/api/collections/[^/]+/export\.pdf$")),
+    ("image", re.compile(r"^/api/(image-proxy|attachments\.redirect)$")),
+    ("document", re.compile(r"^/api/documents?(/|$)|^/api/search$|^/api/fonts/|^/editor/")),
+]
+
+
+def classify_route(path: str) -> Optional[str]:
+    for name, pattern in ADMISSION_ROUTES:
+        if pattern.match(path):
+            return name
+    return None
+
+
+def client_id(request: Request) -> str:
+    """Client-Kennung fuer faire Warteschlangen (hinter Reverse-Proxy: X-Forwarded-For)"""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("X-Forwarded-For", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+# ===== PREFETCH =====
+# Vorwaermen wahrscheinlich naechster Dokumente (Favoriten, zuletzt geaendert, sichtbare Suchtreffer).
+# Standardmaessig aus: erzeugt zusaetzliche Last auf Outline, lohnt sich erst mit Webhook-Cache
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower().strip() == "true"
+PREFETCH_BUDGET_PER_MINUTE = int(os.getenv("PREFETCH_BUDGET_PER_MINUTE", 30))
+PREFETCH_MAX_QUEUE = int(os.getenv("PREFETCH_MAX_QUEUE", 100))
+# Anzahl Dokumente beim Start (heisseste zuerst, aufgefuellt mit zuletzt geaenderten)
+PREFETCH_STARTUP = int(os.getenv("PREFETCH_STARTUP", 20))
+PREFETCH_HOT_FILE = os.getenv("PREFETCH_HOT_FILE", os.path.join("data", "prefetch_hot.json"))
+PREFETCH_MAX_IDS = 50
+
+
+def prefetch_active() -> bool:
+    """Vorwaermen nur mit Inhalts-Cache: bei content_ttl 0 wuerde nichts gespeichert (nur zusaetzliche Last)"""
+    return PREFETCH_ENABLED and outline_cache.content_ttl > 0
+
+
+def server_busy() -> bool:
+    """Laufende oder wartende Requests -> Prefetch pausiert"""
+    return any(c.in_flight or c.queued for c in admission.values())
+
+
+def warm_document(doc_id: str) -> bool:
+    """Dokument, vorbereitetes Markdown (Standard-Optionen) und Bilder laden. False, wenn schon im Cache."""
+    document = outline_cache.data.peek(f"document:{doc_id}")
+    fetched = document is None
+    if fetched:
+        document = outline_cache.get_document(doc_id)
+    key = prepared_cache_key(doc_id, document, True)
+    if outline_cache.data.peek(key) is None:
+        outline_cache.data.set(key, prepare_document(document, True, download_image_info))
+        fetched = True
+    return fetched
+
+
+def prefetch_seed() -> List[str]:
+    """Beim Start: meistgeoeffnete Dokumente, aufgefuellt mit den zuletzt geaenderten"""
+    ids = prefetcher.hottest(PREFETCH_STARTUP)
+    try:
+        documents = outline_cache.get_documents()
+    except Exception as e:
+        logger.warning("Prefetch: Dokumentliste nicht verfuegbar: %s", e)
+        documents = []
+    for doc in sorted(documents, key=lambda d: d.get("updatedAt") or "", reverse=True):
+        if len(ids) >= PREFETCH_STARTUP:
+            break
+        if doc.get("id") and doc["id"] not in ids:
+            ids.append(doc["id"])
+    return ids
+
+
+prefetcher = Prefetcher(
+    warm_document, server_busy,
+    budget_per_minute=PREFETCH_BUDGET_PER_MINUTE,
+    max_queue=PREFETCH_MAX_QUEUE,
+    hot_file=PREFETCH_HOT_FILE if PREFETCH_ENABLED else None,
+)
+
+
 # ===== TEMPLATES (JSON) =====
 TEMPLATES_FILE = os.path.join("data", "templates.json")
 
@@ -44,11 +215,28 @@ def load_templates():
         return json.load(f)
 
 
+def find_template(template_id: str) -> dict:
+    for tpl in load_templates()["templates"]:
+        if tpl["id"] == template_id:
+            return tpl
+    raise HTTPException(status_code=404, detail="Vorlage nicht gefunden")
+
+
 def save_templates(data):
     with open(TEMPLATES_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
 
 
+class PrefetchRequest(BaseModel):
+    ids: List[str]
+    reason: str = ""
+
+
+class FontSubsetRequest(BaseModel):
+    family: str
+    text: str = ""
+
+
 class TemplateRequest(BaseModel):
     name: str
     icon: Optional[str] = "bi-file-text"
@@ -68,7 +256,7 @@ def validate_doc_id(doc_id: str) -> str:
     """Validiert dass doc_id ein gueltiges UUID-Format hat"""
     doc_id = doc_id.strip()
     if not UUID_PATTERN.match(doc_id):
-        logger.warning(f"Ungueltige Document ID: {doc_id}")
+        logger.warning("Ungueltige Document ID: %s", doc_id)
         raise HTTPException(status_code=400, detail="Ungueltige Document ID")
     return doc_id
 
@@ -79,14 +267,14 @@ def validate_proxy_url(url: str, allowed_base: str) -> str:
 
     # Path Traversal verhindern
     if '..' in url or '\x00' in url:
-        logger.warning(f"Path Traversal Versuch erkannt: {url}")
+        logger.warning("Path Traversal Versuch erkannt: %s", url)
         raise HTTPException(status_code=400, detail="Ungueltige URL")
 
     # Nur relative Outline-Pfade oder URLs die mit der Outline-Base beginnen
     if url.startswith("/"):
         # Relative URL: nur bestimmte API-Pfade erlauben
         if not url.startswith("/api/"):
-            logger.warning(f"Unerlaubter relativer Pfad: {url}")
+            logger.warning("Unerlaubter relativer Pfad: %s", url)
             raise HTTPException(status_code=400, detail="Nur /api/ Pfade erlaubt")
         return allowed_base + url
 
@@ -95,27 +283,75 @@ def validate_proxy_url(url: str, allowed_base: str) -> str:
         allowed_parsed = urlparse(allowed_base)
         # Host muss exakt matchen (kein evil.com?outline.com Trick)
         if parsed.hostname != allowed_parsed.hostname:
-            logger.warning(f"Host mismatch: {parsed.hostname} != {allowed_parsed.hostname}")
+            logger.warning("Host mismatch: %s != %s", parsed.hostname, allowed_parsed.hostname)
             raise HTTPException(status_code=400, detail="Nur Outline-URLs erlaubt")
         return url
 
-    logger.warning(f"URL nicht erlaubt: {url}")
+    logger.warning("URL nicht erlaubt: %s", url)
     raise HTTPException(status_code=400, detail="Nur Outline-URLs erlaubt")
 
 
+def image_cache_key(url: str) -> Optional[str]:
+    """Cache-Schluessel fuer eine Bild-URL aus dem Markdown (None fuer externe/ungueltige URLs)"""
+    try:
+        return validate_proxy_url(url, outline_client.base_url)
+    except HTTPException:
+        return None
+
+
+# ===== ADMISSION CONTROL MIDDLEWARE =====
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    route = classify_route(request.url.path)
+    if route is None:
+        return await call_next(request)
+
+    try:
+        return await run_admitted(admission[route], client_id(request), lambda: call_next(request))
+    except Overloaded as e:
+        logger.warning("Load Shedding: %s %s abgelehnt (%s, Retry-After %ss)", request.method, request.url.path, e.route, e.retry_after)
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server ausgelastet, bitte spaeter erneut versuchen"},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
 # ===== REQUEST LOGGING MIDDLEWARE =====
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    duration = round((time.time() - start_time) * 1000)
+    # Request-ID vom Reverse-Proxy uebernehmen oder neu vergeben
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    ctx = start_request(request_id)
 
-    # Nur API- und Editor-Requests loggen (nicht static files)
+    start_time = time.perf_counter()
     path = request.url.path
-    if path.startswith("/api/") or path.startswith("/editor/"):
-        logger.info(f"{request.method} {path} -> {response.status_code} ({duration}ms)")
 
-    return response
+    async def log_request(status_code: int):
+        # Dauer bis der Body komplett gesendet ist (Streams, Datei-Downloads)
+        duration = round((time.perf_counter() - start_time) * 1000, 1)
+        # Nur API- und Editor-Requests loggen (nicht static files)
+        if path.startswith("/api/") or path.startswith("/editor/"):
+            level = request_log_sampler.level_for(status_code, duration)
+            if level is not None:
+                logger.log(level, "%s %s -> %s (%sms)", request.method, path, status_code, duration, extra={
+                    "method": request.method,
+                    "path": path,
+                    "status": status_code,
+                    "duration_ms": duration,
+                    "client": client_id(request),
+                    **ctx["timings"],
+                })
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await log_request(500)
+        raise
+    response.headers["X-Request-ID"] = request_id
+    return await after_body(response, lambda: log_request(response.status_code))
 
 
 # ===== ENDPOINTS =====
@@ -125,15 +361,23 @@ async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+@app.get("/sw.js")
+async def service_worker():
+    """Service Worker unter der Wurzel ausliefern, damit sein Scope die ganze App umfasst"""
+    return FileResponse(
+        os.path.join("static", "js", "sw.js"),
+        media_type="application/javascript",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @app.get("/api/collections")
 async def get_collections():
     try:
-        logger.info("Lade Collections...")
-        collections = outline_client.get_collections()
-        logger.info(f"{len(collections)} Collections geladen")
+        collections = await run_in_threadpool(outline_cache.get_collections)
         return {"success": True, "data": collections}
     except Exception as e:
-        logger.error(f"Fehler beim Laden der Collections: {e}", exc_info=True)
+        logger.error("Fehler beim Laden der Collections: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -144,29 +388,78 @@ async def get_documents(collection_id: Optional[str] = None):
         if collection_id:
             collection_id = validate_doc_id(collection_id)
 
-        logger.info(f"Lade Dokumente (collection_id={collection_id})")
-        documents = outline_client.get_documents(collection_id)
-        logger.info(f"{len(documents)} Dokumente geladen")
+        documents = await run_in_threadpool(outline_cache.get_documents, collection_id)
         return {"success": True, "data": documents}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Fehler beim Laden der Dokumente: {e}", exc_info=True)
+        logger.error("Fehler beim Laden der Dokumente: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/documents/stream")
+async def stream_documents(collection_id: Optional[str] = None):
+    """
+    Dokumentliste als NDJSON: eine Zeile pro Dokument, sobald die jeweilige Seite von Outline eintrifft.
+    Zeilen: {"type": "document", "data": {...}}, am Ende {"type": "done", "count": n}
+    oder bei Abbruch {"type": "error", "detail": "..."}.
+    """
+    if collection_id:
+        collection_id = validate_doc_id(collection_id)
+
+    def generate():
+        count = 0
+        try:
+            for page in outline_cache.iter_documents(collection_id):
+                yield "".join(json.dumps({"type": "document", "data": doc}, ensure_ascii=False) + "\n" for doc in page)
+                count += len(page)
+        except Exception as e:
+            logger.error("Fehler beim Streamen der Dokumente nach %s Eintraegen: %s", count, e, exc_info=True)
+            yield json.dumps({"type": "error", "detail": "Dokumente konnten nicht vollstaendig geladen werden"}) + "\n"
+            return
+        yield json.dumps({"type": "done", "count": count}) + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        # Reverse-Proxies (nginx) sollen die Zeilen nicht puffern
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/document/{doc_id}")
 async def get_document(doc_id: str):
     try:
         doc_id = validate_doc_id(doc_id)
-        logger.info(f"Lade Dokument: {doc_id}")
-        document = outline_client.get_document(doc_id)
-        logger.info(f"Dokument geladen: {document.get('title', 'Unbekannt')}")
+        document = await run_in_threadpool(outline_cache.get_document, doc_id)
         return {"success": True, "data": document}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Fehler beim Laden von Dokument {doc_id}: {e}", exc_info=True)
+        logger.error("Fehler beim Laden von Dokument %s: %s", doc_id, e, exc_info=True)
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def prepared_cache_key(doc_id: str, document: dict, numbering: bool) -> str:
+    return f"prepared:{doc_id}:{document_revision(document)}:{int(numbering)}"
+
+
+@app.get("/api/document/{doc_id}/prepared")
+async def get_prepared_document(doc_id: str, numbering: bool = True):
+    """Vorverarbeitetes Markdown + Gliederung + Bild-Manifest (gecacht pro Dokument-Revision)"""
+    try:
+        doc_id = validate_doc_id(doc_id)
+        document = await run_in_threadpool(outline_cache.get_document, doc_id)
+        key = prepared_cache_key(doc_id, document, numbering)
+        prepared = outline_cache.data.get(key)
+        if prepared is None:
+            prepared = await run_in_threadpool(prepare_document, document, numbering, probe_image_info)
+            outline_cache.data.set(key, prepared)
+        return {"success": True, "data": prepared}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Fehler bei der Vorverarbeitung von Dokument %s: %s", doc_id, e, exc_info=True)
         raise HTTPException(status_code=404, detail=str(e))
 
 
@@ -174,9 +467,9 @@ async def get_document(doc_id: str):
 async def editor_page(request: Request, doc_id: str):
     try:
         doc_id = validate_doc_id(doc_id)
-        logger.info(f"Editor geoeffnet fuer Dokument: {doc_id}")
-        document = outline_client.get_document(doc_id)
-        logger.info(f"Editor: Dokument '{document.get('title', 'Unbekannt')}' geladen")
+        document = await run_in_threadpool(outline_cache.get_document, doc_id)
+        if prefetch_active():
+            prefetcher.record_access(doc_id)
         return templates.TemplateResponse(
             "editor.html",
             {
@@ -188,7 +481,7 @@ async def editor_page(request: Request, doc_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Fehler beim Oeffnen des Editors fuer {doc_id}: {e}", exc_info=True)
+        logger.error("Fehler beim Oeffnen des Editors fuer %s: %s", doc_id, e, exc_info=True)
         raise HTTPException(status_code=404, detail=str(e))
 
 
@@ -199,19 +492,120 @@ async def search_documents(q: str):
         q = q.strip()
         if not q or len(q) < 2:
             raise HTTPException(status_code=400, detail="Suchbegriff muss mindestens 2 Zeichen lang sein")
-        logger.info(f"Suche nach: '{q}'")
-        results = outline_client.search_documents(q)
+        results = await run_in_threadpool(outline_client.search_documents, q)
         # Outline gibt verschachtelte Ergebnisse zurueck: [{document: {...}, ...}]
         documents = [r.get("document", r) for r in results]
-        logger.info(f"Suche '{q}': {len(documents)} Treffer")
         return {"success": True, "data": documents}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Fehler bei der Suche: {e}", exc_info=True)
+        logger.error("Fehler bei der Suche: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/prefetch")
+async def request_prefetch(body: PrefetchRequest):
+    """Dokumente zum Vorwaermen vormerken (Favoriten, zuletzt geaendert, sichtbare Suchtreffer)"""
+    if not prefetch_active():
+        raise HTTPException(status_code=404, detail="Prefetch deaktiviert")
+    if len(body.ids) > PREFETCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Maximal {PREFETCH_MAX_IDS} Dokumente pro Anfrage")
+    ids = [validate_doc_id(str(doc_id)) for doc_id in body.ids]
+    queued = prefetcher.enqueue(ids, body.reason[:20])
+    return {"success": True, "data": {"queued": queued}}
+
+
+def fetch_image(validated_url: str):
+    """Laedt ein Bild von Outline (mit Auth) und prueft Typ und Groesse. Gibt (content, content_type) zurueck."""
+    logger.debug("Image-Proxy: Lade Bild von %s", validated_url[:80])
+    headers = {"Authorization": f"Bearer {outline_client.api_token}"}
+    with timed("outline_ms"):
+        response = requests.get(validated_url, headers=headers, allow_redirects=True, timeout=15)
+    response.raise_for_status()
+
+    content_type = response.headers.get("Content-Type", "image/png")
+
+    # Nur Bild-Content-Types erlauben
+    allowed_types = ["image/png", "image/jpeg", "image/gif", "image/webp", "image/svg+xml"]
+    if not any(ct in content_type for ct in allowed_types):
+        logger.warning("Image-Proxy: Unerlaubter Content-Type: %s", content_type)
+        raise HTTPException(status_code=400, detail=f"Kein Bild-Format: {content_type}")
+
+    # Maximale Groesse: 20MB
+    content_length = len(response.content)
+    if content_length > 20 * 1024 * 1024:
+        logger.warning("Image-Proxy: Bild zu gross: %s bytes", content_length)
+        raise HTTPException(status_code=413, detail="Bild zu gross (max 20MB)")
+
+    logger.debug("Image-Proxy: Bild geladen (%s bytes, %s)", content_length, content_type)
+    return response.content, content_type
+
+
+def head_image(validated_url: str) -> Dict:
+    """Nur die Header eines Bildes abfragen (HEAD): Groesse laut Content-Length und Content-Type, ohne Pixelmasse"""
+    headers = {"Authorization": f"Bearer {outline_client.api_token}"}
+    with timed("outline_ms"):
+        response = requests.head(validated_url, headers=headers, allow_redirects=True, timeout=15)
+    response.raise_for_status()
+    content_length = response.headers.get("Content-Length", "")
+    return {
+        "bytes": int(content_length) if content_length.isdigit() else None,
+        "content_type": response.headers.get("Content-Type"),
+        "width": None,
+        "height": None,
+    }
+
+
+def fetch_attachment(url: str):
+    """Laedt ein Attachment von Outline (mit Auth). Gibt (content, content_type) zurueck."""
+    headers = {"Authorization": f"Bearer {outline_client.api_token}"}
+    with timed("outline_ms"):
+        resp = requests.get(url, headers=headers, allow_redirects=True, timeout=15)
+    resp.raise_for_status()
+    return resp.content, resp.headers.get("Content-Type", "application/octet-stream")
+
+
+def load_image_entry(url: str):
+    """Bild-URL aus dem Markdown ueber den Bild-Cache laden. Gibt (content, content_type) oder None zurueck."""
+    key = image_cache_key(url)
+    if not key:
+        return None
+    try:
+        return outline_cache.get_image(key, fetch_image)
+    except Exception as e:
+        logger.warning("Bild konnte nicht geladen werden (%s): %s", url[:80], e)
+        return None
+
+
+def download_image_info(url: str) -> Optional[Dict]:
+    """Manifest-Eintrag mit komplettem Download (waermt den Bild-Cache, nur fuer den Prefetcher)"""
+    entry = load_image_entry(url)
+    return image_info(*entry) if entry else None
+
+
+def probe_image_info(url: str) -> Optional[Dict]:
+    """
+    Manifest-Eintrag fuer /prepared ohne Bild-Download: aus dem Bild-Cache, sonst per HEAD.
+    Schlaegt HEAD fehl (z.B. signierte S3-URLs nur fuer GET), bleibt die Groesse unbekannt;
+    der Browser laedt das Bild dann ohnehin ueber den Proxy.
+    """
+    key = image_cache_key(url)
+    if not key:
+        return None
+    cached = outline_cache.images.peek(key)
+    if cached is not None:
+        return image_info(*cached)
+    try:
+        return head_image(key)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code in (404, 410):
+            return None
+        logger.debug("HEAD fuer Bild fehlgeschlagen (%s): %s", url[:80], e)
+    except Exception as e:
+        logger.debug("HEAD fuer Bild fehlgeschlagen (%s): %s", url[:80], e)
+    return {"bytes": None, "content_type": None, "width": None, "height": None}
+
+
 @app.get("/api/image-proxy")
 async def image_proxy(url: str):
     """Proxy fuer Outline-Bilder (benoetigt Auth-Header)"""
@@ -219,36 +613,17 @@ async def image_proxy(url: str):
 
     # URL validieren
     validated_url = validate_proxy_url(url, outline_url)
-    logger.info(f"Image-Proxy: Lade Bild von {validated_url[:80]}...")
 
     try:
-        headers = {"Authorization": f"Bearer {outline_client.api_token}"}
-        response = requests.get(validated_url, headers=headers, allow_redirects=True, timeout=15)
-        response.raise_for_status()
-
-        content_type = response.headers.get("Content-Type", "image/png")
-
-        # Nur Bild-Content-Types erlauben
-        allowed_types = ["image/png", "image/jpeg", "image/gif", "image/webp", "image/svg+xml"]
-        if not any(ct in content_type for ct in allowed_types):
-            logger.warning(f"Image-Proxy: Unerlaubter Content-Type: {content_type}")
-            raise HTTPException(status_code=400, detail=f"Kein Bild-Format: {content_type}")
-
-        # Maximale Groesse: 20MB
-        content_length = len(response.content)
-        if content_length > 20 * 1024 * 1024:
-            logger.warning(f"Image-Proxy: Bild zu gross: {content_length} bytes")
-            raise HTTPException(status_code=413, detail="Bild zu gross (max 20MB)")
-
-        logger.info(f"Image-Proxy: Bild geladen ({content_length} bytes, {content_type})")
+        content, content_type = await run_in_threadpool(outline_cache.get_image, validated_url, fetch_image)
         return StreamingResponse(
-            io.BytesIO(response.content),
+            io.BytesIO(content),
             media_type=content_type
         )
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Image-Proxy Fehler: {e}", exc_info=True)
+        logger.error("Image-Proxy Fehler: %s", e, exc_info=True)
         raise HTTPException(status_code=502, detail=f"Bild konnte nicht geladen werden: {e}")
 
 
@@ -258,16 +633,218 @@ async def proxy_attachment(id: str):
     try:
         outline_url = outline_client.base_url
         url = f"{outline_url}/api/attachments.redirect?id={id}"
-        headers = {"Authorization": f"Bearer {outline_client.api_token}"}
+        content, content_type = await run_in_threadpool(outline_cache.get_image, url, fetch_attachment)
+        return Response(content=content, media_type=content_type)
+    except Exception as e:
+        logger.error("Attachment Proxy Fehler %s: %s", id, e)
+        raise HTTPException(status_code=404, detail="Bild nicht gefunden")
+
+
+# ===== COLLECTION EXPORT =====
+
+def load_image_bytes(url: str) -> Optional[bytes]:
+    """Bild fuer den serverseitigen Export laden (ueber den Bild-Cache). None bei Fehler."""
+    entry = load_image_entry(url)
+    return entry[0] if entry else None
 
-        resp = requests.get(url, headers=headers, allow_redirects=True, timeout=15)
-        resp.raise_for_status()
 
-        content_type = resp.headers.get("Content-Type", "application/octet-stream")
-        return Response(content=resp.content, media_type=content_type)
+@app.get("/api/collections/{collection_id}/export.pdf")
+async def export_collection(collection_id: str, template_id: str = "default"):
+    """Ganze Collection als ein PDF (Baumreihenfolge, gemeinsames Inhaltsverzeichnis, durchgehende Seitenzahlen)"""
+    collection_id = validate_doc_id(collection_id)
+    template = find_template(template_id)
+
+    try:
+        collections = await run_in_threadpool(outline_cache.get_collections)
     except Exception as e:
-        logger.error(f"Attachment Proxy Fehler {id}: {e}")
-        raise HTTPException(status_code=404, detail="Bild nicht gefunden")
+        logger.error("Fehler beim Laden der Collections: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    collection = next((c for c in collections if c.get("id") == collection_id), None)
+    if not collection:
+        raise HTTPException(status_code=404, detail="Collection nicht gefunden")
+
+    tmp_dir = tempfile.mkdtemp(prefix="outline-pdf-")
+    out_path = os.path.join(tmp_dir, "export.pdf")
+    try:
+        await run_in_threadpool(
+            export_collection_pdf, outline_cache, collection_id, collection["name"],
+            pdf_style(template, font_service), out_path, EXPORT_WORKERS, load_image_bytes,
+            os.path.join(EXPORT_CACHE_DIR, collection_id) if EXPORT_CACHE_DIR else None,
+        )
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.error("Fehler beim Export der Collection %s: %s", collection_id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    filename = re.sub(r"[^\w\s-]", "", collection["name"]).strip().replace(" ", "_") or "Collection"
+    return FileResponse(
+        out_path,
+        media_type="application/pdf",
+        filename=f"{filename}.pdf",
+        background=BackgroundTask(shutil.rmtree, tmp_dir, ignore_errors=True),
+    )
+
+
+# ===== FONTS =====
+
+@app.get("/api/fonts")
+async def get_fonts():
+    """Verfuegbare Schriften und Schnitte"""
+    return {"success": True, "data": await run_in_threadpool(font_service.families)}
+
+
+@app.post("/api/fonts/subset")
+async def create_font_subset(body: FontSubsetRequest):
+    """
+    Registriert die im Dokument verwendeten Zeichen und liefert die URLs der Subset-Fonts.
+    Die URLs enthalten den Zeichensatz-Hash und sind damit dauerhaft cachebar.
+    """
+    if body.family not in FONT_FAMILIES:
+        raise HTTPException(status_code=400, detail=f"Unbekannte Schrift: {body.family}")
+    if len(body.text) > 100_000:
+        raise HTTPException(status_code=413, detail="Text zu lang (nur verwendete Zeichen senden)")
+
+    styles = await run_in_threadpool(font_service.available_styles, body.family)
+    if not styles:
+        raise HTTPException(status_code=404, detail=f"Schrift nicht installiert: {body.family}")
+    glyph_hash = font_service.register_glyphs(body.text)
+    return {
+        "success": True,
+        "data": {
+            "family": body.family,
+            "hash": glyph_hash,
+            "files": {style: f"/api/fonts/{body.family}/{style}/{glyph_hash}.ttf" for style in styles},
+        },
+    }
+
+
+@app.get("/api/fonts/{family}/{style}/{glyph_hash}.ttf")
+async def get_font_subset(family: str, style: str, glyph_hash: str):
+    if family not in FONT_FAMILIES or style not in FONT_STYLES or not GLYPH_HASH_PATTERN.match(glyph_hash):
+        raise HTTPException(status_code=400, detail="Ungueltige Font-Anfrage")
+    data = await run_in_threadpool(font_service.subset, family, style, glyph_hash)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Font-Subset nicht gefunden")
+    return Response(
+        content=data,
+        media_type="font/ttf",
+        # Inhalt haengt nur vom Hash ab -> unveraenderlich
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+# ===== METRIKEN =====
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Auslastung pro Routen-Klasse (Queue-Laenge, Ablehnungen) und Cache-Statistik"""
+    return {
+        "success": True,
+        "data": {
+            "admission": {name: controller.metrics() for name, controller in admission.items()},
+            "cache": outline_cache.stats(),
+            "fonts": font_service.stats(),
+            "prefetch": prefetcher.metrics(),
+        },
+    }
+
+
+# ===== PROFILING (ADMIN) =====
+# Nur aktiv mit ENABLE_PROFILING=true und gesetztem ADMIN_TOKEN, sonst 404
+ENABLE_PROFILING = os.getenv("ENABLE_PROFILING", "false").lower().strip() == "true"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+cpu_profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
+loop_lag_monitor = LoopLagMonitor()
+
+
+def require_admin(request: Request):
+    if not (ENABLE_PROFILING and ADMIN_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+    auth = request.headers.get("Authorization", "")
+    token = auth[7:] if auth.startswith("Bearer ") else ""
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        logger.warning("Admin: Ungueltiger Token fuer %s", request.url.path)
+        raise HTTPException(status_code=401, detail="Nicht autorisiert")
+
+
+@app.get("/api/admin/profile/cpu")
+async def profile_cpu(request: Request, seconds: float = 10, interval_ms: float = 5):
+    """Sampling-Profil aller Threads fuer N Sekunden als Collapsed Stacks (flamegraph.pl / speedscope)"""
+    require_admin(request)
+    try:
+        result = await run_in_threadpool(cpu_profiler.profile, seconds, interval_ms)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Es laeuft bereits ein CPU-Profil")
+    return Response(
+        content=format_collapsed(result["stacks"]),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Profile-Samples": str(result["samples"]), "X-Profile-Seconds": str(result["seconds"])},
+    )
+
+
+@app.get("/api/admin/profile/memory")
+async def profile_memory(request: Request, limit: int = 25, group_by: str = "lineno"):
+    """
+    tracemalloc-Snapshot: Top-Allokationen und Diff zum vorherigen Aufruf.
+    Der erste Aufruf startet tracemalloc (kostet Speicher und etwas CPU).
+    """
+    require_admin(request)
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by muss lineno, filename oder traceback sein")
+    if not memory_tracker.tracing:
+        memory_tracker.start()
+        return {"success": True, "data": {"tracing": True, "started": True}}
+    snapshot = await run_in_threadpool(memory_tracker.snapshot, min(max(limit, 1), 200), group_by)
+    return {"success": True, "data": {"tracing": True, **snapshot}}
+
+
+@app.delete("/api/admin/profile/memory")
+async def stop_memory_profile(request: Request):
+    """tracemalloc beenden (Overhead entfernen)"""
+    require_admin(request)
+    memory_tracker.stop()
+    return {"success": True}
+
+
+@app.get("/api/admin/runtime")
+async def runtime_metrics(request: Request):
+    """Event-Loop-Verzoegerung, Thread-Pool-Auslastung und Admission-Queues"""
+    require_admin(request)
+    return {
+        "success": True,
+        "data": {
+            "event_loop_lag": loop_lag_monitor.metrics(),
+            "threadpool": threadpool_metrics(),
+            "admission": {name: controller.metrics() for name, controller in admission.items()},
+        },
+    }
+
+
+# ===== WEBHOOKS =====
+
+@app.post("/api/webhooks/outline")
+async def outline_webhook(request: Request):
+    """Outline-Webhook: invalidiert bzw. aktualisiert genau die betroffenen Cache-Eintraege"""
+    if not WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Webhooks nicht konfiguriert")
+
+    body = await request.body()
+    if not verify_signature(body, request.headers.get("Outline-Signature", ""), WEBHOOK_SECRET):
+        logger.warning("Webhook: Ungueltige Signatur")
+        raise HTTPException(status_code=401, detail="Ungueltige Signatur")
+
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungueltiges JSON")
+
+    if WEBHOOK_RECORD_DIR:
+        record_payload(body, WEBHOOK_RECORD_DIR, event.get("event", ""))
+
+    result = apply_webhook_event(event, outline_cache, image_cache_key)
+    return {"success": True, "data": result}
 
 
 # ===== TEMPLATE CRUD =====
@@ -353,5 +930,6 @@ if __name__ == "__main__":
 
     host = os.environ.get("HOST", "127.0.0.1")
     port = int(os.environ.get("PORT", 8000))
-    logger.info(f"Server startet auf http://{host}:{port}")
-    uvicorn.run("app:app", host=host, port=port, reload=False)
+    logger.info("Server startet auf http://%s:%s", host, port)
+    # Uvicorn-Logs laufen ueber die Log-Queue; Requests loggt bereits log_requests()
+    uvicorn.run("app:app", host=host, port=port, reload=False, log_config=None, access_log=False)
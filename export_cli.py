@@ -0,0 +1,356 @@
+"""
+Export CLI - PDF-Export ohne Server (z.B. fuer Archiv-Jobs per Cron)
+Exportiert Dokumente, eine Collection oder Suchtreffer als einzelne PDFs in ein Verzeichnis.
+Gerendert wird in einem Prozess-Pool; bereits exportierte Dokumente stehen im Manifest des
+Zielverzeichnisses und werden beim erneuten Aufruf uebersprungen (Fortsetzen nach Abbruch).
+
+Beispiele:
+    python export_cli.py collection Handbuch --out archiv/handbuch
+    python export_cli.py documents <doc_id> <doc_id> --out archiv --template formal
+    python export_cli.py search "Onboarding" --out archiv/onboarding --processes 2
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from modules.fonts import FontService
+from modules.logging_setup import TextFormatter, setup_logging
+from modules.outline_client import OutlineClient
+from modules.pdf_export import ExportManifest, export_document_pdf, flatten_tree, pdf_style, template_hash
+
+logger = logging.getLogger("outline-pdf.cli")
+
+# Relative Pfade gelten ab dem Projektverzeichnis, nicht ab dem aktuellen Verzeichnis (Cron-Jobs)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_FILE = os.path.join(BASE_DIR, "data", "templates.json")
+EXPORT_PROCESSES = int(os.getenv("EXPORT_PROCESSES", os.cpu_count() or 2))
+# Wie im Server: TTF-Dateien fuer Unicode-Text im PDF
+FONT_DIRS = [os.path.join(BASE_DIR, d) for d in os.getenv("FONT_DIRS", "fonts:/usr/share/fonts").split(":")]
+
+IMAGE_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp", "image/svg+xml")
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
+
+# OutlineClient pro Worker-Prozess (in _init_worker erzeugt)
+_client: Optional[OutlineClient] = None
+
+
+# ===== VORLAGEN =====
+
+def load_style(template_id: str, templates_file: Optional[str] = None) -> Dict:
+    """Render-Optionen einer Vorlage aus data/templates.json (ValueError, wenn unbekannt)"""
+    with open(templates_file or TEMPLATES_FILE, "r", encoding="utf-8") as f:
+        templates = json.load(f)["templates"]
+    for tpl in templates:
+        if tpl["id"] == template_id:
+            return pdf_style(tpl, FontService(FONT_DIRS))
+    raise ValueError(f"Vorlage '{template_id}' nicht gefunden ({', '.join(t['id'] for t in templates)})")
+
+
+# ===== AUSWAHL DER DOKUMENTE =====
+
+def safe_filename(title: str) -> str:
+    name = re.sub(r"[^\w\s-]", "", title).strip().replace(" ", "_")
+    return name[:80] or "Dokument"
+
+
+def assign_filenames(jobs: List[Dict], numbered: bool = False) -> List[Dict]:
+    """Dateinamen aus den Titeln; bei gleichen Titeln wird der ID-Anfang angehaengt"""
+    used = set()
+    for index, job in enumerate(jobs, start=1):
+        base = safe_filename(job["title"])
+        if numbered:
+            base = f"{index:03d}_{base}"
+        name = f"{base}.pdf"
+        if name.lower() in used:
+            name = f"{base}_{job['id'][:8]}.pdf"
+        used.add(name.lower())
+        job["file"] = name
+    return jobs
+
+
+def collect_documents(client: OutlineClient, doc_ids: List[str]) -> List[Dict]:
+    jobs = []
+    for doc_id in dict.fromkeys(doc_ids):
+        # Wird ohnehin gebraucht (Titel, updatedAt) -> Inhalt direkt an den Worker weitergeben
+        document = client.get_document(doc_id)
+        jobs.append({
+            "id": document["id"], "title": document.get("title") or "Ohne Titel",
+            "updatedAt": document.get("updatedAt"), "document": document,
+        })
+    return assign_filenames(jobs)
+
+
+def collect_collection(client: OutlineClient, collection: str) -> List[Dict]:
+    """Collection per ID oder Name; Dokumente in Baumreihenfolge, Dateien durchnummeriert"""
+    match = next((c for c in client.get_collections()
+                  if collection in (c.get("id"), c.get("urlId")) or (c.get("name") or "").lower() == collection.lower()),
+                 None)
+    if not match:
+        raise ValueError(f"Collection '{collection}' nicht gefunden")
+    updated_at = {d["id"]: d.get("updatedAt") for d in client.get_documents(match["id"])}
+    jobs = [
+        {"id": entry["id"], "title": entry["title"], "updatedAt": updated_at.get(entry["id"])}
+        for entry in flatten_tree(client.get_collection_tree(match["id"]))
+    ]
+    return assign_filenames(jobs, numbered=True)
+
+
+def collect_search(client: OutlineClient, query: str) -> List[Dict]:
+    """Alle Treffer einer Suche (ueber alle Seiten, nicht nur die ersten 25)"""
+    jobs = {}
+    for page in client.iter_search_pages(query):
+        for result in page:
+            doc = result.get("document", result)
+            if doc.get("id") and doc["id"] not in jobs:
+                jobs[doc["id"]] = {"id": doc["id"], "title": doc.get("title") or "Ohne Titel",
+                                   "updatedAt": doc.get("updatedAt")}
+    return assign_filenames(list(jobs.values()))
+
+
+# ===== WORKER (laeuft im Prozess-Pool) =====
+
+def _init_worker(log_level: str):
+    """Eigener OutlineClient und einfaches Logging pro Prozess (keine Queue: Worker enden ohne atexit)"""
+    global _client
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(TextFormatter())
+    logging.basicConfig(level=log_level.upper(), handlers=[handler], force=True)
+    _client = OutlineClient()
+
+
+def _load_image(url: str) -> Optional[bytes]:
+    """Bild aus dem Markdown laden, Token nur an den Outline-Host senden"""
+    base = _client.base_url
+    if ".." in url:
+        return None
+    if url.startswith("/api/"):
+        url = base + url
+    elif not url.startswith(base) or urlparse(url).hostname != urlparse(base).hostname:
+        return None
+    try:
+        response = requests.get(url, headers={"Authorization": f"Bearer {_client.api_token}"}, timeout=15)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning("Bild konnte nicht geladen werden (%s): %s", url[:80], e)
+        return None
+    content_type = response.headers.get("Content-Type", "")
+    if not content_type.startswith(IMAGE_TYPES) or len(response.content) > IMAGE_MAX_BYTES:
+        return None
+    return response.content
+
+
+def export_job(job: Dict, style: Dict, out_dir: str) -> Dict:
+    """Laedt und rendert ein Dokument nach <out_dir>/.<datei>.part. Gibt Ergebnis mit Zeiten zurueck."""
+    result = {"id": job["id"], "title": job["title"], "file": job["file"], "pages": 0,
+              "fetch_ms": 0, "images_ms": 0, "render_ms": 0}
+    start = time.perf_counter()
+    try:
+        document = job.get("document")
+        if document is None:
+            document = _client.get_document(job["id"])
+        result["fetch_ms"] = round((time.perf_counter() - start) * 1000)
+
+        image_seconds = [0.0]
+
+        def load_image(url: str) -> Optional[bytes]:
+            image_start = time.perf_counter()
+            try:
+                return _load_image(url)
+            finally:
+                image_seconds[0] += time.perf_counter() - image_start
+
+        render_start = time.perf_counter()
+        part_path = os.path.join(out_dir, f".{job['file']}.part")
+        result["pages"] = export_document_pdf(document, job["title"], style, part_path, load_image)
+        result["images_ms"] = round(image_seconds[0] * 1000)
+        result["render_ms"] = round((time.perf_counter() - render_start - image_seconds[0]) * 1000)
+        result["part_path"] = part_path
+        result["status"] = "ok"
+    except Exception as e:
+        logger.error("Dokument %s fehlgeschlagen: %s", job["id"], e, exc_info=True)
+        result["status"] = "fehler"
+        result["error"] = str(e)
+    result["total_ms"] = round((time.perf_counter() - start) * 1000)
+    return result
+
+
+# ===== EXPORT =====
+
+def run_export(jobs: List[Dict], style: Dict, out_dir: str, processes: int = EXPORT_PROCESSES,
+               resume: bool = True, log_level: str = "WARNING", progress=print) -> List[Dict]:
+    """
+    Exportiert alle Jobs nach out_dir. Das Manifest (manifest.json) wird nach jedem Dokument
+    gespeichert; ein abgebrochener Lauf setzt beim naechsten Aufruf dort fort.
+    processes <= 1 rendert im eigenen Prozess (Debugging, Tests).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = ExportManifest(out_dir)
+    tpl_hash = template_hash(style)
+    results: Dict[str, Dict] = {}
+    pending = []
+    jobs_by_id = {job["id"]: job for job in jobs}
+
+    renames = []
+    for job in jobs:
+        hit = manifest.lookup(job["id"], job.get("updatedAt"), tpl_hash, job["title"]) if resume else None
+        if hit is None:
+            pending.append(job)
+            continue
+        path, pages = hit
+        if os.path.basename(path) != job["file"]:
+            # Unveraendert, aber neuer Dateiname (z.B. geaenderte Reihenfolge oder gleiche Titel)
+            renames.append((job, path, pages))
+        results[job["id"]] = {"id": job["id"], "title": job["title"], "file": job["file"], "pages": pages,
+                              "status": "uebersprungen"}
+
+    # Zweiphasig umbenennen: der neue Name kann noch die Datei eines anderen Dokuments sein
+    # (z.B. zwei Dokumente mit gleichem Titel tauschen die Reihenfolge)
+    staged = []
+    for job, path, pages in renames:
+        tmp_path = os.path.join(out_dir, f".{job['id']}.rename")
+        os.replace(path, tmp_path)
+        staged.append((job, tmp_path, pages))
+    for job, tmp_path, pages in staged:
+        manifest.store(job["id"], job["updatedAt"], tpl_hash, job["title"], tmp_path, pages, filename=job["file"])
+    if staged:
+        manifest.save()
+
+    def finish(result: Dict):
+        part_path = result.pop("part_path", None)
+        job = jobs_by_id[result["id"]]
+        if part_path and job.get("updatedAt"):
+            manifest.store(job["id"], job["updatedAt"], tpl_hash, job["title"], part_path, result["pages"],
+                           filename=job["file"])
+            manifest.save()
+        elif part_path:
+            # Ohne updatedAt kein Fortsetzen moeglich, Datei trotzdem ablegen
+            os.replace(part_path, os.path.join(out_dir, job["file"]))
+        results[result["id"]] = result
+        progress(f"[{len(results)}/{len(jobs)}] {result['status']:<6} {result['title']} ({result['total_ms']}ms)")
+
+    if pending:
+        if processes <= 1:
+            global _client
+            if _client is None:
+                _client = OutlineClient()
+            for job in pending:
+                finish(export_job(job, style, out_dir))
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=min(processes, len(pending)), mp_context=context,
+                                     initializer=_init_worker, initargs=(log_level,)) as pool:
+                futures = [pool.submit(export_job, job, style, out_dir) for job in pending]
+                try:
+                    for future in as_completed(futures):
+                        finish(future.result())
+                except KeyboardInterrupt:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+                finally:
+                    manifest.save()
+
+    manifest.save()
+    return [results[job["id"]] for job in jobs if job["id"] in results]
+
+
+def format_summary(results: List[Dict], duration: float, processes: int) -> str:
+    """Tabelle mit Zeiten pro Dokument plus Gesamtzeile"""
+    lines = [
+        f"{'Dokument':<40} {'Seiten':>6} {'Laden':>8} {'Bilder':>8} {'Rendern':>8} {'Gesamt':>8}  Status",
+        "-" * 92,
+    ]
+    for r in results:
+        title = r["title"] if len(r["title"]) <= 40 else r["title"][:37] + "..."
+        if r["status"] == "uebersprungen":
+            lines.append(f"{title:<40} {r['pages']:>6} {'':>8} {'':>8} {'':>8} {'':>8}  uebersprungen")
+            continue
+        lines.append(
+            f"{title:<40} {r['pages']:>6} {r['fetch_ms']:>6}ms {r['images_ms']:>6}ms "
+            f"{r['render_ms']:>6}ms {r['total_ms']:>6}ms  {r['status']}"
+        )
+    lines.append("-" * 92)
+
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("ok", "uebersprungen", "fehler")}
+    lines.append(
+        f"{len(results)} Dokumente: {counts['ok']} exportiert, {counts['uebersprungen']} uebersprungen, "
+        f"{counts['fehler']} Fehler, {sum(r['pages'] for r in results)} Seiten in {duration:.1f}s ({processes} Prozesse)"
+    )
+    rendered = [r for r in results if r["status"] != "uebersprungen"]
+    if rendered:
+        slowest = max(rendered, key=lambda r: r["total_ms"])
+        lines.append(f"Langsamstes Dokument: {slowest['title']} ({slowest['total_ms']}ms)")
+    for r in results:
+        if r["status"] == "fehler":
+            lines.append(f"Fehler {r['title']} ({r['id']}): {r.get('error')}")
+    return "\n".join(lines)
+
+
+# ===== KOMMANDOZEILE =====
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--out", required=True, help="Zielverzeichnis (enthaelt danach auch manifest.json)")
+    common.add_argument("--template", default="default", help="Vorlagen-ID aus data/templates.json (Standard: default)")
+    common.add_argument("--processes", type=int, default=EXPORT_PROCESSES,
+                        help=f"Anzahl Render-Prozesse (Standard: {EXPORT_PROCESSES}, 1 = ohne Pool)")
+    common.add_argument("--no-resume", action="store_true",
+                        help="Alles neu exportieren statt unveraenderte Dokumente zu ueberspringen")
+    common.add_argument("--log-level", default=os.getenv("CLI_LOG_LEVEL", "WARNING"))
+
+    parser = argparse.ArgumentParser(description="Outline-Dokumente ohne Server als PDF exportieren")
+    commands = parser.add_subparsers(dest="command", required=True)
+    documents = commands.add_parser("documents", parents=[common], help="Einzelne Dokumente (IDs)")
+    documents.add_argument("ids", nargs="+", metavar="DOC_ID")
+    collection = commands.add_parser("collection", parents=[common], help="Alle Dokumente einer Collection")
+    collection.add_argument("collection", metavar="ID_ODER_NAME")
+    search = commands.add_parser("search", parents=[common], help="Alle Treffer einer Suche")
+    search.add_argument("query")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    setup_logging(args.log_level, "text")
+    start = time.time()
+
+    try:
+        style = load_style(args.template)
+        client = OutlineClient()
+        if args.command == "documents":
+            jobs = collect_documents(client, args.ids)
+        elif args.command == "collection":
+            jobs = collect_collection(client, args.collection)
+        else:
+            jobs = collect_search(client, args.query)
+    except (ValueError, OSError, requests.exceptions.RequestException) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        return 2
+
+    if not jobs:
+        print("Keine Dokumente gefunden.")
+        return 0
+    print(f"{len(jobs)} Dokumente -> {args.out}")
+
+    try:
+        results = run_export(jobs, style, args.out, args.processes, not args.no_resume, args.log_level)
+    except KeyboardInterrupt:
+        print("\nAbgebrochen - erneuter Aufruf setzt den Export fort.", file=sys.stderr)
+        return 130
+
+    print()
+    print(format_summary(results, time.time() - start, max(1, min(args.processes, len(jobs)))))
+    return 1 if any(r["status"] == "fehler" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Admission Control - Begrenzte Parallelitaet pro Route mit fairer Warteschlange pro Client
+Ist eine Route ausgelastet, wird kurz gewartet (begrenzte Queue, Round-Robin ueber Clients);
+ist auch die Queue voll oder die Wartezeit abgelaufen, wird sofort mit 503 + Retry-After abgelehnt.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from starlette.background import BackgroundTask
+
+from modules.logging_setup import timed
+
+logger = logging.getLogger("outline-pdf.admission")
+
+
+class Overloaded(Exception):
+    """Anfrage abgelehnt (Route ausgelastet). retry_after in Sekunden."""
+
+    def __init__(self, route: str, retry_after: int):
+        super().__init__(f"Route '{route}' ausgelastet")
+        self.route = route
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Laeuft vollstaendig im Event-Loop (keine Locks noetig).
+    Freie Slots werden reihum an die wartenden Clients vergeben, sodass ein Client
+    mit vielen Anfragen (z.B. Batch-Export) andere nicht aushungert.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait: float = 10.0,
+                 max_queue_per_client: Optional[int] = None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_queue_per_client = max_queue_per_client or max(1, max_queue // 4)
+        self.in_flight = 0
+        self.queued = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Metriken
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_queued_seen = 0
+        self._avg_service_time = 0.5
+
+    async def acquire(self, client_id: str):
+        if self.in_flight < self.max_concurrent and not self.queued:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        client_queue = self._queues.get(client_id)
+        if self.queued >= self.max_queue or (client_queue and len(client_queue) >= self.max_queue_per_client):
+            self.rejected += 1
+            raise Overloaded(self.name, self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(client_id, deque()).append(future)
+        self.queued += 1
+        self.max_queued_seen = max(self.max_queued_seen, self.queued)
+
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # Client hat abgebrochen: Slot ggf. direkt weitergeben
+            if future.done():
+                self.release()
+            else:
+                self._dequeue(client_id, future)
+            raise
+
+        if not future.done():
+            self._dequeue(client_id, future)
+            self.timeouts += 1
+            raise Overloaded(self.name, self.retry_after())
+        self.admitted += 1
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time is not None:
+            # Gleitender Mittelwert fuer die Retry-After-Schaetzung
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+
+        # Slot direkt an den naechsten Client (Round-Robin) uebergeben
+        while self._queues:
+            client_id, client_queue = next(iter(self._queues.items()))
+            future = client_queue.popleft()
+            del self._queues[client_id]
+            if client_queue:
+                self._queues[client_id] = client_queue
+            self.queued -= 1
+            if not future.done():
+                future.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        """Geschaetzte Sekunden bis ein Slot frei wird"""
+        waves = (self.queued + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(waves * self._avg_service_time))
+
+    def _dequeue(self, client_id: str, future: asyncio.Future):
+        client_queue = self._queues.get(client_id)
+        if client_queue and future in client_queue:
+            client_queue.remove(future)
+            self.queued -= 1
+            if not client_queue:
+                del self._queues[client_id]
+
+    def metrics(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "queued_clients": len(self._queues),
+            "max_queued_seen": self.max_queued_seen,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_service_ms": round(self._avg_service_time * 1000),
+        }
+
+
+async def run_admitted(controller: AdmissionController, client_id: str, call):
+    """
+    Fuehrt await call() innerhalb eines Slots aus (Wartezeit landet als queue_ms im Request-Log).
+    Der Slot bleibt belegt, bis der Body gesendet ist: bei StreamingResponses (z.B. der NDJSON-Dokumentliste)
+    laeuft die eigentliche Arbeit erst beim Iterieren, nachdem call() schon zurueckgekehrt ist.
+    """
+    with timed("queue_ms"):
+        await controller.acquire(client_id)
+    start = time.monotonic()
+
+    async def release():
+        controller.release(time.monotonic() - start)
+
+    try:
+        response = await call()
+    except BaseException:
+        await release()
+        raise
+    return await after_body(response, release)
+
+
+async def after_body(response, callback):
+    """
+    Ruft await callback() genau einmal auf, sobald der Body der Antwort gesendet ist
+    (sofort, wenn die Antwort keinen Body-Iterator hat). Gibt die Antwort zurueck.
+    """
+    done = False
+
+    async def once():
+        nonlocal done
+        if not done:
+            done = True
+            await callback()
+
+    body_iterator = getattr(response, "body_iterator", None)
+    if body_iterator is None:
+        await once()
+        return response
+    response.body_iterator = _call_after(body_iterator, once)
+    # Fallback, falls der Body nie iteriert wird (Client vorher getrennt)
+    response.background = _chain_background(response.background, once)
+    return response
+
+
+async def _call_after(body_iterator, callback):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        await callback()
+
+
+def _chain_background(background, callback):
+    async def run():
+        try:
+            if background is not None:
+                await background()
+        finally:
+            await callback()
+    return BackgroundTask(run)
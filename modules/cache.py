@@ -0,0 +1,279 @@
+"""
+Cache - In-Memory Cache vor dem OutlineClient (Collections, Listen, Dokumente, Bilder)
+"""
+import re
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("outline-pdf.cache")
+
+# Bild-Referenzen im Markdown (![alt](url) und <img src="...">)
+IMAGE_REF_PATTERN = re.compile(r'!\[[^\]]*\]\(([^)\s]+)[^)]*\)|<img\s+[^>]*src="([^"]+)"', re.IGNORECASE)
+
+
+class TTLCache:
+    """Thread-sicherer LRU-Cache mit Ablaufzeit und optionaler Groessenbegrenzung (Bytes)"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        """Gibt den Wert zurueck oder None (fehlt / abgelaufen)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: str) -> Any:
+        """Wie get(), aber ohne Hit/Miss-Statistik und ohne LRU-Aktualisierung (fuer Hintergrund-Aufgaben)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[2]
+
+    def set(self, key: str, value: Any, size: int = 0, ttl: Optional[float] = None):
+        """Speichert value; ttl ueberschreibt die Standard-Ablaufzeit fuer diesen Eintrag"""
+        if value is None:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+
+    def update(self, key: str, fn: Callable[[Any], Any]) -> bool:
+        """Wendet fn atomar auf einen vorhandenen Eintrag an (Ablaufzeit bleibt). False wenn nicht vorhanden."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False
+            expires, size, value = entry
+            self._data[key] = (expires, size, fn(value))
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                return True
+            return False
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for k in keys:
+                self._remove(k)
+            return len(keys)
+
+    def keys(self, prefix: str = "") -> List[str]:
+        with self._lock:
+            return [k for k in self._data if k.startswith(prefix)]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, key: str):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+
+def extract_image_urls(markdown: str) -> List[str]:
+    """Alle Bild-URLs aus einem Markdown-Text (dedupliziert, Reihenfolge bleibt)"""
+    urls = []
+    for md_url, html_url in IMAGE_REF_PATTERN.findall(markdown or ""):
+        url = (md_url or html_url).strip()
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+class OutlineCache:
+    """
+    Cache vor dem OutlineClient.
+    Schluessel: "collections", "documents:all", "documents:<collection_id>", "document:<doc_id>",
+    "tree:<collection_id>", "prepared:<doc_id>:<revision>:<optionen>".
+    Bilder liegen in einem eigenen, nach Bytes begrenzten Cache (Schluessel = validierte URL).
+    Invalidierung erfolgt per Webhook (siehe modules/webhooks.py) oder nach Ablauf der TTL.
+    content_ttl gilt fuer Inhalte aus Outline (Collections, Listen, Baeume, Dokumente; 0 = nicht cachen),
+    ttl fuer Bilder und vorbereitetes Markdown (pro Revision, veraltet also nicht).
+    """
+
+    def __init__(self, client, ttl: float = 300, max_entries: int = 2000, image_max_bytes: int = 200 * 1024 * 1024,
+                 content_ttl: Optional[float] = None):
+        self.client = client
+        self.content_ttl = ttl if content_ttl is None else content_ttl
+        self.data = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.images = TTLCache(max_entries=max_entries, ttl=ttl, max_bytes=image_max_bytes)
+        self._listeners: List[Callable[[str, Optional[str]], None]] = []
+
+    # ===== LESEN =====
+
+    def get_collections(self) -> List[Dict]:
+        collections = self.data.get("collections")
+        if collections is None:
+            collections = self.client.get_collections()
+            self._store("collections", collections)
+        return collections
+
+    def get_documents(self, collection_id: Optional[str] = None) -> List[Dict]:
+        key = f"documents:{collection_id or 'all'}"
+        documents = self.data.get(key)
+        if documents is None:
+            documents = self.client.get_documents(collection_id)
+            self._store(key, documents)
+        return documents
+
+    def iter_documents(self, collection_id: Optional[str] = None) -> Iterator[List[Dict]]:
+        """
+        Dokumentliste seitenweise: aus dem Cache (eine Seite) oder direkt von Outline.
+        Beim Streamen wird die Liste bewusst nicht gesammelt, damit der Speicherbedarf
+        unabhaengig von der Workspace-Groesse bleibt.
+        """
+        documents = self.data.get(f"documents:{collection_id or 'all'}")
+        if documents is not None:
+            yield documents
+            return
+        yield from self.client.iter_document_pages(collection_id)
+
+    def get_collection_tree(self, collection_id: str) -> List[Dict]:
+        key = f"tree:{collection_id}"
+        tree = self.data.get(key)
+        if tree is None:
+            tree = self.client.get_collection_tree(collection_id)
+            self._store(key, tree)
+        return tree
+
+    def get_document(self, doc_id: str) -> Dict:
+        key = f"document:{doc_id}"
+        document = self.data.get(key)
+        if document is None:
+            document = self.client.get_document(doc_id)
+            self._store(key, document)
+        return document
+
+    def get_image(self, url: str, fetch: Callable[[str], Tuple[bytes, str]]) -> Tuple[bytes, str]:
+        """Gibt (content, content_type) zurueck, laedt bei Cache-Miss ueber fetch(url)"""
+        entry = self.images.get(url)
+        if entry is None:
+            entry = fetch(url)
+            self.images.set(url, entry, size=len(entry[0]))
+        return entry
+
+    # ===== INVALIDIERUNG =====
+
+    def add_listener(self, callback: Callable[[str, Optional[str]], None]):
+        """callback(kind, id) wird bei jeder Invalidierung aufgerufen (kind: "document" | "collection")"""
+        self._listeners.append(callback)
+
+    def invalidate_document(self, doc_id: str, image_url_mapper: Optional[Callable[[str], Optional[str]]] = None) -> Dict:
+        """Entfernt ein Dokument und seine Bilder aus dem Cache"""
+        old = self.data.get(f"document:{doc_id}")
+        removed_images = 0
+        if old and image_url_mapper:
+            for url in extract_image_urls(old.get("text", "")):
+                mapped = image_url_mapper(url)
+                if mapped and self.images.delete(mapped):
+                    removed_images += 1
+        removed = self.data.delete(f"document:{doc_id}")
+        self.data.delete_prefix(f"prepared:{doc_id}:")
+        self._notify("document", doc_id)
+        return {"document": removed, "images": removed_images}
+
+    def upsert_document(self, model: Dict) -> bool:
+        """
+        Aktualisiert ein Dokument inkrementell in allen gecachten Listen (ohne Outline neu abzufragen).
+        Entwuerfe und Vorlagen liefert documents.list nicht -> nur aus den Listen entfernen (Rueckgabe False).
+        """
+        doc_id = model.get("id")
+        if not doc_id:
+            return False
+        self.remove_document_from_lists(doc_id)
+        if not model.get("publishedAt") or model.get("template"):
+            return False
+        entry = dict(model)
+        for key in ("documents:all", f"documents:{model.get('collectionId')}"):
+            self.data.update(key, lambda docs: [entry] + docs)
+        # Vollstaendiges Modell (mit Text) direkt als frischen Eintrag uebernehmen
+        if "text" in model:
+            self._store(f"document:{doc_id}", entry)
+        return True
+
+    def invalidate_tree(self, collection_id: Optional[str] = None):
+        """Dokumentbaum einer Collection verwerfen (ohne ID: alle Baeume)"""
+        if collection_id:
+            self.data.delete(f"tree:{collection_id}")
+        else:
+            self.data.delete_prefix("tree:")
+
+    def remove_document_from_lists(self, doc_id: str):
+        for key in self.data.keys("documents:"):
+            self.data.update(key, lambda docs: [d for d in docs if d.get("id") != doc_id])
+
+    def invalidate_collection(self, collection_id: Optional[str] = None):
+        """Collections-Liste verwerfen; mit ID zusaetzlich deren Dokumentliste und Eintraege in "documents:all" """
+        self.data.delete("collections")
+        if collection_id:
+            self.data.delete(f"documents:{collection_id}")
+            self.data.delete(f"tree:{collection_id}")
+            self.data.update(
+                "documents:all",
+                lambda docs: [d for d in docs if d.get("collectionId") != collection_id],
+            )
+        self._notify("collection", collection_id)
+
+    def clear(self):
+        self.data.clear()
+        self.images.clear()
+
+    def stats(self) -> Dict:
+        return {"data": self.data.stats(), "images": self.images.stats()}
+
+    def _store(self, key: str, value: Any):
+        """Outline-Inhalte mit content_ttl speichern (0 = immer live von Outline laden)"""
+        if self.content_ttl > 0:
+            self.data.set(key, value, ttl=self.content_ttl)
+
+    def _notify(self, kind: str, item_id: Optional[str]):
+        for callback in self._listeners:
+            try:
+                callback(kind, item_id)
+            except Exception as e:
+                logger.error("Cache-Listener Fehler (%s %s): %s", kind, item_id, e, exc_info=True)
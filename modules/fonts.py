@@ -0,0 +1,235 @@
+"""
+Font Service - Schriften auf die tatsaechlich verwendeten Zeichen reduzieren (Subsetting)
+Statt kompletter Font-Dateien bekommt der Renderer nur die Glyphen, die im Dokument vorkommen.
+Subsets werden pro Schrift, Schnitt und Zeichensatz-Hash gecacht. Die Zeichensaetze selbst koennen
+zusaetzlich auf der Platte liegen (glyph_dir), damit die unveraenderlichen Subset-URLs auch nach einem
+Neustart, einer LRU-Verdraengung oder in einem anderen Worker-Prozess funktionieren.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from fontTools import subset as ft_subset
+from fontTools.ttLib import TTFont
+
+from modules.cache import TTLCache
+
+logger = logging.getLogger("outline-pdf.fonts")
+# fontTools meldet jede nicht unterstuetzte Tabelle (z.B. FFTM) als Warnung
+logging.getLogger("fontTools.subset").setLevel(logging.ERROR)
+
+# Schriftauswahl im Editor -> Font-Dateien (erste gefundene gewinnt).
+# Helvetica/Times/Courier werden durch metrisch kompatible freie Schriften ersetzt.
+FONT_FAMILIES = {
+    "Roboto": {
+        "normal": ["Roboto-Regular.ttf"],
+        "bold": ["Roboto-Medium.ttf", "Roboto-Bold.ttf"],
+        "italics": ["Roboto-Italic.ttf"],
+        "bolditalics": ["Roboto-MediumItalic.ttf", "Roboto-BoldItalic.ttf"],
+    },
+    "Helvetica": {
+        "normal": ["LiberationSans-Regular.ttf", "Arimo-Regular.ttf", "DejaVuSans.ttf"],
+        "bold": ["LiberationSans-Bold.ttf", "Arimo-Bold.ttf", "DejaVuSans-Bold.ttf"],
+        "italics": ["LiberationSans-Italic.ttf", "Arimo-Italic.ttf", "DejaVuSans-Oblique.ttf"],
+        "bolditalics": ["LiberationSans-BoldItalic.ttf", "Arimo-BoldItalic.ttf", "DejaVuSans-BoldOblique.ttf"],
+    },
+    "Times": {
+        "normal": ["LiberationSerif-Regular.ttf", "Tinos-Regular.ttf", "DejaVuSerif.ttf"],
+        "bold": ["LiberationSerif-Bold.ttf", "Tinos-Bold.ttf", "DejaVuSerif-Bold.ttf"],
+        "italics": ["LiberationSerif-Italic.ttf", "Tinos-Italic.ttf", "DejaVuSerif-Italic.ttf"],
+        "bolditalics": ["LiberationSerif-BoldItalic.ttf", "Tinos-BoldItalic.ttf", "DejaVuSerif-BoldItalic.ttf"],
+    },
+    "Courier": {
+        "normal": ["LiberationMono-Regular.ttf", "Cousine-Regular.ttf", "DejaVuSansMono.ttf"],
+        "bold": ["LiberationMono-Bold.ttf", "Cousine-Bold.ttf", "DejaVuSansMono-Bold.ttf"],
+        "italics": ["LiberationMono-Italic.ttf", "Cousine-Italic.ttf", "DejaVuSansMono-Oblique.ttf"],
+        "bolditalics": ["LiberationMono-BoldItalic.ttf", "Cousine-BoldItalic.ttf", "DejaVuSansMono-BoldOblique.ttf"],
+    },
+}
+
+FONT_STYLES = ("normal", "bold", "italics", "bolditalics")
+
+# Immer enthalten: ASCII, deutsche Sonderzeichen, typografische Zeichen, die der Renderer
+# selbst erzeugt (Kopf-/Fusszeilen, Seitenzahlen, Aufzaehlungszeichen), sowie die Ausgabe von
+# markdown-it (Typographer: (c) (r) (tm) +- ... -- und Anfuehrungszeichen; haeufige HTML-Entities),
+# falls ein Client das Subset aus dem Markdown statt aus dem gerenderten Text anfordert
+BASE_CHARACTERS = (
+    "".join(chr(c) for c in range(0x20, 0x7F))
+    + "ÄÖÜäöüß€\u00a0·•–—…"
+    + "„“”‚‘’«»‹›©®™±°§¶†‡′″"
+    + "×÷½¼¾¹²³µ¢£¥¬¦¡¿"
+    + "←↑→↓↔⇐⇒⇔≤≥≠≈∞−✓✗"
+)
+
+# Bekannte Zeichensaetze (Hash -> Zeichen), damit Subsets bei Bedarf neu erzeugt werden koennen
+MAX_GLYPH_SETS = 1000
+# Zeichensaetze auf der Platte (aelteste werden beim Aufraeumen geloescht)
+MAX_GLYPH_FILES = 20000
+GLYPH_HASH_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+
+
+def glyph_hash_for(chars: str) -> str:
+    return hashlib.sha256(chars.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+
+
+class FontService:
+    def __init__(self, font_dirs: List[str], max_bytes: int = 50 * 1024 * 1024, ttl: float = 7 * 24 * 3600,
+                 glyph_dir: Optional[str] = None):
+        self.font_dirs = font_dirs
+        self.glyph_dir = glyph_dir
+        self._glyph_writes = 0
+        self.subsets = TTLCache(max_entries=2000, ttl=ttl, max_bytes=max_bytes)
+        self._glyph_sets: "OrderedDict[str, str]" = OrderedDict()
+        self._files: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    # ===== FONT-DATEIEN =====
+
+    def _file_index(self) -> Dict[str, str]:
+        """Dateiname -> Pfad aller .ttf/.otf in den Font-Verzeichnissen (einmalig aufgebaut)"""
+        if self._files is None:
+            files = {}
+            for font_dir in self.font_dirs:
+                for root, _, names in os.walk(font_dir):
+                    for name in names:
+                        if name.lower().endswith((".ttf", ".otf")):
+                            files.setdefault(name, os.path.join(root, name))
+            self._files = files
+            logger.info("Font-Index: %d Dateien in %s", len(files), ", ".join(self.font_dirs))
+        return self._files
+
+    def font_path(self, family: str, style: str) -> Optional[str]:
+        files = self._file_index()
+        for candidate in FONT_FAMILIES.get(family, {}).get(style, []):
+            if candidate in files:
+                return files[candidate]
+        return None
+
+    def available_styles(self, family: str) -> List[str]:
+        return [style for style in FONT_STYLES if self.font_path(family, style)]
+
+    def families(self) -> Dict[str, List[str]]:
+        """Verfuegbare Schriften mit ihren Schnitten"""
+        return {family: self.available_styles(family) for family in FONT_FAMILIES}
+
+    # ===== ZEICHENSAETZE =====
+
+    def register_glyphs(self, text: str) -> str:
+        """Zeichensatz (Text + Basiszeichen) registrieren, gibt dessen Hash zurueck"""
+        chars = "".join(sorted(set(text + BASE_CHARACTERS) - {"\n", "\r", "\t"}))
+        glyph_hash = glyph_hash_for(chars)
+        self._remember(glyph_hash, chars)
+        if self.glyph_dir:
+            self._save_glyphs(glyph_hash, chars)
+        return glyph_hash
+
+    def glyphs(self, glyph_hash: str) -> Optional[str]:
+        with self._lock:
+            chars = self._glyph_sets.get(glyph_hash)
+        if chars is None and self.glyph_dir:
+            chars = self._load_glyphs(glyph_hash)
+            if chars is not None:
+                self._remember(glyph_hash, chars)
+        return chars
+
+    def _remember(self, glyph_hash: str, chars: str):
+        with self._lock:
+            self._glyph_sets[glyph_hash] = chars
+            self._glyph_sets.move_to_end(glyph_hash)
+            while len(self._glyph_sets) > MAX_GLYPH_SETS:
+                self._glyph_sets.popitem(last=False)
+
+    def _glyph_path(self, glyph_hash: str) -> str:
+        return os.path.join(self.glyph_dir, f"{glyph_hash}.txt")
+
+    def _save_glyphs(self, glyph_hash: str, chars: str):
+        path = self._glyph_path(glyph_hash)
+        try:
+            if os.path.exists(path):
+                return
+            os.makedirs(self.glyph_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", errors="surrogatepass") as f:
+                f.write(chars)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Zeichensatz %s nicht speicherbar: %s", glyph_hash, e)
+            return
+        self._glyph_writes += 1
+        if self._glyph_writes % 100 == 0:
+            self._prune_glyph_files()
+
+    def _load_glyphs(self, glyph_hash: str) -> Optional[str]:
+        if not GLYPH_HASH_PATTERN.match(glyph_hash):
+            return None
+        try:
+            with open(self._glyph_path(glyph_hash), "r", encoding="utf-8", errors="surrogatepass") as f:
+                chars = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Zeichensatz %s nicht lesbar: %s", glyph_hash, e)
+            return None
+        # Datei muss zum Hash passen (sonst wuerde ein falsches Subset dauerhaft gecacht)
+        return chars if glyph_hash_for(chars) == glyph_hash else None
+
+    def _prune_glyph_files(self):
+        """Aelteste Zeichensatz-Dateien loeschen, sobald mehr als MAX_GLYPH_FILES vorhanden sind"""
+        try:
+            paths = [os.path.join(self.glyph_dir, name) for name in os.listdir(self.glyph_dir) if name.endswith(".txt")]
+            if len(paths) <= MAX_GLYPH_FILES:
+                return
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:len(paths) - MAX_GLYPH_FILES]:
+                os.remove(path)
+        except OSError as e:
+            logger.warning("Zeichensaetze nicht aufraeumbar: %s", e)
+
+    # ===== SUBSETTING =====
+
+    def subset(self, family: str, style: str, glyph_hash: str) -> Optional[bytes]:
+        """Subset-TTF fuer Schrift/Schnitt/Zeichensatz (None, wenn Schrift oder Zeichensatz unbekannt)"""
+        key = f"{family}:{style}:{glyph_hash}"
+        data = self.subsets.get(key)
+        if data is not None:
+            return data
+
+        path = self.font_path(family, style)
+        chars = self.glyphs(glyph_hash)
+        if path is None or chars is None:
+            return None
+
+        data = subset_font(path, chars)
+        self.subsets.set(key, data, size=len(data))
+        logger.info("Font-Subset %s: %d Zeichen, %d KB (Original %d KB)",
+                    key, len(chars), len(data) // 1024, os.path.getsize(path) // 1024)
+        return data
+
+    def stats(self) -> Dict:
+        return {"subsets": self.subsets.stats(), "glyph_sets": len(self._glyph_sets)}
+
+
+def subset_font(path: str, chars: str) -> bytes:
+    """Reduziert eine Font-Datei auf die angegebenen Zeichen (Kerning und Ligaturen bleiben erhalten)"""
+    options = ft_subset.Options()
+    options.layout_features = ["kern", "liga", "calt", "ccmp", "locl", "mark", "mkmk"]
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    options.hinting = False
+    options.desubroutinize = True
+
+    font = TTFont(path)
+    try:
+        subsetter = ft_subset.Subsetter(options)
+        subsetter.populate(text=chars)
+        subsetter.subset(font)
+        out = io.BytesIO()
+        font.save(out)
+        return out.getvalue()
+    finally:
+        font.close()
@@ -0,0 +1,160 @@
+"""
+Logging Setup - Nicht-blockierende, strukturierte Logs
+Log-Aufrufe legen den Record nur in eine Queue; ein Hintergrund-Thread formatiert
+(JSON oder Text) und schreibt. Jeder Record traegt die Request-ID des laufenden Requests.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO, Tuple
+
+# Kontext des laufenden Requests: {"request_id": str, "timings": {name: ms}}
+request_context: ContextVar[Optional[Dict]] = ContextVar("request_context", default=None)
+
+# Standard-Attribute eines LogRecords (alles andere stammt aus extra=... und wird mitgeschrieben)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+# ===== REQUEST-KONTEXT =====
+
+def start_request(request_id: str) -> Dict:
+    ctx = {"request_id": request_id, "timings": {}}
+    request_context.set(ctx)
+    return ctx
+
+
+def current_request_id() -> Optional[str]:
+    ctx = request_context.get()
+    return ctx["request_id"] if ctx else None
+
+
+def add_timing(name: str, ms: float):
+    """Addiert eine Teilzeit (z.B. Outline-API, Warteschlange) zum laufenden Request"""
+    ctx = request_context.get()
+    if ctx is not None:
+        ctx["timings"][name] = round(ctx["timings"].get(name, 0) + ms, 1)
+
+
+class timed:
+    """Kontextmanager: misst die Dauer des Blocks und addiert sie mit add_timing()"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_timing(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+# ===== FORMATTER =====
+
+class JsonFormatter(logging.Formatter):
+    """Eine JSON-Zeile pro Record; Felder aus extra=... werden uebernommen"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Bisheriges Textformat, ergaenzt um die Request-ID"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s [%(levelname)s] %(name)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{line} [req={request_id}]" if request_id else line
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Laeuft im aufrufenden Thread: haengt die Request-ID an und loest Nachricht und
+    Traceback auf (der Request-Kontext existiert im Writer-Thread nicht mehr).
+    Die eigentliche Formatierung und das Schreiben uebernimmt der QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = current_request_id()
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+# ===== PIPELINE =====
+
+def build_pipeline(stream: TextIO = None, fmt: str = "json") -> Tuple[QueueHandler, QueueListener]:
+    """QueueHandler (fuer Logger) + gestarteter QueueListener mit Stream-Writer"""
+    log_queue = queue.SimpleQueue()
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    listener = QueueListener(log_queue, writer, respect_handler_level=True)
+    listener.start()
+    return ContextQueueHandler(log_queue), listener
+
+
+def setup_logging(level: str = "INFO", fmt: str = "json", stream: TextIO = None):
+    """Ersetzt die Root-Handler durch die Queue-Pipeline (mehrfacher Aufruf ist unschaedlich)"""
+    global _listener
+    if _listener is not None:
+        return
+    handler, _listener = build_pipeline(stream, fmt)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    # Beim Beenden restliche Records noch schreiben
+    atexit.register(_listener.stop)
+
+
+# ===== SAMPLING VON REQUEST-LOGS =====
+
+class RequestLogSampler:
+    """
+    Erfolgreiche, schnelle Requests werden nur mit sample_rate geloggt;
+    fehlgeschlagene (Status >= 400) und langsame (>= slow_ms) immer.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, slow_ms: float = 1000):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    def level_for(self, status_code: int, duration_ms: float) -> Optional[int]:
+        """Log-Level fuer den Request oder None (nicht loggen)"""
+        if status_code >= 500:
+            return logging.ERROR
+        if status_code >= 400 or duration_ms >= self.slow_ms:
+            return logging.WARNING
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            return logging.INFO
+        return None
@@ -0,0 +1,143 @@
+"""
+Markdown Pipeline - Serverseitige Vorverarbeitung von Outline-Markdown
+Entspricht normalizeMarkdown(), rewriteImageUrls() und addSectionNumbers() aus dem Editor,
+liefert zusaetzlich die Ueberschriften-Gliederung und ein Bild-Manifest.
+"""
+import io
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote
+
+from PIL import Image
+
+from modules.cache import extract_image_urls
+
+logger = logging.getLogger("outline-pdf.markdown")
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+MD_IMAGE_PATTERN = re.compile(r"!\[([^\]]*)\]\(([^)]+)\)")
+HTML_IMAGE_PATTERN = re.compile(r'<img\s+[^>]*src="([^"]+)"([^>]*)>', re.IGNORECASE)
+
+# Parallele Bild-Abfragen fuer das Manifest
+IMAGE_FETCH_WORKERS = 4
+
+
+def normalize_markdown(md: str) -> str:
+    """Bereinigt Outline-Markdown (Steuerzeichen, eingerueckte Ueberschriften, div-Tags)"""
+    md = md.replace("\\n", " ")
+    md = md.replace("\u00a0", " ").replace("\u200b", "").replace("\ufeff", "")
+    md = re.sub(r"^[ \t]+(?=#+\s)", "", md, flags=re.MULTILINE)
+    md = re.sub(r"([^\n])\n(#+\s)", r"\1\n\n\2", md)
+    md = re.sub(r"</?div[^>]*>", "", md, flags=re.IGNORECASE)
+    return md
+
+
+def proxy_url(url: str) -> str:
+    """URL ueber den Image-Proxy (wie encodeURIComponent im Browser)"""
+    return "/api/image-proxy?url=" + quote(url, safe="-_.!~*'()")
+
+
+def _is_proxyable(url: str) -> bool:
+    return url.startswith("http://") or url.startswith("https://") or url.startswith("/")
+
+
+def rewrite_image_urls(md: str) -> str:
+    def replace_md(match):
+        alt, url = match.group(1), match.group(2).strip().split()[0]
+        if _is_proxyable(url):
+            return f"![{alt}]({proxy_url(url)})"
+        return match.group(0)
+
+    def replace_html(match):
+        url, rest = match.group(1), match.group(2)
+        if url.startswith("/") or url.startswith("http"):
+            return f'<img src="{proxy_url(url)}"{rest}>'
+        return match.group(0)
+
+    md = MD_IMAGE_PATTERN.sub(replace_md, md)
+    return HTML_IMAGE_PATTERN.sub(replace_html, md)
+
+
+def add_section_numbers(md: str) -> str:
+    counters = [0] * 6
+    lines = []
+    for line in md.split("\n"):
+        match = HEADING_PATTERN.match(line)
+        if match:
+            level = len(match.group(1))
+            counters[level - 1] += 1
+            counters[level:] = [0] * (6 - level)
+            number = ".".join(str(c) for c in counters[:level])
+            line = f"{match.group(1)} {number} {match.group(2)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def extract_outline(md: str) -> List[Dict]:
+    """Ueberschriften als flache Liste [{level, title}]"""
+    outline = []
+    for line in md.split("\n"):
+        match = HEADING_PATTERN.match(line)
+        if match:
+            outline.append({"level": len(match.group(1)), "title": match.group(2).strip()})
+    return outline
+
+
+def image_info(content: bytes, content_type: str) -> Dict:
+    """Groesse in Bytes und (falls lesbar) Pixelmasse eines Bildes"""
+    info = {"bytes": len(content), "content_type": content_type, "width": None, "height": None}
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            info["width"], info["height"] = img.size
+    except Exception:
+        pass
+    return info
+
+
+def build_image_manifest(md: str, describe_image: Optional[Callable[[str], Optional[Dict]]] = None) -> List[Dict]:
+    """
+    Deduplizierte Bildliste; describe_image(url) liefert die Angaben zu einem Bild
+    (bytes, content_type, width, height) oder None, wenn es nicht ladbar ist. Aufrufe laufen parallel.
+    """
+    urls = [u for u in extract_image_urls(md) if _is_proxyable(u)]
+    manifest = [{"url": u, "proxy_url": proxy_url(u)} for u in urls]
+    if not describe_image or not manifest:
+        return manifest
+
+    with ThreadPoolExecutor(max_workers=IMAGE_FETCH_WORKERS) as pool:
+        results = list(pool.map(describe_image, urls))
+    for entry, info in zip(manifest, results):
+        if info:
+            entry.update(info)
+        else:
+            entry["error"] = True
+    return manifest
+
+
+def prepare_document(document: Dict, numbering: bool = True,
+                     describe_image: Optional[Callable[[str], Optional[Dict]]] = None) -> Dict:
+    """
+    Komplette Vorverarbeitung fuer den PDF-Renderer im Browser:
+    normalisiertes Markdown (Bild-URLs ueber den Proxy, optional nummeriert),
+    Gliederung und Bild-Manifest.
+    """
+    md = normalize_markdown(document.get("text") or "")
+    images = build_image_manifest(md, describe_image)
+    if numbering:
+        md = add_section_numbers(md)
+    return {
+        "id": document.get("id"),
+        "title": document.get("title"),
+        "revision": document_revision(document),
+        "updatedAt": document.get("updatedAt"),
+        "markdown": rewrite_image_urls(md),
+        "outline": extract_outline(md),
+        "images": images,
+    }
+
+
+def document_revision(document: Dict) -> str:
+    """Revisions-Kennung eines Dokuments (Outline: revision bzw. updatedAt)"""
+    return str(document.get("revision") or document.get("updatedAt") or "")
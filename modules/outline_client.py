@@ -4,9 +4,11 @@ Outline API Client - Wrapper fuer Outline API Calls
 import os
 import logging
 import requests
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional
 from dotenv import load_dotenv
 
+from modules.logging_setup import timed
+
 load_dotenv()
 
 logger = logging.getLogger("outline-pdf.client")
@@ -25,22 +27,40 @@ class OutlineClient:
             "Content-Type": "application/json",
         }
 
-        logger.info(f"OutlineClient initialisiert: {self.base_url}")
+        logger.info("OutlineClient initialisiert: %s", self.base_url)
+
+    def _post(self, url: str, payload: Dict) -> requests.Response:
+        """POST gegen die Outline API; die Dauer landet als outline_ms im Request-Log"""
+        with timed("outline_ms"):
+            resp = requests.post(url, headers=self.headers, json=payload, timeout=10)
+        resp.raise_for_status()
+        return resp
 
     def get_collections(self) -> List[Dict]:
         """Hole alle Collections (Bereiche) aus Outline"""
         url = f"{self.base_url}/api/collections.list"
 
         try:
-            logger.debug(f"API Request: POST {url}")
-            resp = requests.post(url, headers=self.headers, json={}, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
+            logger.debug("API Request: POST %s", url)
+            data = self._post(url, {}).json()
             collections = data.get("data", [])
-            logger.info(f"Collections geladen: {len(collections)} Stueck")
+            logger.info("Collections geladen: %d Stueck", len(collections))
             return collections
         except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Laden der Collections: {e}")
+            logger.error("Fehler beim Laden der Collections: %s", e)
+            raise
+
+    def get_collection_tree(self, collection_id: str) -> List[Dict]:
+        """Hole den Dokumentbaum einer Collection (Reihenfolge wie in der Outline-Seitenleiste)"""
+        url = f"{self.base_url}/api/collections.documents"
+
+        try:
+            logger.debug("API Request: POST %s (id=%s)", url, collection_id)
+            tree = self._post(url, {"id": collection_id}).json().get("data", [])
+            logger.info("Dokumentbaum geladen: %d Wurzel-Dokumente (collection=%s)", len(tree), collection_id)
+            return tree
+        except requests.exceptions.RequestException as e:
+            logger.error("Fehler beim Laden des Dokumentbaums %s: %s", collection_id, e)
             raise
 
     def get_documents(self, collection_id: Optional[str] = None) -> List[Dict]:
@@ -48,8 +68,15 @@ class OutlineClient:
         Hole ALLE Dokumente aus Outline (mit Pagination).
         Die Outline API gibt max. 25 Dokumente pro Request zurueck.
         """
-        url = f"{self.base_url}/api/documents.list"
         all_docs = []
+        for docs in self.iter_document_pages(collection_id):
+            all_docs.extend(docs)
+        logger.info("Alle Dokumente geladen: %d (collection=%s)", len(all_docs), collection_id)
+        return all_docs
+
+    def iter_document_pages(self, collection_id: Optional[str] = None) -> Iterator[List[Dict]]:
+        """Liefert die Dokumente seitenweise, sobald die jeweilige Seite von Outline eintrifft"""
+        url = f"{self.base_url}/api/documents.list"
         offset = 0
         limit = 25
 
@@ -59,24 +86,19 @@ class OutlineClient:
                 if collection_id:
                     payload["collectionId"] = collection_id
 
-                logger.debug(f"API Request: POST {url} (offset={offset})")
-                resp = requests.post(url, headers=self.headers, json=payload, timeout=10)
-                resp.raise_for_status()
-                data = resp.json()
+                logger.debug("API Request: POST %s (offset=%d)", url, offset)
+                data = self._post(url, payload).json()
 
                 docs = data.get("data", [])
-                all_docs.extend(docs)
-                logger.debug(f"Seite geladen: {len(docs)} Dokumente (gesamt: {len(all_docs)})")
+                logger.debug("Seite geladen: %d Dokumente (offset: %d)", len(docs), offset)
+                yield docs
 
                 if len(docs) < limit:
                     break
 
                 offset += limit
-
-            logger.info(f"Alle Dokumente geladen: {len(all_docs)} (collection={collection_id})")
-            return all_docs
         except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Laden der Dokumente: {e}")
+            logger.error("Fehler beim Laden der Dokumente: %s", e)
             raise
 
     def get_document(self, doc_id: str) -> Dict:
@@ -84,14 +106,31 @@ class OutlineClient:
         url = f"{self.base_url}/api/documents.info"
 
         try:
-            logger.debug(f"API Request: POST {url} (id={doc_id})")
-            resp = requests.post(url, headers=self.headers, json={"id": doc_id}, timeout=10)
-            resp.raise_for_status()
-            doc = resp.json()["data"]
-            logger.info(f"Dokument geladen: '{doc.get('title', 'Unbekannt')}' ({doc_id})")
+            logger.debug("API Request: POST %s (id=%s)", url, doc_id)
+            doc = self._post(url, {"id": doc_id}).json()["data"]
+            logger.info("Dokument geladen: '%s' (%s)", doc.get("title", "Unbekannt"), doc_id)
             return doc
         except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler beim Laden des Dokuments {doc_id}: {e}")
+            logger.error("Fehler beim Laden des Dokuments %s: %s", doc_id, e)
+            raise
+
+    def iter_search_pages(self, query: str, limit: int = 25) -> Iterator[List[Dict]]:
+        """Alle Suchtreffer seitenweise (documents.search liefert ohne offset nur die erste Seite)"""
+        url = f"{self.base_url}/api/documents.search"
+        offset = 0
+
+        try:
+            while True:
+                logger.debug("API Suche: '%s' (offset=%d)", query, offset)
+                results = self._post(url, {"query": query, "offset": offset, "limit": limit}).json().get("data", [])
+                yield results
+
+                if len(results) < limit:
+                    break
+
+                offset += limit
+        except requests.exceptions.RequestException as e:
+            logger.error("Fehler bei der Suche: %s", e)
             raise
 
     def search_documents(self, query: str) -> List[Dict]:
@@ -99,12 +138,10 @@ class OutlineClient:
         url = f"{self.base_url}/api/documents.search"
 
         try:
-            logger.debug(f"API Suche: '{query}'")
-            resp = requests.post(url, headers=self.headers, json={"query": query}, timeout=10)
-            resp.raise_for_status()
-            results = resp.json().get("data", [])
-            logger.info(f"Suche '{query}': {len(results)} Treffer")
+            logger.debug("API Suche: '%s'", query)
+            results = self._post(url, {"query": query}).json().get("data", [])
+            logger.info("Suche '%s': %d Treffer", query, len(results))
             return results
         except requests.exceptions.RequestException as e:
-            logger.error(f"Fehler bei der Suche: {e}")
+            logger.error("Fehler bei der Suche: %s", e)
             raise
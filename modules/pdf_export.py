@@ -0,0 +1,759 @@
+"""
+PDF Export - Serverseitiges Rendern von Outline-Dokumenten mit fpdf2
+Eine ganze Collection wird in Outline-Baumreihenfolge zu einem PDF mit gemeinsamem
+Inhaltsverzeichnis und durchgehender Seitennummerierung zusammengefuegt.
+Die Dokumente liegen dabei als einzelne Dateien auf der Platte und werden nacheinander
+direkt in die Ausgabedatei geschrieben, im Speicher ist immer nur eines.
+Mit einem Export-Verzeichnis werden die gerenderten Dokumente samt Manifest aufbewahrt,
+ein erneuter Export rendert nur geaenderte Dokumente neu.
+"""
+import gc
+import hashlib
+import io
+import json
+import os
+import re
+import logging
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from fpdf import FPDF
+from fpdf.enums import TextEmphasis
+from fpdf.fonts import FontFace, TextStyle
+from markdown_it import MarkdownIt
+from PIL import Image
+import pypdf
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject, IndirectObject, NameObject,
+    NumberObject, StreamObject, TextStringObject,
+)
+
+from modules.markdown_pipeline import normalize_markdown
+
+logger = logging.getLogger("outline-pdf.export")
+
+# Editor-Schriftarten -> fpdf2 Core-Fonts (nur Latin-1, Ersatz wenn keine TTF-Datei gefunden wird)
+CORE_FONTS = {
+    "Roboto": "helvetica",
+    "Helvetica": "helvetica",
+    "Times": "times",
+    "Courier": "courier",
+}
+
+# Schnitte des Font-Service -> fpdf2-Stilcodes
+FONT_STYLE_CODES = {"normal": "", "bold": "B", "italics": "I", "bolditalics": "BI"}
+
+# Ueberschriften wie im Editor (Standardgroessen)
+HEADING_SIZES = {"h1": 22, "h2": 18, "h3": 15, "h4": 13, "h5": 12, "h6": 11}
+
+# Core-Fonts koennen nur Latin-1: typografische Zeichen ersetzen, Rest wird zu "?"
+LATIN1_REPLACEMENTS = str.maketrans({
+    "\u201e": '"', "\u201c": '"', "\u201d": '"', "\u201a": "'", "\u2018": "'", "\u2019": "'",
+    "\u2013": "-", "\u2014": "-", "\u2026": "...", "\u2022": "-", "\u2192": "->", "\u2190": "<-",
+    "\u00a0": " ", "\u200b": "", "\ufeff": "",
+})
+# Unsichtbare Zeichen, fuer die auch Unicode-Fonts meist keine Glyphe haben
+INVISIBLE_CHARS = str.maketrans({"\u200b": "", "\ufeff": ""})
+
+IMG_TAG_PATTERN = re.compile(r'<img\s+[^>]*src="([^"]+)"[^>]*>', re.IGNORECASE)
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89  # A4 in pt
+FOOTER_FONT_SIZE = 8
+
+# Bei Aenderungen am Dokument-Rendering erhoehen, damit gespeicherte Exporte neu gerendert werden
+RENDER_VERSION = 1
+
+_markdown = MarkdownIt("commonmark", {"html": True, "typographer": True}).enable(
+    ["table", "strikethrough", "replacements", "smartquotes"]
+)
+# mdurl baut seine Encode-Tabellen beim ersten Link auf, nicht thread-sicher -> vorab einmal rendern
+_markdown.render("[a](/b) ![c](/d)")
+
+
+def pdf_style(template: Dict, font_service=None) -> Dict:
+    """
+    Vorlage aus data/templates.json -> Render-Optionen.
+    Mit font_service (modules/fonts.py) werden die TTF-Dateien der Schrift eingebettet, sodass
+    alle Unicode-Zeichen erhalten bleiben; ohne gefundene Datei bleibt es beim Latin-1 Core-Font.
+    """
+    family = template.get("font", "Roboto")
+    style = {
+        "font": CORE_FONTS.get(family, "helvetica"),
+        "fontsize": float(template.get("fontsize", 11)),
+        "margin": float(template.get("margin", 70.9)),
+    }
+    if font_service is None:
+        return style
+    # Roboto ist nicht ueberall installiert -> metrisch aehnliche Helvetica-Ersatzschrift
+    files = _font_files(font_service, family) or _font_files(font_service, "Helvetica")
+    if not files:
+        logger.warning("Keine TTF-Datei fuer %s gefunden, Export nur mit Latin-1 Zeichen", family)
+        return style
+    style["font"] = "tt-text"
+    style["font_files"] = files
+    mono_files = _font_files(font_service, "Courier")
+    if mono_files:
+        style["mono_font_files"] = mono_files
+    return style
+
+
+def _font_files(font_service, family: str) -> Optional[Dict[str, str]]:
+    """fpdf2-Stilcode -> TTF-Pfad; fehlende Schnitte verwenden den normalen Schnitt"""
+    normal = font_service.font_path(family, "normal")
+    if not normal:
+        return None
+    return {code: font_service.font_path(family, name) or normal for name, code in FONT_STYLE_CODES.items()}
+
+
+def flatten_tree(nodes: List[Dict], depth: int = 0) -> List[Dict]:
+    """Dokumentbaum -> flache Liste in Seitenleisten-Reihenfolge (Tiefensuche)"""
+    entries = []
+    for node in nodes:
+        entries.append({"id": node["id"], "title": node.get("title") or "Ohne Titel", "depth": depth})
+        entries.extend(flatten_tree(node.get("children") or [], depth + 1))
+    return entries
+
+
+def to_latin1(text: str) -> str:
+    return text.translate(LATIN1_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+
+def pdf_text(style: Dict, text: str) -> str:
+    """Text fuer fpdf2: mit eingebetteter TTF-Schrift unveraendert, mit Core-Font auf Latin-1 reduziert"""
+    if style.get("font_files"):
+        return text.translate(INVISIBLE_CHARS)
+    return to_latin1(text)
+
+
+def _fit_text(pdf: FPDF, style: Dict, text: str, width: float) -> str:
+    """Kuerzt text mit "..." so, dass er in width passt"""
+    text = pdf_text(style, text)
+    if pdf.get_string_width(text) <= width:
+        return text
+    while text and pdf.get_string_width(text + "...") > width:
+        text = text[:-1]
+    return text + "..."
+
+
+class _TTFPDF(FPDF):
+    """
+    FPDF, das die TTF-Schriften der Vorlage erst beim ersten set_font() laedt.
+    add_font() liest die komplette Font-Datei ein, die meisten Dokumente brauchen nur 2-3 der 8 Schnitte.
+    """
+
+    def __init__(self, font_files: Dict[str, Dict[str, str]], **kwargs):
+        super().__init__(**kwargs)
+        self._font_files = font_files
+
+    def set_font(self, family=None, style="", size=0):
+        files = self._font_files.get(family)
+        if files:
+            code = TextEmphasis.coerce(style or "").style.replace("U", "")
+            if f"{family}{code}" not in self.fonts:
+                self.add_font(family, code, files[code])
+        super().set_font(family, style, size)
+
+
+def _create_fpdf(style: Dict) -> FPDF:
+    """FPDF mit den TTF-Schriften der Vorlage (falls vorhanden)"""
+    font_files = {family: style[key] for family, key in (("tt-text", "font_files"), ("tt-mono", "mono_font_files"))
+                  if style.get(key)}
+    if font_files:
+        return _TTFPDF(font_files, unit="pt", format="A4")
+    return FPDF(unit="pt", format="A4")
+
+
+def _new_pdf(style: Dict) -> FPDF:
+    pdf = _create_fpdf(style)
+    pdf.set_margins(style["margin"], style["margin"], style["margin"])
+    # Unten Platz fuer die Fusszeile lassen (wie im Editor: Rand + 20pt)
+    pdf.set_auto_page_break(True, style["margin"] + 20)
+    return pdf
+
+
+def _embed_images(html: str, epw: float, load_image: Optional[Callable[[str], Optional[bytes]]]):
+    """Laedt alle Bilder vorab, begrenzt ihre Breite auf die Seitenbreite und gibt (html, image_map) zurueck"""
+    images = {}
+
+    def replace(match):
+        src = match.group(1)
+        data = load_image(src) if load_image else None
+        if not data:
+            return "<p><i>[Bild konnte nicht geladen werden]</i></p>"
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                width, height = img.size
+        except Exception:
+            return "<p><i>[Bild konnte nicht geladen werden]</i></p>"
+        scale = min(1.0, epw / width, 600 / height)
+        key = f"img{len(images)}"
+        images[key] = data
+        return f'<img src="{key}" width="{int(width * scale)}" height="{int(height * scale)}">'
+
+    html = IMG_TAG_PATTERN.sub(replace, html)
+    return html, lambda key: io.BytesIO(images[key])
+
+
+def render_document_body(document: Dict, title: str, style: Dict, path: str,
+                         load_image: Optional[Callable[[str], Optional[bytes]]] = None) -> int:
+    """Rendert ein Dokument (Titel + Inhalt, ohne Fusszeile) nach path. Gibt die Seitenzahl zurueck."""
+    pdf = _new_pdf(style)
+    pdf.add_page()
+
+    pdf.set_font(style["font"], style="B", size=HEADING_SIZES["h1"] + 4)
+    pdf.multi_cell(0, (HEADING_SIZES["h1"] + 4) * 1.3, pdf_text(style, title), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(style["fontsize"])
+    pdf.set_font(style["font"], size=style["fontsize"])
+
+    html = _markdown.render(normalize_markdown(document.get("text") or ""))
+    html, image_map = _embed_images(html, pdf.epw, load_image)
+    tag_styles = {
+        tag: TextStyle(font_style="B", font_size_pt=size, color="#000000", t_margin=size * 0.6, b_margin=size * 0.3)
+        for tag, size in HEADING_SIZES.items()
+    }
+    if style.get("font_files"):
+        # Code-Bloecke sonst im Core-Font Courier (nur Latin-1)
+        mono = "tt-mono" if style.get("mono_font_files") else style["font"]
+        tag_styles["code"] = FontFace(family=mono)
+        tag_styles["pre"] = TextStyle(t_margin=4 + 7 / 30, font_family=mono)
+    pdf.write_html(
+        pdf_text(style, html),
+        image_map=image_map,
+        font_family=style["font"],
+        tag_styles=tag_styles,
+        ul_bullet_char="\u2022" if style.get("font_files") else "-",
+        li_prefix_color="#000000",
+        warn_on_tags_not_matching=False,
+    )
+    pdf.output(path)
+    return pdf.pages_count
+
+
+def _render_error_body(title: str, style: Dict, path: str) -> int:
+    pdf = _new_pdf(style)
+    pdf.add_page()
+    pdf.set_font(style["font"], style="B", size=HEADING_SIZES["h1"] + 4)
+    pdf.multi_cell(0, (HEADING_SIZES["h1"] + 4) * 1.3, pdf_text(style, title), new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font(style["font"], style="I", size=style["fontsize"])
+    pdf.multi_cell(0, style["fontsize"] * 1.4, "[Dokument konnte nicht exportiert werden]", new_x="LMARGIN", new_y="NEXT")
+    pdf.output(path)
+    return pdf.pages_count
+
+
+def render_front_matter(title: str, entries: List[Dict], page_numbers: List[int], style: Dict):
+    """
+    Titelseite + Inhaltsverzeichnis. Das Layout haengt nicht von den Seitenzahlen ab,
+    daher liefert ein Durchlauf mit Platzhaltern bereits die endgueltige Seitenanzahl.
+    Gibt (FPDF, links) zurueck, links = [(seite, rect, eintrag_index)] in PDF-Koordinaten.
+    """
+    pdf = _new_pdf(style)
+    font, size = style["font"], style["fontsize"]
+
+    pdf.add_page()
+    pdf.set_y(170)
+    pdf.set_font(font, style="B", size=26)
+    pdf.multi_cell(0, 34, pdf_text(style, title), align="C", new_x="LMARGIN", new_y="NEXT")
+
+    pdf.add_page()
+    pdf.set_font(font, style="B", size=20)
+    pdf.cell(0, 30, "Inhaltsverzeichnis", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(10)
+
+    links = []
+    number_width = 40
+    line_height = size * 1.5
+    for index, (entry, number) in enumerate(zip(entries, page_numbers)):
+        indent = entry["depth"] * 15
+        pdf.set_font(font, style="B" if entry["depth"] == 0 else "", size=size)
+        if pdf.will_page_break(line_height):
+            pdf.add_page()
+        top = pdf.get_y()
+        pdf.set_x(pdf.l_margin + indent)
+        title_width = pdf.epw - indent - number_width
+        pdf.cell(title_width, line_height, _fit_text(pdf, style, entry["title"], title_width - 5), new_x="RIGHT", new_y="TOP")
+        pdf.cell(number_width, line_height, str(number), align="R", new_x="LMARGIN", new_y="NEXT")
+        rect = (pdf.l_margin, PAGE_HEIGHT - top - line_height, PAGE_WIDTH - pdf.r_margin, PAGE_HEIGHT - top)
+        links.append((pdf.page - 1, rect, index))
+
+    return pdf, links
+
+
+def render_footers(page_titles: List[str], style: Dict, first_number: int = 1, total: Optional[int] = None) -> bytes:
+    """Ein Overlay-PDF mit je einer Fusszeile pro Seite ("Seite x von y" + Dokumenttitel)"""
+    pdf = _create_fpdf(style)
+    pdf.set_auto_page_break(False)
+    margin = style["margin"]
+    total = total or len(page_titles)
+    for number, title in enumerate(page_titles, start=first_number):
+        pdf.add_page()
+        pdf.set_font(style["font"], size=FOOTER_FONT_SIZE)
+        pdf.set_text_color(136, 136, 136)
+        pdf.set_xy(margin, PAGE_HEIGHT - margin)
+        usable = PAGE_WIDTH - 2 * margin
+        pdf.cell(usable / 3, 10, "", new_x="RIGHT", new_y="TOP")
+        pdf.cell(usable / 3, 10, f"Seite {number} von {total}", align="C", new_x="RIGHT", new_y="TOP")
+        pdf.cell(usable / 3, 10, _fit_text(pdf, style, title, usable / 3), align="R")
+    return bytes(pdf.output())
+
+
+def template_hash(style: Dict) -> str:
+    """Hash der Render-Optionen (inkl. RENDER_VERSION) fuer das Export-Manifest"""
+    payload = json.dumps({"style": style, "version": RENDER_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+# ===== ZUSAMMENFUEGEN =====
+
+def encoded_stream_data(stream: StreamObject) -> bytes:
+    """
+    Kodierte Bytes eines Streams (get_data() wuerde dekodieren, z.B. Bilder oder Flate-Inhalte).
+    pypdf hat dafuer keine oeffentliche API: aendert sich das interne Attribut, sofort scheitern
+    statt leere oder dekodierte Daten ins PDF zu schreiben.
+    """
+    data = getattr(stream, "_data", None)
+    if not isinstance(data, bytes):
+        raise TypeError(f"pypdf {pypdf.__version__}: Rohdaten von Streams nicht lesbar (StreamObject._data)")
+    return data
+
+
+class StreamingPdfWriter:
+    """
+    Haengt die Seiten mehrerer PDFs nacheinander an eine Ausgabedatei an.
+    Objekte werden sofort geschrieben, im Speicher ist nur das gerade angehaengte Dokument.
+    Die Gesamtseitenzahl muss vorab bekannt sein, damit Inhaltsverzeichnis-Links und Lesezeichen
+    auch auf spaetere Seiten zeigen koennen. Seitenbaum, Lesezeichen und Querverweistabelle
+    schreibt close().
+    """
+
+    def __init__(self, stream: BinaryIO, total_pages: int):
+        self.stream = stream
+        self._offsets: List[Optional[int]] = [None]  # Index = Objektnummer, 0 ist reserviert
+        self._pages_num = self._reserve()
+        self._page_nums = [self._reserve() for _ in range(total_pages)]
+        self._next_page = 0
+        self._outline: List[Tuple[str, int, int]] = []
+        stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def append(self, reader, links: Optional[Dict[int, List[Tuple[tuple, int]]]] = None) -> int:
+        """
+        Haengt alle Seiten von reader (PdfReader oder PdfWriter) an und gibt den Index der ersten Seite zurueck.
+        links: {seite_in_reader: [(rect, ziel_seitenindex)]} fuer klickbare Verweise im Ergebnis.
+        """
+        pages = list(reader.pages)
+        first = self._next_page
+        if first + len(pages) > len(self._page_nums):
+            raise ValueError("Mehr Seiten als beim Start angegeben")
+
+        # Quell-Objekt (pdf, nummer, generation) -> Objektnummer in der Ausgabe
+        refs: Dict[Tuple[int, int, int], int] = {}
+        pending: deque = deque()
+        for index, page in enumerate(pages):
+            refs[self._key(page.indirect_reference)] = self._page_nums[first + index]
+
+        for index, page in enumerate(pages):
+            copy = self._copy(page, refs, pending)
+            copy[NameObject("/Parent")] = self._ref(self._pages_num)
+            page_links = (links or {}).get(index)
+            if page_links:
+                annots = ArrayObject(page["/Annots"]) if "/Annots" in page else ArrayObject()
+                annots = self._copy(annots, refs, pending)
+                for rect, target in page_links:
+                    annots.append(self._write_new(DictionaryObject({
+                        NameObject("/Type"): NameObject("/Annot"),
+                        NameObject("/Subtype"): NameObject("/Link"),
+                        NameObject("/Rect"): ArrayObject(NumberObject(round(v)) for v in rect),
+                        NameObject("/Border"): ArrayObject([NumberObject(0)] * 3),
+                        NameObject("/Dest"): ArrayObject([self.page_ref(target), NameObject("/Fit")]),
+                    })))
+                copy[NameObject("/Annots")] = annots
+            self._write(self._page_nums[first + index], copy)
+
+        # Alles, was die Seiten referenzieren (Fonts, Bilder, Inhalte)
+        while pending:
+            ref = pending.popleft()
+            self._write(refs[self._key(ref)], self._copy(ref.get_object(), refs, pending, top=True))
+
+        self._next_page += len(pages)
+        return first
+
+    def page_ref(self, index: int) -> IndirectObject:
+        return self._ref(self._page_nums[index])
+
+    def add_outline_item(self, title: str, depth: int, page_index: int):
+        """Lesezeichen in Dokumentreihenfolge; depth wie in flatten_tree"""
+        self._outline.append((title, depth, page_index))
+
+    def close(self):
+        if self._next_page != len(self._page_nums):
+            raise ValueError(f"{self._next_page} von {len(self._page_nums)} Seiten geschrieben")
+        self._write(self._pages_num, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(self._ref(num) for num in self._page_nums),
+            NameObject("/Count"): NumberObject(len(self._page_nums)),
+        }))
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): self._ref(self._pages_num),
+        })
+        if self._outline:
+            catalog[NameObject("/Outlines")] = self._write_outline()
+            catalog[NameObject("/PageMode")] = NameObject("/UseOutlines")
+        root = self._write_new(catalog)
+
+        xref_offset = self.stream.tell()
+        self.stream.write(f"xref\n0 {len(self._offsets)}\n".encode())
+        self.stream.write(b"0000000000 65535 f \n")
+        for offset in self._offsets[1:]:
+            self.stream.write(f"{offset:010d} 00000 n \n".encode())
+        self.stream.write(f"trailer\n<< /Size {len(self._offsets)} /Root {root.idnum} 0 R >>\n"
+                          f"startxref\n{xref_offset}\n%%EOF\n".encode())
+
+    # ===== INTERN =====
+
+    @staticmethod
+    def _key(ref: IndirectObject) -> Tuple[int, int, int]:
+        # Nummern gelten nur innerhalb einer Quelle (Dokument bzw. Fusszeilen-Overlay)
+        return id(ref.pdf), ref.idnum, ref.generation
+
+    @staticmethod
+    def _ref(num: int) -> IndirectObject:
+        return IndirectObject(num, 0, None)
+
+    def _reserve(self) -> int:
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _write(self, num: int, obj):
+        self._offsets[num] = self.stream.tell()
+        self.stream.write(f"{num} 0 obj\n".encode())
+        obj.write_to_stream(self.stream)
+        self.stream.write(b"\nendobj\n")
+
+    def _write_new(self, obj) -> IndirectObject:
+        num = self._reserve()
+        self._write(num, obj)
+        return self._ref(num)
+
+    def _copy(self, obj, refs: Dict, pending: deque, top: bool = False):
+        """Kopie mit umnummerierten Verweisen; referenzierte Objekte landen in pending"""
+        if isinstance(obj, IndirectObject):
+            key = self._key(obj)
+            if key not in refs:
+                refs[key] = self._reserve()
+                pending.append(obj)
+            return self._ref(refs[key])
+        if isinstance(obj, StreamObject):
+            if not isinstance(obj, EncodedStreamObject):
+                # z.B. von merge_page erzeugte Inhalte: komprimiert schreiben
+                plain = DecodedStreamObject()
+                plain.update(obj)
+                plain.set_data(obj.get_data())
+                obj = plain.flate_encode()
+            # Kodierte Bytes unveraendert uebernehmen (Filter steht im kopierten Dictionary);
+            # set_data() eines DecodedStreamObject speichert die Bytes ohne neu zu kodieren
+            copy = DecodedStreamObject()
+            copy.set_data(encoded_stream_data(obj))
+            for key, value in dict.items(obj):
+                if key != "/Length":
+                    copy[NameObject(key)] = self._copy(value, refs, pending)
+            # Streams muessen indirekte Objekte sein
+            return copy if top else self._write_new(copy)
+        if isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+            for key, value in dict.items(obj):
+                if key == "/Parent" and dict.get(obj, "/Type") == "/Page":
+                    continue
+                copy[NameObject(key)] = self._copy(value, refs, pending)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(value, refs, pending) for value in obj)
+        return obj
+
+    def _write_outline(self) -> IndirectObject:
+        root = {"children": []}
+        parents = {-1: root}
+        for title, depth, page_index in self._outline:
+            node = {"title": title, "page": page_index, "children": []}
+            parents.get(depth - 1, root)["children"].append(node)
+            parents[depth] = node
+        root["num"] = self._reserve()
+        count = self._write_outline_items(root)
+        children = root["children"]
+        self._write(root["num"], DictionaryObject({
+            NameObject("/Type"): NameObject("/Outlines"),
+            NameObject("/First"): self._ref(children[0]["num"]),
+            NameObject("/Last"): self._ref(children[-1]["num"]),
+            NameObject("/Count"): NumberObject(count),
+        }))
+        return self._ref(root["num"])
+
+    def _write_outline_items(self, parent: Dict) -> int:
+        """Schreibt die Kinder von parent (rekursiv), gibt die Anzahl aller Nachfahren zurueck"""
+        children = parent["children"]
+        for child in children:
+            child["num"] = self._reserve()
+        count = len(children)
+        for index, child in enumerate(children):
+            item = DictionaryObject({
+                NameObject("/Title"): TextStringObject(child["title"]),
+                NameObject("/Parent"): self._ref(parent["num"]),
+                NameObject("/Dest"): ArrayObject([self.page_ref(child["page"]), NameObject("/Fit")]),
+            })
+            if index > 0:
+                item[NameObject("/Prev")] = self._ref(children[index - 1]["num"])
+            if index < len(children) - 1:
+                item[NameObject("/Next")] = self._ref(children[index + 1]["num"])
+            if child["children"]:
+                descendants = self._write_outline_items(child)
+                item[NameObject("/First")] = self._ref(child["children"][0]["num"])
+                item[NameObject("/Last")] = self._ref(child["children"][-1]["num"])
+                item[NameObject("/Count")] = NumberObject(descendants)
+                count += descendants
+            self._write(child["num"], item)
+        return count
+
+
+def append_with_footers(writer: StreamingPdfWriter, path: str, page_titles: List[str], style: Dict,
+                        first_number: int, total: int, links: Optional[Dict] = None):
+    """Haengt das PDF unter path mit Fusszeilen an (nur dieses Dokument ist dabei im Speicher)"""
+    with open(path, "rb") as f:
+        document = PdfWriter(clone_from=PdfReader(f))
+        footers = PdfReader(io.BytesIO(render_footers(page_titles, style, first_number, total)))
+        for page, footer in zip(document.pages, footers.pages):
+            page.merge_page(footer)
+        writer.append(document, links)
+
+
+# ===== EXPORT-MANIFEST =====
+
+class ExportManifest:
+    """
+    Gerenderte Dokumente eines Collection-Exports in einem festen Verzeichnis.
+    manifest.json: doc_id -> {updatedAt, template_hash, title, pages, file}.
+    Ein Eintrag wird wiederverwendet, solange updatedAt, Vorlage und Titel (aus dem Baum) gleich sind.
+    """
+
+    FILENAME = "manifest.json"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILENAME)
+        self.documents: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.documents = json.load(f).get("documents", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Export-Manifest %s unlesbar, wird neu aufgebaut: %s", self.path, e)
+
+    def lookup(self, doc_id: str, updated_at: Optional[str], tpl_hash: str, title: str):
+        """(pfad, seiten) eines noch gueltigen Eintrags oder None"""
+        if not updated_at:
+            return None
+        with self._lock:
+            entry = self.documents.get(doc_id)
+        if not entry or entry.get("updatedAt") != updated_at or entry.get("template_hash") != tpl_hash \
+                or entry.get("title") != title:
+            return None
+        path = os.path.join(self.directory, entry["file"])
+        return (path, entry["pages"]) if os.path.exists(path) else None
+
+    def store(self, doc_id: str, updated_at: str, tpl_hash: str, title: str, rendered_path: str, pages: int,
+              filename: Optional[str] = None) -> str:
+        """Uebernimmt ein frisch gerendertes PDF ins Verzeichnis und gibt den neuen Pfad zurueck"""
+        filename = filename or f"{doc_id}-{tpl_hash}.pdf"
+        path = os.path.join(self.directory, filename)
+        os.replace(rendered_path, path)
+        with self._lock:
+            # Gehoerte der Dateiname bisher einem anderen Dokument, ist dessen Eintrag jetzt ungueltig
+            for other_id in [d for d, e in self.documents.items() if d != doc_id and e["file"] == filename]:
+                del self.documents[other_id]
+            old = self.documents.get(doc_id)
+            self.documents[doc_id] = {
+                "updatedAt": updated_at, "template_hash": tpl_hash, "title": title,
+                "pages": pages, "file": filename,
+            }
+            old_in_use = old is not None and any(e["file"] == old["file"] for e in self.documents.values())
+        if old and not old_in_use:
+            self._remove_file(old["file"])
+        return path
+
+    def prune(self, keep_ids) -> int:
+        """Entfernt Eintraege (und Dateien) von Dokumenten, die nicht mehr in der Collection sind"""
+        keep_ids = set(keep_ids)
+        with self._lock:
+            stale = [doc_id for doc_id in self.documents if doc_id not in keep_ids]
+            removed = [self.documents.pop(doc_id) for doc_id in stale]
+        for entry in removed:
+            self._remove_file(entry["file"])
+        return len(removed)
+
+    def save(self):
+        """Atomar schreiben, ein abgebrochener Export hinterlaesst kein halbes Manifest"""
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            data = {"documents": self.documents}
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _remove_file(self, filename: str):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
+
+
+# Ein Export pro Verzeichnis gleichzeitig (Manifest und Dateien werden ueberschrieben)
+_store_locks: Dict[str, threading.Lock] = {}
+_store_locks_guard = threading.Lock()
+
+
+def _store_lock(directory: str) -> threading.Lock:
+    with _store_locks_guard:
+        return _store_locks.setdefault(os.path.abspath(directory), threading.Lock())
+
+
+def _updated_at_map(cache, collection_id: str) -> Dict[str, str]:
+    """doc_id -> updatedAt aus der Dokumentliste (ohne die Dokumente selbst zu laden)"""
+    try:
+        return {d["id"]: d.get("updatedAt") for d in cache.get_documents(collection_id) if d.get("id")}
+    except Exception as e:
+        logger.warning("Collection-Export: Dokumentliste nicht verfuegbar, alles wird neu gerendert: %s", e)
+        return {}
+
+
+def _release_document_memory():
+    """
+    fpdf2- und pypdf-Objekte verweisen zyklisch aufeinander und werden erst von der
+    Garbage Collection freigegeben. Grosse Bilddaten loesen diese nicht aus, ohne
+    expliziten Lauf pro Dokument sammeln sich daher die Bilder aller Dokumente an.
+    """
+    gc.collect()
+
+
+def export_document_pdf(document: Dict, title: str, style: Dict, path: str,
+                        load_image: Optional[Callable[[str], Optional[bytes]]] = None) -> int:
+    """Einzelnes Dokument als fertiges PDF (mit Fusszeilen) nach path. Gibt die Seitenzahl zurueck."""
+    body_path = path + ".body"
+    try:
+        pages = render_document_body(document, title, style, body_path, load_image)
+        with open(path, "wb") as f:
+            writer = StreamingPdfWriter(f, pages)
+            append_with_footers(writer, body_path, [title] * pages, style, 1, pages)
+            writer.close()
+    finally:
+        if os.path.exists(body_path):
+            os.remove(body_path)
+    return pages
+
+
+def export_collection_pdf(cache, collection_id: str, title: str, style: Dict, out_path: str,
+                          workers: int = 4,
+                          load_image: Optional[Callable[[str], Optional[bytes]]] = None,
+                          store_dir: Optional[str] = None) -> Dict:
+    """
+    Exportiert eine Collection als ein PDF nach out_path.
+    Dokumente werden parallel in je eine Datei gerendert. Danach werden sie in Baumreihenfolge
+    einzeln gelesen, mit Fusszeilen versehen und direkt in out_path geschrieben, sodass der
+    Speicherbedarf nicht mit der Collection-Groesse waechst (nur der Plattenplatz).
+    Mit store_dir werden unveraenderte Dokumente aus dem vorherigen Export uebernommen
+    (weder geladen noch gerendert); Titelseite, Inhaltsverzeichnis und Fusszeilen entstehen immer neu.
+    """
+    if store_dir:
+        with _store_lock(store_dir):
+            return _export_collection_pdf(cache, collection_id, title, style, out_path, workers,
+                                          load_image, ExportManifest(store_dir))
+    return _export_collection_pdf(cache, collection_id, title, style, out_path, workers, load_image, None)
+
+
+def _export_collection_pdf(cache, collection_id: str, title: str, style: Dict, out_path: str, workers: int,
+                           load_image: Optional[Callable[[str], Optional[bytes]]],
+                           manifest: Optional[ExportManifest]) -> Dict:
+    start = time.time()
+    entries = flatten_tree(cache.get_collection_tree(collection_id))
+    logger.info("Collection-Export: %d Dokumente (%s)", len(entries), collection_id)
+
+    tpl_hash = template_hash(style)
+    updated_at = _updated_at_map(cache, collection_id) if manifest else {}
+
+    with tempfile.TemporaryDirectory(prefix="outline-pdf-") as tmp_dir:
+
+        def render(index: int, entry: Dict):
+            """Gibt (pfad, seiten, aus_manifest) zurueck"""
+            doc_updated_at = updated_at.get(entry["id"])
+            if manifest:
+                hit = manifest.lookup(entry["id"], doc_updated_at, tpl_hash, entry["title"])
+                if hit:
+                    return hit[0], hit[1], True
+            path = os.path.join(tmp_dir, f"{index}.pdf")
+            try:
+                document = cache.get_document(entry["id"])
+                pages = render_document_body(document, entry["title"], style, path, load_image)
+            except Exception as e:
+                logger.error("Collection-Export: Dokument %s fehlgeschlagen: %s", entry["id"], e, exc_info=True)
+                # Fehlerseiten nicht speichern, beim naechsten Export erneut versuchen
+                return path, _render_error_body(entry["title"], style, path), False
+            finally:
+                _release_document_memory()
+            if manifest and doc_updated_at:
+                # Stand aus der Dokumentliste: ein neuerer Stand waehrend des Exports wird beim naechsten Mal erkannt
+                path = manifest.store(entry["id"], doc_updated_at, tpl_hash, entry["title"], path, pages)
+            return path, pages, False
+
+        # Gerenderte Dokumente liegen als Dateien vor, zurueck kommen nur Pfad und Seitenzahl
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            bodies = list(pool.map(render, range(len(entries)), entries))
+        reused = sum(from_manifest for _, _, from_manifest in bodies)
+
+        # Titelseite + Inhaltsverzeichnis: erst Seitenanzahl bestimmen, dann mit echten Seitenzahlen rendern
+        placeholder, _ = render_front_matter(title, entries, [0] * len(entries), style)
+        front_pages = placeholder.pages_count
+        page_numbers = []
+        total = front_pages
+        for _, pages, _ in bodies:
+            page_numbers.append(total + 1)
+            total += pages
+        front, links = render_front_matter(title, entries, page_numbers, style)
+        front_path = os.path.join(tmp_dir, "front.pdf")
+        front.output(front_path)
+
+        # Klickbares Inhaltsverzeichnis: {toc_seite: [(rect, ziel_seitenindex)]}
+        toc_links: Dict[int, List] = {}
+        for toc_page, rect, entry_index in links:
+            toc_links.setdefault(toc_page, []).append((rect, page_numbers[entry_index] - 1))
+
+        # Fusszeilen mit durchgehender Nummerierung, Dokument fuer Dokument in die Ausgabedatei
+        with open(out_path, "wb") as f:
+            writer = StreamingPdfWriter(f, total)
+            append_with_footers(writer, front_path, [title] * front_pages, style, 1, total, toc_links)
+            for entry, (path, pages, _), number in zip(entries, bodies, page_numbers):
+                append_with_footers(writer, path, [entry["title"]] * pages, style, number, total)
+                _release_document_memory()
+            # Lesezeichen (verschachtelt wie der Dokumentbaum)
+            for entry, number in zip(entries, page_numbers):
+                writer.add_outline_item(entry["title"], entry["depth"], number - 1)
+            writer.close()
+
+    if manifest:
+        manifest.prune(entry["id"] for entry in entries)
+        manifest.save()
+
+    stats = {
+        "documents": len(entries),
+        "rendered": len(entries) - reused,
+        "reused": reused,
+        "pages": total,
+        "duration_ms": round((time.time() - start) * 1000),
+    }
+    logger.info("Collection-Export fertig: %d Dokumente (%d wiederverwendet), %d Seiten (%dms)",
+                stats["documents"], stats["reused"], stats["pages"], stats["duration_ms"])
+    return stats
@@ -0,0 +1,199 @@
+"""
+Prefetch - Server-Cache fuer wahrscheinlich naechste Dokumente vorwaermen
+Favoriten, zuletzt geaenderte Dokumente und sichtbare Suchtreffer werden im Hintergrund
+geladen (Dokument, vorbereitetes Markdown, Bilder), damit der Editor aus dem Cache oeffnet.
+Niedrige Prioritaet: ein einzelner Task, der pausiert, solange echte Requests laufen,
+mit begrenzter Warteschlange und Budget (Dokumente pro Minute).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("outline-pdf.prefetch")
+
+# Zugriffszaehler werden spaetestens nach dieser Zeit gespeichert (Sekunden)
+HOT_SAVE_INTERVAL = 300
+
+
+class Prefetcher:
+    """
+    warm(doc_id) laedt ein Dokument in die Caches und gibt False zurueck, wenn es schon warm war
+    (zaehlt dann nicht gegen das Budget). is_busy() -> True pausiert das Vorwaermen.
+    Die Warteschlange ist LIFO: die zuletzt angefragten Dokumente sind die wahrscheinlichsten.
+    """
+
+    def __init__(self, warm: Callable[[str], bool], is_busy: Optional[Callable[[], bool]] = None,
+                 budget_per_minute: int = 30, max_queue: int = 100, hot_file: Optional[str] = None,
+                 hot_max: int = 500, idle_delay: float = 0.5):
+        self.warm = warm
+        self.is_busy = is_busy or (lambda: False)
+        self.budget_per_minute = budget_per_minute
+        self.max_queue = max_queue
+        self.hot_file = hot_file
+        self.hot_max = hot_max
+        self.idle_delay = idle_delay
+        self.hot: Counter = Counter()
+        self._queue: "OrderedDict[str, str]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._tokens = float(budget_per_minute)
+        self._last_refill = time.monotonic()
+        self._hot_dirty = False
+        self._last_save = time.monotonic()
+        # Metriken
+        self.warmed = 0
+        self.already_cached = 0
+        self.failed = 0
+        self.dropped = 0
+        if hot_file:
+            self.load_hot()
+
+    # ===== WARTESCHLANGE =====
+
+    def enqueue(self, doc_ids: Iterable[str], reason: str = "") -> int:
+        """Dokumente vormerken (erstes = hoechste Prioritaet). Gibt die Anzahl neuer Eintraege zurueck."""
+        if self.budget_per_minute <= 0:
+            return 0
+        added = 0
+        for doc_id in reversed(list(dict.fromkeys(doc_ids))):
+            if doc_id in self._queue:
+                self._queue.move_to_end(doc_id)
+                continue
+            self._queue[doc_id] = reason
+            added += 1
+        while len(self._queue) > self.max_queue:
+            # Aelteste Vormerkungen verwerfen
+            self._queue.popitem(last=False)
+            self.dropped += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return added
+
+    # ===== HINTERGRUND-TASK =====
+
+    def start(self, seed: Optional[Callable[[], List[str]]] = None):
+        """Startet den Task; seed() (im Thread-Pool) liefert die Dokumente fuer das Aufwaermen beim Start"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            if self._queue:
+                self._wakeup.set()
+            self._task = asyncio.get_running_loop().create_task(self._run(seed))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.save_hot()
+
+    async def _run(self, seed: Optional[Callable[[], List[str]]]):
+        if seed is not None and self.budget_per_minute > 0:
+            try:
+                ids = await run_in_threadpool(seed)
+                logger.info("Prefetch beim Start: %d Dokumente vorgemerkt", self.enqueue(ids, "startup"))
+            except Exception as e:
+                logger.warning("Prefetch beim Start fehlgeschlagen: %s", e)
+
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=HOT_SAVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._maybe_save_hot()
+                continue
+
+            # Niedrige Prioritaet: warten, solange echte Requests laufen
+            while self.is_busy():
+                await asyncio.sleep(self.idle_delay)
+            await self._take_token()
+            if not self._queue:
+                continue
+            doc_id, reason = self._queue.popitem(last=True)
+            await self._warm_one(doc_id, reason)
+            self._maybe_save_hot()
+
+    async def _warm_one(self, doc_id: str, reason: str):
+        start = time.perf_counter()
+        try:
+            fetched = await run_in_threadpool(self.warm, doc_id)
+        except Exception as e:
+            self.failed += 1
+            logger.warning("Prefetch %s (%s) fehlgeschlagen: %s", doc_id, reason, e)
+            return
+        if fetched:
+            self.warmed += 1
+            logger.debug("Prefetch %s (%s): %.0fms", doc_id, reason, (time.perf_counter() - start) * 1000)
+        else:
+            # Schon im Cache: Budget zurueckgeben
+            self.already_cached += 1
+            self._tokens = min(self.budget_per_minute, self._tokens + 1)
+
+    async def _take_token(self):
+        """Token-Bucket: hoechstens budget_per_minute Dokumente pro Minute (Bursts bis zur vollen Minute)"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.budget_per_minute,
+                               self._tokens + (now - self._last_refill) * self.budget_per_minute / 60)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) * 60 / self.budget_per_minute)
+
+    # ===== ZUGRIFFSZAEHLER (HEISSE DOKUMENTE) =====
+
+    def record_access(self, doc_id: str):
+        self.hot[doc_id] += 1
+        self._hot_dirty = True
+        if len(self.hot) > self.hot_max * 2:
+            self.hot = Counter(dict(self.hot.most_common(self.hot_max)))
+
+    def hottest(self, limit: int) -> List[str]:
+        return [doc_id for doc_id, _ in self.hot.most_common(limit)]
+
+    def load_hot(self):
+        try:
+            with open(self.hot_file, "r", encoding="utf-8") as f:
+                self.hot = Counter(json.load(f).get("hot", {}))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Prefetch: %s unlesbar: %s", self.hot_file, e)
+
+    def save_hot(self):
+        """Zugriffszaehler speichern, damit der naechste Start die heissen Dokumente kennt"""
+        if not self.hot_file or not self._hot_dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.hot_file) or ".", exist_ok=True)
+            tmp_path = self.hot_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"hot": dict(self.hot.most_common(self.hot_max))}, f)
+            os.replace(tmp_path, self.hot_file)
+            self._hot_dirty = False
+        except OSError as e:
+            logger.warning("Prefetch: %s nicht schreibbar: %s", self.hot_file, e)
+        self._last_save = time.monotonic()
+
+    def _maybe_save_hot(self):
+        if time.monotonic() - self._last_save >= HOT_SAVE_INTERVAL:
+            self.save_hot()
+
+    def metrics(self) -> Dict:
+        return {
+            "running": self._task is not None,
+            "queued": len(self._queue),
+            "budget_per_minute": self.budget_per_minute,
+            "warmed": self.warmed,
+            "already_cached": self.already_cached,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "hot_documents": len(self.hot),
+        }
@@ -0,0 +1,207 @@
+"""
+Profiling - Laufzeit-Diagnose im laufenden Prozess (nur fuer Admins)
+CPU-Sampling als Collapsed Stacks (direkt nutzbar mit flamegraph.pl / speedscope),
+tracemalloc-Snapshots mit Diff, Event-Loop-Verzoegerung und Thread-Pool-Auslastung.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Dict, Optional
+
+from anyio.to_thread import current_default_thread_limiter
+
+logger = logging.getLogger("outline-pdf.profiling")
+
+# Obergrenzen, damit ein Profil den Server nicht selbst ausbremst
+MAX_PROFILE_SECONDS = 60
+MIN_INTERVAL_MS = 1
+
+
+class ProfilerBusy(Exception):
+    """Es laeuft bereits ein CPU-Profil"""
+
+
+# ===== CPU-SAMPLING =====
+
+class SamplingProfiler:
+    """
+    Tastet in festen Abstaenden die Stacks aller Threads ab (sys._current_frames).
+    Kein Tracing -> geringer Overhead, laeuft gegen den echten Traffic.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval_ms: float = 5) -> Dict:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+            interval = max(interval_ms, MIN_INTERVAL_MS) / 1000
+            own_id = threading.get_ident()
+            stacks: Counter = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stacks[_collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                samples += 1
+                time.sleep(interval)
+
+            logger.info("CPU-Profil: %d Samples in %.1fs, %d Stacks", samples, seconds, len(stacks))
+            return {"seconds": seconds, "samples": samples, "stacks": stacks}
+        finally:
+            self._lock.release()
+
+
+def _collapse(thread_name: str, frame) -> str:
+    """Stack als 'thread;aeusserste;...;innerste' (Collapsed-Stack-Format)"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    parts.append(thread_name)
+    return ";".join(part.replace(";", ":") for part in reversed(parts))
+
+
+def format_collapsed(stacks: Counter) -> str:
+    """Eine Zeile pro Stack: '<stack> <anzahl>' (Eingabe fuer flamegraph.pl / speedscope)"""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+# ===== SPEICHER (TRACEMALLOC) =====
+
+class MemoryTracker:
+    """
+    tracemalloc-Snapshots; jeder Snapshot wird mit dem vorherigen verglichen,
+    so sieht man z.B. wachsende Bild-Puffer im Image-Proxy.
+    """
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info("tracemalloc gestartet (%d Frames)", frames)
+        self._previous = None
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("tracemalloc gestoppt")
+        self._previous = None
+
+    def snapshot(self, limit: int = 25, group_by: str = "lineno") -> Dict:
+        """Top-Allokationen und Diff zum vorherigen Snapshot (None beim ersten)"""
+        with self._lock:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ])
+            current, peak = tracemalloc.get_traced_memory()
+            result = {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [_stat_entry(stat) for stat in snapshot.statistics(group_by)[:limit]],
+                "diff": None,
+            }
+            if self._previous is not None:
+                diff = snapshot.compare_to(self._previous, group_by)
+                result["diff"] = [_stat_entry(stat) for stat in diff[:limit]]
+            self._previous = snapshot
+            return result
+
+
+def _stat_entry(stat) -> Dict:
+    frame = stat.traceback[0]
+    entry = {"location": f"{frame.filename}:{frame.lineno}", "size": stat.size, "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        entry["size_diff"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+# ===== EVENT-LOOP-VERZOEGERUNG =====
+
+class LoopLagMonitor:
+    """
+    Schlaeft periodisch und misst, wie viel spaeter als geplant der Loop wieder drankommt.
+    Hohe Werte = blockierender Code im Event-Loop.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval) * 1000)
+
+    def metrics(self) -> Dict:
+        values = list(self.samples)
+        if not values:
+            return {"running": self._task is not None, "samples": 0}
+        ordered = sorted(values)
+        return {
+            "running": self._task is not None,
+            "samples": len(values),
+            "window_seconds": round(len(values) * self.interval),
+            "last_ms": round(values[-1], 1),
+            "avg_ms": round(sum(values) / len(values), 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            "max_ms": round(ordered[-1], 1),
+        }
+
+
+# ===== THREAD-POOL =====
+
+def threadpool_metrics() -> Dict:
+    """Auslastung des Thread-Pools hinter run_in_threadpool (muss im Event-Loop laufen)"""
+    limiter = current_default_thread_limiter()
+    stats = limiter.statistics()
+    return {
+        "limit": limiter.total_tokens,
+        "busy": limiter.borrowed_tokens,
+        "waiting": stats.tasks_waiting,
+        "saturation": round(limiter.borrowed_tokens / limiter.total_tokens, 2),
+        "threads": threading.active_count(),
+        "thread_names": _thread_name_counts(),
+    }
+
+
+def _thread_name_counts() -> Dict[str, int]:
+    """Threads gruppiert nach Namens-Praefix (z.B. AnyIO worker thread, ThreadPoolExecutor-0)"""
+    counts: Counter = Counter()
+    for thread in threading.enumerate():
+        counts[thread.name.rstrip("0123456789_-")] += 1
+    return dict(counts)
@@ -0,0 +1,99 @@
+"""
+Outline Webhooks - Signaturpruefung und Cache-Invalidierung
+Outline signiert jede Zustellung mit dem Header "Outline-Signature: t=<timestamp>,s=<hmac>",
+wobei hmac = HMAC-SHA256(secret, "<timestamp>.<raw body>") als Hex-String.
+"""
+import hmac
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("outline-pdf.webhooks")
+
+# Zustellungen aelter als 5 Minuten werden abgelehnt (Replay-Schutz)
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+# Events nach denen ein Dokument nicht mehr gelistet wird
+DOCUMENT_REMOVE_EVENTS = {
+    "documents.delete",
+    "documents.permanent_delete",
+    "documents.archive",
+    "documents.unpublish",
+}
+
+
+def sign_payload(body: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """Erzeugt einen Outline-Signature Header (fuer Tests und lokales Replay)"""
+    timestamp = int(time.time() * 1000) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},s={digest}"
+
+
+def verify_signature(body: bytes, header: str, secret: str, now: Optional[float] = None) -> bool:
+    """Prueft den Outline-Signature Header gegen den Raw-Body"""
+    if not header or not secret:
+        return False
+
+    parts = dict(p.split("=", 1) for p in header.split(",") if "=" in p)
+    timestamp, signature = parts.get("t", ""), parts.get("s", "")
+    if not timestamp.isdigit() or not signature:
+        return False
+
+    # Outline sendet Millisekunden
+    now = time.time() if now is None else now
+    if abs(now - int(timestamp) / 1000) > SIGNATURE_TOLERANCE_SECONDS:
+        logger.warning("Webhook: Zeitstempel ausserhalb der Toleranz (%s)", timestamp)
+        return False
+
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def apply_webhook_event(event: Dict, cache, image_url_mapper: Optional[Callable[[str], Optional[str]]] = None) -> Dict:
+    """
+    Wendet ein Outline-Webhook-Event auf den OutlineCache an.
+    Es wird nur das betroffene Dokument bzw. die betroffene Collection verworfen,
+    Dokumentlisten werden inkrementell aktualisiert statt neu geladen.
+    """
+    name = event.get("event", "")
+    payload = event.get("payload") or {}
+    model = payload.get("model") or {}
+    item_id = payload.get("id") or model.get("id")
+
+    if name.startswith("documents.") and item_id:
+        result = cache.invalidate_document(item_id, image_url_mapper)
+        # Titel oder Position koennen sich geaendert haben -> Baum der Collection verwerfen
+        # (bei Verschiebungen ist die alte Collection unbekannt -> alle Baeume)
+        cache.invalidate_tree(None if name == "documents.move" else model.get("collectionId"))
+        if name in DOCUMENT_REMOVE_EVENTS:
+            cache.remove_document_from_lists(item_id)
+            action = "removed"
+        elif model:
+            # Entwuerfe/Vorlagen werden nicht gelistet -> aus den Listen entfernt
+            action = "updated" if cache.upsert_document(model) else "unlisted"
+        else:
+            cache.remove_document_from_lists(item_id)
+            action = "invalidated"
+        logger.info("Webhook %s: Dokument %s %s (%s Bilder verworfen)", name, item_id, action, result["images"])
+        return {"event": name, "id": item_id, "action": action}
+
+    if name.startswith("collections."):
+        collection_id = item_id if name in ("collections.delete", "collections.permanent_delete") else None
+        cache.invalidate_collection(collection_id)
+        cache.invalidate_tree(item_id)
+        logger.info("Webhook %s: Collection %s invalidiert", name, item_id)
+        return {"event": name, "id": item_id, "action": "invalidated"}
+
+    logger.debug("Webhook %s: ignoriert", name)
+    return {"event": name, "id": item_id, "action": "ignored"}
+
+
+def record_payload(body: bytes, directory: str, event_name: str):
+    """Speichert eine verifizierte Zustellung fuer spaeteres lokales Replay"""
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{int(time.time() * 1000)}_{event_name or 'unknown'}.json"
+    with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+        json.dump(json.loads(body), f, indent=4, ensure_ascii=False)
@@ -0,0 +1,176 @@
+/**
+ * Gemeinsame Helfer fuer die PDF-Erzeugung im Browser (Editor und Batch-Export).
+ * Das Markdown kommt serverseitig vorverarbeitet von /api/document/{id}/prepared,
+ * Bilder werden anhand des mitgelieferten Manifests vorab geladen.
+ */
+
+// ===== FETCH MIT RETRY BEI UEBERLAST =====
+// Der Server antwortet bei Ueberlast mit 503 + Retry-After -> entsprechend warten und erneut versuchen
+async function fetchWithRetry(url, attempts, init) {
+    attempts = attempts || 4;
+    for (var i = 1; ; i++) {
+        var response = await fetch(url, init);
+        if (response.status !== 503 || i >= attempts) return response;
+        var retryAfter = parseInt(response.headers.get('Retry-After') || '1', 10);
+        await new Promise(function(resolve) { setTimeout(resolve, Math.min(retryAfter, 30) * 1000); });
+    }
+}
+
+// ===== VORVERARBEITETES DOKUMENT LADEN =====
+// updatedAt (optional): bekannter Stand des Dokuments -> der Service Worker liefert dann ohne Netzwerk aus dem Cache
+async function loadPreparedDocument(docId, numbering, updatedAt) {
+    var init = updatedAt ? { headers: { 'X-Document-Updated-At': updatedAt } } : undefined;
+    var resp = await fetchWithRetry('/api/document/' + docId + '/prepared?numbering=' + (numbering ? 'true' : 'false'), 4, init);
+    var data = await resp.json();
+    if (!data.success) throw new Error('Dokument konnte nicht geladen werden');
+    return data.data;
+}
+
+// ===== BILDER ALS BASE64 LADEN =====
+async function fetchImageAsBase64(url) {
+    try {
+        var response = await fetchWithRetry(url);
+        if (!response.ok) return null;
+        var blob = await response.blob();
+        return new Promise(function(resolve) {
+            var reader = new FileReader();
+            reader.onloadend = function() { resolve(reader.result); };
+            reader.readAsDataURL(blob);
+        });
+    } catch (e) {
+        console.warn('Bild konnte nicht geladen werden:', url, e);
+        return null;
+    }
+}
+
+// ===== BILDER AUS DEM MANIFEST VORAB LADEN =====
+// imageData: Map proxy_url -> Promise(base64 | null)
+function prefetchImages(manifest, imageData) {
+    imageData = imageData || new Map();
+    manifest.forEach(function(img) {
+        if (imageData.has(img.proxy_url)) return;
+        imageData.set(img.proxy_url, img.error ? Promise.resolve(null) : fetchImageAsBase64(img.proxy_url));
+    });
+    return imageData;
+}
+
+// ===== BILDER IM PDFMAKE-CONTENT ERSETZEN =====
+async function resolveImages(content, imageData) {
+    if (Array.isArray(content)) {
+        for (var i = 0; i < content.length; i++) {
+            await resolveImages(content[i], imageData);
+        }
+    } else if (content && typeof content === 'object') {
+        if (content.image) {
+            var src = content.image;
+            if (!src.startsWith('data:')) {
+                var base64 = imageData && imageData.has(src)
+                    ? await imageData.get(src)
+                    : await fetchImageAsBase64(src);
+                if (base64) {
+                    content.image = base64;
+                    if (!content.width) content.width = 450;
+                    if (!content.fit) content.fit = [450, 600];
+                } else {
+                    delete content.image;
+                    content.text = '[Bild konnte nicht geladen werden]';
+                    content.italics = true;
+                    content.color = '#999';
+                }
+            }
+        }
+        if (content.stack) await resolveImages(content.stack, imageData);
+        if (content.columns) await resolveImages(content.columns, imageData);
+        if (content.table && content.table.body) {
+            for (var row of content.table.body) {
+                await resolveImages(row, imageData);
+            }
+        }
+        if (content.ul) await resolveImages(content.ul, imageData);
+        if (content.ol) await resolveImages(content.ol, imageData);
+    }
+}
+
+// ===== SCHRIFTEN (SUBSETS VOM SERVER) =====
+// Statt der kompletten pdfmake-Schriften (vfs_fonts.js) nur die im Dokument verwendeten Glyphen laden.
+// Rueckgabe: { font, fonts, vfs } -> pdfMake.createPdf(docDefinition, null, fonts, vfs)
+var PDFMAKE_VFS_URL = 'https://cdn.jsdelivr.net/npm/pdfmake@0.2.10/build/vfs_fonts.min.js';
+var FONT_FILE_CACHE_MAX = 32;
+var fontFileCache = new Map();
+var loadedScripts = {};
+
+// Sichtbarer Text des gerenderten HTML: markdown-it erzeugt Zeichen, die so nicht im Markdown stehen
+// (Entities wie &rarr;, Typographer: (c) -> ©, "..." -> „…“), und genau diese rendert pdfmake
+function renderedText(html) {
+    return new DOMParser().parseFromString(html, 'text/html').body.textContent || '';
+}
+
+async function loadPdfFonts(family, text) {
+    try {
+        // Nur die verschiedenen Zeichen senden
+        var chars = Array.from(new Set(Array.from(text || ''))).join('');
+        var resp = await fetchWithRetry('/api/fonts/subset', 4, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ family: family, text: chars })
+        });
+        if (!resp.ok) throw new Error('HTTP ' + resp.status);
+        var info = (await resp.json()).data;
+
+        var name = family + '-' + info.hash;
+        var vfs = {};
+        var definition = {};
+        await Promise.all(Object.keys(info.files).map(async function(style) {
+            var file = name + '-' + style + '.ttf';
+            vfs[file] = await loadFontFile(info.files[style]);
+            definition[style] = file;
+        }));
+        // Fehlende Schnitte (z.B. kein Kursiv installiert) durch den normalen ersetzen
+        ['normal', 'bold', 'italics', 'bolditalics'].forEach(function(style) {
+            if (!definition[style]) definition[style] = definition.normal;
+        });
+        var fonts = {};
+        fonts[name] = definition;
+        return { font: name, fonts: fonts, vfs: vfs };
+    } catch (e) {
+        console.warn('Font-Subset nicht verfuegbar, nutze Standard-Schrift (Roboto):', e);
+        await loadScriptOnce(PDFMAKE_VFS_URL);
+        return { font: 'Roboto', fonts: undefined, vfs: undefined };
+    }
+}
+
+// Subset-Dateien sind ueber den Hash in der URL unveraenderlich -> im Speicher wiederverwenden
+function loadFontFile(url) {
+    if (!fontFileCache.has(url)) {
+        if (fontFileCache.size >= FONT_FILE_CACHE_MAX) {
+            fontFileCache.delete(fontFileCache.keys().next().value);
+        }
+        fontFileCache.set(url, fetchWithRetry(url).then(function(response) {
+            if (!response.ok) throw new Error('Font konnte nicht geladen werden: ' + url);
+            return response.blob();
+        }).then(function(blob) {
+            return new Promise(function(resolve) {
+                var reader = new FileReader();
+                reader.onloadend = function() { resolve(reader.result.split(',')[1]); };
+                reader.readAsDataURL(blob);
+            });
+        }).catch(function(e) {
+            fontFileCache.delete(url);
+            throw e;
+        }));
+    }
+    return fontFileCache.get(url);
+}
+
+function loadScriptOnce(src) {
+    if (!loadedScripts[src]) {
+        loadedScripts[src] = new Promise(function(resolve, reject) {
+            var script = document.createElement('script');
+            script.src = src;
+            script.onload = resolve;
+            script.onerror = reject;
+            document.head.appendChild(script);
+        });
+    }
+    return loadedScripts[src];
+}
@@ -0,0 +1,22 @@
+/* Service Worker registrieren (lokaler Cache fuer API-Antworten und Bilder)
+   onCacheUpdated(callback): wird aufgerufen, wenn eine im Hintergrund aktualisierte
+   API-Antwort von der gecachten Version abweicht */
+
+(function() {
+    var listeners = [];
+
+    window.onCacheUpdated = function(callback) {
+        listeners.push(callback);
+    };
+
+    if (!('serviceWorker' in navigator)) return;
+
+    navigator.serviceWorker.register('/sw.js').catch(function(e) {
+        console.warn('Service Worker konnte nicht registriert werden:', e);
+    });
+
+    navigator.serviceWorker.addEventListener('message', function(event) {
+        if (!event.data || event.data.type !== 'cache-updated') return;
+        listeners.forEach(function(callback) { callback(event.data.path, event.data.search); });
+    });
+})();
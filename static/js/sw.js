@@ -0,0 +1,269 @@
+/**
+ * Service Worker - Lokaler Cache fuer API-Antworten und Bilder
+ * Collections, Dokumentlisten und Dokumente: Stale-While-Revalidate, Dokumente zusaetzlich
+ * gegen updatedAt geprueft (stimmt der Stand, entfaellt der Netzwerk-Request ganz).
+ * Bilder aus /api/image-proxy: Cache Storage mit Groessenlimit (aelteste zuerst entfernt).
+ * Wird unter /sw.js ausgeliefert, damit der Scope die ganze App umfasst.
+ */
+
+var CACHE_VERSION = 'v1';
+var API_CACHE = 'outline-pdf-api-' + CACHE_VERSION;
+var IMAGE_CACHE = 'outline-pdf-images-' + CACHE_VERSION;
+
+// API-Antworten aelter als das werden nicht mehr ungeprueft ausgeliefert
+var API_MAX_AGE_MS = 24 * 60 * 60 * 1000;
+// Bild-Cache: Gesamtgroesse und Groesse pro Bild
+var IMAGE_CACHE_MAX_BYTES = 100 * 1024 * 1024;
+var IMAGE_MAX_BYTES = 10 * 1024 * 1024;
+
+var LIST_PATTERN = /^\/api\/(collections|documents)$/;
+var STREAM_PATTERN = /^\/api\/documents\/stream$/;
+var DOCUMENT_PATTERN = /^\/api\/document\/([0-9a-f-]{36})(\/prepared)?$/i;
+var IMAGE_PATTERN = /^\/api\/image-proxy$/;
+
+// Dokument-ID -> updatedAt (aus den Dokumentlisten)
+var knownUpdatedAt = null;
+var imageCacheBytes = null;
+var trimRunning = null;
+
+// ===== LEBENSZYKLUS =====
+self.addEventListener('install', function() {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', function(event) {
+    event.waitUntil(
+        caches.keys().then(function(names) {
+            // Caches alter Versionen entfernen
+            return Promise.all(names.filter(function(name) {
+                return name.indexOf('outline-pdf-') === 0 && name !== API_CACHE && name !== IMAGE_CACHE;
+            }).map(function(name) { return caches.delete(name); }));
+        }).then(function() { return self.clients.claim(); })
+    );
+});
+
+self.addEventListener('fetch', function(event) {
+    var request = event.request;
+    if (request.method !== 'GET') return;
+    var url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    var match;
+    if (LIST_PATTERN.test(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event, request));
+    } else if (STREAM_PATTERN.test(url.pathname)) {
+        event.respondWith(streamResponse(event, request));
+    } else if ((match = DOCUMENT_PATTERN.exec(url.pathname))) {
+        event.respondWith(documentResponse(event, request, match[1]));
+    } else if (IMAGE_PATTERN.test(url.pathname)) {
+        event.respondWith(imageResponse(event, request));
+    }
+});
+
+// ===== API: STALE-WHILE-REVALIDATE =====
+async function staleWhileRevalidate(event, request) {
+    var cache = await caches.open(API_CACHE);
+    var cached = await cache.match(request);
+    var network = fetchAndStore(cache, request, cached);
+
+    if (cached && !isExpired(cached)) {
+        // Im Hintergrund aktualisieren, Seiten bei Aenderung benachrichtigen
+        event.waitUntil(network.catch(function() {}));
+        return cached;
+    }
+    try {
+        return await network;
+    } catch (e) {
+        if (cached) return cached;
+        throw e;
+    }
+}
+
+async function documentResponse(event, request, docId) {
+    var cache = await caches.open(API_CACHE);
+    var cached = await cache.match(request);
+    var expected = request.headers.get('X-Document-Updated-At') || (await getKnownUpdatedAt())[docId];
+
+    if (cached && expected) {
+        if (cached.headers.get('X-SW-Updated-At') === expected) {
+            // Stand laut Dokumentliste aktuell -> kein Netzwerk noetig
+            return cached;
+        }
+        // Bekannt veraltet -> Netzwerk zuerst, Cache nur als Fallback (offline)
+        try {
+            return await fetchAndStore(cache, request, cached);
+        } catch (e) {
+            return cached;
+        }
+    }
+    return staleWhileRevalidate(event, request);
+}
+
+async function fetchAndStore(cache, request, cached) {
+    var response = await fetch(request);
+    if (!response.ok) return response;
+
+    var text = await response.text();
+    var payload;
+    try {
+        payload = JSON.parse(text);
+    } catch (e) {
+        payload = null;
+    }
+
+    var headers = new Headers(response.headers);
+    if (payload && payload.success) {
+        headers.set('X-SW-Cached-At', String(Date.now()));
+        var updatedAt = payload.data && !Array.isArray(payload.data) ? payload.data.updatedAt : null;
+        if (updatedAt) headers.set('X-SW-Updated-At', updatedAt);
+        if (Array.isArray(payload.data)) rememberUpdatedAt(payload.data);
+
+        await cache.put(request, new Response(text, { status: response.status, headers: headers }));
+        if (cached && (await cached.clone().text()) !== text) {
+            notifyClients(request.url);
+        }
+    }
+    return new Response(text, { status: response.status, statusText: response.statusText, headers: headers });
+}
+
+// ===== NDJSON-DOKUMENTLISTE =====
+async function streamResponse(event, request) {
+    var cache = await caches.open(API_CACHE);
+    var cached = await cache.match(request);
+    if (cached && !isExpired(cached)) {
+        event.waitUntil(fetch(request).then(function(response) {
+            return storeStream(cache, request, response, cached);
+        }).catch(function() {}));
+        return cached;
+    }
+
+    var response;
+    try {
+        response = await fetch(request);
+    } catch (e) {
+        if (cached) return cached;
+        throw e;
+    }
+    if (!response.ok || !response.body) return response;
+
+    // Stream aufteilen: ein Zweig geht sofort an die Seite (Karten erscheinen progressiv),
+    // der andere wird nach vollstaendigem Empfang gecacht
+    var branches = response.body.tee();
+    event.waitUntil(storeStream(cache, request, new Response(branches[1], { headers: response.headers }), cached));
+    return new Response(branches[0], { status: response.status, statusText: response.statusText, headers: response.headers });
+}
+
+async function storeStream(cache, request, response, cached) {
+    if (!response.ok) return;
+    var text = await response.text();
+    var entries = text.split('\n').filter(function(line) { return line.trim(); }).map(function(line) {
+        return JSON.parse(line);
+    });
+    // Nur vollstaendige Listen cachen
+    if (!entries.length || entries[entries.length - 1].type !== 'done') return;
+
+    rememberUpdatedAt(entries.filter(function(entry) { return entry.type === 'document'; })
+        .map(function(entry) { return entry.data; }));
+    var headers = new Headers(response.headers);
+    headers.set('X-SW-Cached-At', String(Date.now()));
+    await cache.put(request, new Response(text, { status: 200, headers: headers }));
+    if (cached && (await cached.clone().text()) !== text) {
+        notifyClients(request.url);
+    }
+}
+
+function isExpired(response) {
+    var cachedAt = parseInt(response.headers.get('X-SW-Cached-At') || '0', 10);
+    return Date.now() - cachedAt > API_MAX_AGE_MS;
+}
+
+function rememberUpdatedAt(items) {
+    if (!knownUpdatedAt) knownUpdatedAt = {};
+    items.forEach(function(item) {
+        if (item && item.id && item.updatedAt) knownUpdatedAt[item.id] = item.updatedAt;
+    });
+}
+
+async function getKnownUpdatedAt() {
+    if (knownUpdatedAt) return knownUpdatedAt;
+    // Nach Neustart des Service Workers aus der gecachten Gesamtliste wiederherstellen
+    knownUpdatedAt = {};
+    var cache = await caches.open(API_CACHE);
+    var cached = await cache.match('/api/documents');
+    if (cached) {
+        try {
+            rememberUpdatedAt((await cached.json()).data || []);
+        } catch (e) { /* ignorieren */ }
+    }
+    var stream = await cache.match('/api/documents/stream');
+    if (stream) {
+        (await stream.text()).split('\n').forEach(function(line) {
+            try {
+                var entry = JSON.parse(line);
+                if (entry.type === 'document') rememberUpdatedAt([entry.data]);
+            } catch (e) { /* Leerzeilen ignorieren */ }
+        });
+    }
+    return knownUpdatedAt;
+}
+
+async function notifyClients(url) {
+    var path = new URL(url);
+    var clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(function(client) {
+        client.postMessage({ type: 'cache-updated', path: path.pathname, search: path.search });
+    });
+}
+
+// ===== BILDER: CACHE MIT GROESSENLIMIT =====
+async function imageResponse(event, request) {
+    var cache = await caches.open(IMAGE_CACHE);
+    var cached = await cache.match(request);
+    if (cached) return cached;
+
+    var response = await fetch(request);
+    var contentType = response.headers.get('Content-Type') || '';
+    if (!response.ok || contentType.indexOf('image/') !== 0) return response;
+
+    var blob = await response.blob();
+    var headers = new Headers(response.headers);
+    headers.set('X-SW-Size', String(blob.size));
+    if (blob.size <= IMAGE_MAX_BYTES) {
+        event.waitUntil(
+            cache.put(request, new Response(blob, { status: response.status, headers: headers }))
+                .then(function() { return addImageBytes(cache, blob.size); })
+        );
+    }
+    return new Response(blob, { status: response.status, statusText: response.statusText, headers: headers });
+}
+
+async function addImageBytes(cache, size) {
+    if (imageCacheBytes === null) {
+        // Erste Nutzung: aktuelle Groesse einmal aus dem Cache ermitteln (enthaelt den neuen Eintrag bereits)
+        imageCacheBytes = 0;
+        var keys = await cache.keys();
+        for (var i = 0; i < keys.length; i++) {
+            imageCacheBytes += await entrySize(cache, keys[i]);
+        }
+    } else {
+        imageCacheBytes += size;
+    }
+    if (imageCacheBytes > IMAGE_CACHE_MAX_BYTES && !trimRunning) {
+        trimRunning = trimImageCache(cache).finally(function() { trimRunning = null; });
+    }
+    return trimRunning;
+}
+
+async function trimImageCache(cache) {
+    // cache.keys() liefert in Einfuege-Reihenfolge -> aelteste zuerst entfernen (bis 90% des Limits)
+    var keys = await cache.keys();
+    for (var i = 0; i < keys.length && imageCacheBytes > IMAGE_CACHE_MAX_BYTES * 0.9; i++) {
+        imageCacheBytes -= await entrySize(cache, keys[i]);
+        await cache.delete(keys[i]);
+    }
+}
+
+async function entrySize(cache, request) {
+    var response = await cache.match(request);
+    return response ? parseInt(response.headers.get('X-SW-Size') || '0', 10) : 0;
+}
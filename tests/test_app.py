@@ -6,6 +6,8 @@ import pytest
 import json
 import sys
 import os
+import shutil
+import tempfile
 
 # Projektpfad hinzufuegen
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -163,6 +165,1260 @@ class TestAPIEndpoints:
         response = self.client.get("/api/documents?collection_id=not-valid")
         assert response.status_code == 400
 
+    def test_service_worker_unter_wurzel(self):
+        """Service Worker muss unter /sw.js liegen (Scope = ganze App) und darf nicht gecacht werden"""
+        response = self.client.get("/sw.js")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/javascript")
+        assert response.headers["cache-control"] == "no-cache"
+
+
+# ===== WEBHOOK TESTS =====
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DOC_ID = "3283f2f9-c0f7-4575-b5d9-76d5aa4befcb"
+COLLECTION_ID = "a1b2c3d4-e5f6-4a7b-8c9d-0e1f2a3b4c5d"
+
+
+def load_webhook_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, "webhooks", name), "rb") as f:
+        return f.read()
+
+
+class TestWebhooks:
+    """Tests fuer den Outline-Webhook (Replay aufgezeichneter Payloads)"""
+
+    SECRET = "test-webhook-secret"
+
+    def setup_method(self):
+        import app as app_module
+        self.app_module = app_module
+        self.client = TestClient(app_module.app)
+        self.cache = app_module.outline_cache
+        self.cache.clear()
+        self._old_secret = app_module.WEBHOOK_SECRET
+        app_module.WEBHOOK_SECRET = self.SECRET
+        # Mit Webhook-Secret werden Inhalte lange gecacht
+        self._old_content_ttl = self.cache.content_ttl
+        self.cache.content_ttl = 86400
+
+        # Cache vorbefuellen wie nach normalem Betrieb
+        old_doc = {
+            "id": DOC_ID,
+            "collectionId": COLLECTION_ID,
+            "title": "Handbuch",
+            "text": "# Einleitung\n\n![Bild](/api/attachments.redirect?id=abc)",
+        }
+        other_doc = {"id": "11111111-2222-4333-8444-555555555555", "collectionId": COLLECTION_ID, "title": "Andere"}
+        self.cache.data.set("collections", [{"id": COLLECTION_ID, "name": "Handbuch"}])
+        self.cache.data.set("documents:all", [old_doc, other_doc])
+        self.cache.data.set(f"documents:{COLLECTION_ID}", [old_doc, other_doc])
+        self.cache.data.set(f"document:{DOC_ID}", old_doc)
+        self.image_key = self.app_module.image_cache_key("/api/attachments.redirect?id=abc")
+        self.cache.images.set(self.image_key, (b"png", "image/png"), size=3)
+
+    def teardown_method(self):
+        self.app_module.WEBHOOK_SECRET = self._old_secret
+        self.cache.content_ttl = self._old_content_ttl
+        self.cache.clear()
+
+    def replay(self, name, secret=None):
+        from modules.webhooks import sign_payload
+        body = load_webhook_fixture(name)
+        return self.client.post(
+            "/api/webhooks/outline",
+            content=body,
+            headers={"Outline-Signature": sign_payload(body, secret or self.SECRET), "Content-Type": "application/json"},
+        )
+
+    def test_signatur_ungueltig(self):
+        response = self.replay("documents.update.json", secret="falsches-secret")
+        assert response.status_code == 401
+
+    def test_signatur_fehlt(self):
+        response = self.client.post("/api/webhooks/outline", content=load_webhook_fixture("documents.update.json"))
+        assert response.status_code == 401
+
+    def test_signatur_abgelaufen(self):
+        from modules.webhooks import verify_signature, sign_payload
+        body = b"{}"
+        header = sign_payload(body, self.SECRET, timestamp=1000)
+        assert verify_signature(body, header, self.SECRET) is False
+
+    def test_nicht_konfiguriert(self):
+        self.app_module.WEBHOOK_SECRET = ""
+        response = self.replay("documents.update.json")
+        assert response.status_code == 404
+
+    def test_dokument_update(self):
+        """Update ersetzt Dokument, aktualisiert Listen inkrementell und verwirft alte Bilder"""
+        response = self.replay("documents.update.json")
+        assert response.status_code == 200
+        assert response.json()["data"]["action"] == "updated"
+
+        assert self.cache.data.get(f"document:{DOC_ID}")["title"] == "Handbuch (ueberarbeitet)"
+        docs = self.cache.data.get("documents:all")
+        assert len(docs) == 2
+        assert docs[0]["title"] == "Handbuch (ueberarbeitet)"
+        assert self.cache.images.get(self.image_key) is None
+        # Andere Eintraege bleiben unberuehrt
+        assert self.cache.data.get("collections") is not None
+
+    def test_entwurf_nicht_in_listen(self):
+        """Entwuerfe (ohne publishedAt) liefert documents.list nicht -> auch nicht in die gecachten Listen"""
+        response = self.replay("documents.update_draft.json")
+        assert response.status_code == 200
+        assert response.json()["data"]["action"] == "unlisted"
+        for key in ("documents:all", f"documents:{COLLECTION_ID}"):
+            assert DOC_ID not in [d["id"] for d in self.cache.data.get(key)]
+        assert self.cache.data.get(f"document:{DOC_ID}") is None
+
+    def test_vorlage_nicht_in_listen(self):
+        from modules.webhooks import apply_webhook_event
+        model = {"id": DOC_ID, "collectionId": COLLECTION_ID, "title": "Vorlage", "template": True,
+                 "publishedAt": "2026-09-01T08:00:00.000Z"}
+        result = apply_webhook_event({"event": "documents.update", "payload": {"model": model}}, self.cache)
+        assert result["action"] == "unlisted"
+        assert DOC_ID not in [d["id"] for d in self.cache.data.get("documents:all")]
+
+    def test_dokument_delete(self):
+        response = self.replay("documents.delete.json")
+        assert response.status_code == 200
+        assert self.cache.data.get(f"document:{DOC_ID}") is None
+        assert [d["id"] for d in self.cache.data.get(f"documents:{COLLECTION_ID}")] == ["11111111-2222-4333-8444-555555555555"]
+
+    def test_collection_update(self):
+        response = self.replay("collections.update.json")
+        assert response.status_code == 200
+        assert self.cache.data.get("collections") is None
+        assert self.cache.data.get(f"document:{DOC_ID}") is not None
+
+    def test_ohne_webhook_inhalte_immer_live(self):
+        """content_ttl=0 (Standard ohne Secret): Dokumente kommen bei jedem Aufruf von Outline, Bilder bleiben gecacht"""
+        from modules.cache import OutlineCache
+
+        class FakeClient:
+            calls = 0
+
+            def get_document(self, doc_id):
+                FakeClient.calls += 1
+                return {"id": doc_id, "title": f"Stand {FakeClient.calls}"}
+
+        cache = OutlineCache(FakeClient(), ttl=300, content_ttl=0)
+        assert cache.get_document(DOC_ID)["title"] == "Stand 1"
+        assert cache.get_document(DOC_ID)["title"] == "Stand 2"
+        assert cache.data.keys() == []
+        cache.get_image("https://outline.test/a.png", lambda url: (b"png", "image/png"))
+        assert cache.images.get("https://outline.test/a.png") == (b"png", "image/png")
+
+
+# ===== MARKDOWN PIPELINE TESTS =====
+
+class TestMarkdownPipeline:
+    """Tests fuer die serverseitige Markdown-Vorverarbeitung"""
+
+    def test_normalisierung(self):
+        from modules.markdown_pipeline import normalize_markdown
+        md = normalize_markdown("Text\n  # Titel\u00a0x\u200b<div>y</div>")
+        assert md == "Text\n\n# Titel xy"
+
+    def test_abschnittsnummern(self):
+        from modules.markdown_pipeline import add_section_numbers
+        md = add_section_numbers("# A\n## B\n## C\n# D\n## E")
+        assert md == "# 1 A\n## 1.1 B\n## 1.2 C\n# 2 D\n## 2.1 E"
+
+    def test_bild_urls_ueber_proxy(self):
+        from modules.markdown_pipeline import rewrite_image_urls
+        md = rewrite_image_urls('![x](/api/attachments.redirect?id=1 "t") <img src="https://o/a.png" alt="a"> ![y](bild.png)')
+        assert "![x](/api/image-proxy?url=%2Fapi%2Fattachments.redirect%3Fid%3D1)" in md
+        assert '<img src="/api/image-proxy?url=https%3A%2F%2Fo%2Fa.png" alt="a">' in md
+        assert "![y](bild.png)" in md
+
+    def test_manifest_dedupliziert(self):
+        from modules.markdown_pipeline import prepare_document
+        doc = {"id": DOC_ID, "updatedAt": "r1", "text": "# A\n![a](/api/x?id=1)\n# B\n![b](/api/x?id=1)"}
+        prepared = prepare_document(doc, numbering=True)
+        assert [i["url"] for i in prepared["images"]] == ["/api/x?id=1"]
+        assert prepared["outline"] == [{"level": 1, "title": "1 A"}, {"level": 1, "title": "2 B"}]
+        assert prepared["revision"] == "r1"
+        assert prepared["updatedAt"] == "r1"
+
+    def test_endpoint_cache_pro_revision(self):
+        import app as app_module
+        cache = app_module.outline_cache
+        cache.clear()
+        cache.data.set(f"document:{DOC_ID}", {"id": DOC_ID, "title": "T", "updatedAt": "r1", "text": "# A"})
+        client = TestClient(app_module.app)
+
+        response = client.get(f"/api/document/{DOC_ID}/prepared?numbering=false")
+        assert response.status_code == 200
+        assert response.json()["data"]["markdown"] == "# A"
+        assert cache.data.keys("prepared:") == [f"prepared:{DOC_ID}:r1:0"]
+
+        # Invalidierung des Dokuments verwirft auch die vorverarbeiteten Varianten
+        cache.invalidate_document(DOC_ID)
+        assert cache.data.keys("prepared:") == []
+        cache.clear()
+
+    def test_manifest_ohne_bild_download(self, monkeypatch):
+        import io
+        from PIL import Image
+        import app as app_module
+        buffer = io.BytesIO()
+        Image.new("RGB", (1, 1)).save(buffer, "PNG")
+        png = buffer.getvalue()
+        cache = app_module.outline_cache
+        cache.clear()
+        cache.data.set(f"document:{DOC_ID}", {"id": DOC_ID, "title": "T", "updatedAt": "r1",
+                                              "text": "![a](/api/attachments.redirect?id=1)\n![b](/api/attachments.redirect?id=2)"})
+        downloads, heads = [], []
+
+        def fake_fetch(url):
+            downloads.append(url)
+            return png, "image/png"
+
+        def fake_head(url):
+            heads.append(url)
+            return {"bytes": 1234, "content_type": "image/png", "width": None, "height": None}
+
+        monkeypatch.setattr(app_module, "fetch_image", fake_fetch)
+        monkeypatch.setattr(app_module, "head_image", fake_head)
+        # Bild 2 liegt schon im Cache: volle Angaben ohne HEAD
+        cache.images.set(app_module.image_cache_key("/api/attachments.redirect?id=2"), (png, "image/png"))
+
+        response = TestClient(app_module.app).get(f"/api/document/{DOC_ID}/prepared")
+        images = response.json()["data"]["images"]
+        assert downloads == []
+        assert len(heads) == 1
+        assert images[0]["bytes"] == 1234 and images[0]["width"] is None
+        assert images[1]["bytes"] == len(png) and images[1]["width"] == 1
+
+        # Der Prefetcher laedt die Bilder dagegen komplett (waermt den Bild-Cache)
+        cache.clear()
+        cache.data.set(f"document:{DOC_ID}", {"id": DOC_ID, "updatedAt": "r2", "text": "![a](/api/attachments.redirect?id=1)"})
+        app_module.warm_document(DOC_ID)
+        assert len(downloads) == 1
+        cache.clear()
+
+    def test_endpoint_ungueltige_id(self):
+        from app import app
+        response = TestClient(app).get("/api/document/not-a-uuid/prepared")
+        assert response.status_code == 400
+
+
+# ===== DOKUMENT-STREAM TESTS =====
+
+class FakePagedClient:
+    """Liefert Dokumente seitenweise; optional Fehler nach der ersten Seite"""
+
+    def __init__(self, pages, fail_after_first=False):
+        self.pages = pages
+        self.fail_after_first = fail_after_first
+        self.requested = 0
+
+    def iter_document_pages(self, collection_id=None):
+        for page in self.pages:
+            self.requested += 1
+            yield page
+            if self.fail_after_first:
+                raise RuntimeError("Outline nicht erreichbar")
+
+
+class TestDocumentStream:
+    """Tests fuer die NDJSON-Dokumentliste"""
+
+    def setup_method(self):
+        import app as app_module
+        self.app_module = app_module
+        self.original_client = app_module.outline_cache.client
+        app_module.outline_cache.clear()
+        self.client = TestClient(app_module.app)
+
+    def teardown_method(self):
+        self.app_module.outline_cache.client = self.original_client
+        self.app_module.outline_cache.clear()
+
+    def read_lines(self, url):
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_seiten_werden_zeilenweise_gestreamt(self):
+        pages = [[{"id": f"d{i}", "title": f"Dok {i}"} for i in range(25)], [{"id": "d25", "title": "Letztes"}]]
+        self.app_module.outline_cache.client = FakePagedClient(pages)
+        lines = self.read_lines("/api/documents/stream")
+        assert [line["type"] for line in lines] == ["document"] * 26 + ["done"]
+        assert lines[0]["data"]["title"] == "Dok 0"
+        assert lines[-1]["count"] == 26
+        # Streaming sammelt die Liste nicht im Cache
+        assert self.app_module.outline_cache.data.get("documents:all") is None
+
+    def test_aus_dem_cache(self):
+        fake = FakePagedClient([])
+        self.app_module.outline_cache.client = fake
+        self.app_module.outline_cache.data.set("documents:all", [{"id": "a"}, {"id": "b"}])
+        lines = self.read_lines("/api/documents/stream")
+        assert [line.get("data", {}).get("id") for line in lines[:2]] == ["a", "b"]
+        assert lines[-1] == {"type": "done", "count": 2}
+        assert fake.requested == 0
+
+    def test_fehler_mitten_im_stream(self):
+        self.app_module.outline_cache.client = FakePagedClient([[{"id": "a"}], [{"id": "b"}]], fail_after_first=True)
+        lines = self.read_lines("/api/documents/stream")
+        assert lines[0]["data"]["id"] == "a"
+        assert lines[-1]["type"] == "error"
+        assert "done" not in [line["type"] for line in lines]
+
+    def test_slot_bleibt_waehrend_des_streams_belegt(self):
+        """Die Seiten werden erst beim Senden des Bodys geladen - so lange muss der Slot belegt bleiben"""
+        controller = self.app_module.admission["document"]
+        in_flight = []
+
+        class RecordingClient(FakePagedClient):
+            def iter_document_pages(self, collection_id=None):
+                for page in super().iter_document_pages(collection_id):
+                    in_flight.append(controller.in_flight)
+                    yield page
+
+        self.app_module.outline_cache.client = RecordingClient([[{"id": "a"}], [{"id": "b"}]])
+        before = controller.in_flight
+        lines = self.read_lines("/api/documents/stream")
+        assert lines[-1] == {"type": "done", "count": 2}
+        assert in_flight == [before + 1, before + 1]
+        assert controller.in_flight == before
+
+    def test_request_log_misst_ganzen_stream(self, monkeypatch):
+        """duration_ms muss das Senden des Bodys enthalten, sonst gilt ein langsamer Stream nie als langsam"""
+        import logging
+        import time as time_module
+        records = []
+
+        class Collector(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        class SlowClient(FakePagedClient):
+            def iter_document_pages(self, collection_id=None):
+                for page in super().iter_document_pages(collection_id):
+                    time_module.sleep(0.1)
+                    yield page
+
+        self.app_module.outline_cache.client = SlowClient([[{"id": "a"}], [{"id": "b"}]])
+        handler = Collector()
+        app_logger = logging.getLogger("outline-pdf")
+        app_logger.addHandler(handler)
+        try:
+            self.read_lines("/api/documents/stream")
+        finally:
+            app_logger.removeHandler(handler)
+        logged = [r for r in records if getattr(r, "path", None) == "/api/documents/stream"]
+        assert len(logged) == 1
+        assert logged[0].duration_ms >= 200
+
+    def test_ungueltige_collection_id(self):
+        response = self.client.get("/api/documents/stream?collection_id=not-valid")
+        assert response.status_code == 400
+
+
+# ===== FONT-SUBSET TESTS =====
+
+def build_test_font(path, chars="ABab\u03a9\u0416\u0436"):
+    """Minimale TTF-Datei mit je einem Rechteck-Glyph pro Zeichen"""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    def box():
+        pen = TTGlyphPen(None)
+        pen.moveTo((50, 0))
+        pen.lineTo((50, 700))
+        pen.lineTo((450, 700))
+        pen.lineTo((450, 0))
+        pen.closePath()
+        return pen.glyph()
+
+    names = [".notdef"] + [f"g{ord(c)}" for c in chars]
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(names)
+    builder.setupCharacterMap({ord(c): f"g{ord(c)}" for c in chars})
+    builder.setupGlyf({name: box() for name in names})
+    builder.setupHorizontalMetrics({name: (500, 50) for name in names})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({"familyName": "Test", "styleName": "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(str(path))
+
+
+class TestFontSubsets:
+    """Tests fuer den Font-Service (Subsetting und Cache pro Zeichensatz)"""
+
+    def setup_method(self):
+        import app as app_module
+        self.app_module = app_module
+        self.original_service = app_module.font_service
+
+    def teardown_method(self):
+        self.app_module.font_service = self.original_service
+
+    def make_service(self, tmp_path):
+        from modules.fonts import FontService
+        build_test_font(tmp_path / "LiberationSans-Regular.ttf")
+        return FontService([str(tmp_path)])
+
+    def test_subset_enthaelt_nur_verwendete_zeichen(self, tmp_path):
+        import io
+        from fontTools.ttLib import TTFont
+        service = self.make_service(tmp_path)
+        assert service.families()["Helvetica"] == ["normal"]
+        assert service.families()["Roboto"] == []
+
+        # Omega und Zhe sind nicht im Basis-Zeichensatz -> nur enthalten, wenn verwendet
+        glyph_hash = service.register_glyphs("Abba \u03a9")
+        cmap = TTFont(io.BytesIO(service.subset("Helvetica", "normal", glyph_hash))).getBestCmap()
+        assert set(cmap) == {ord("A"), ord("B"), ord("a"), ord("b"), 0x03a9}
+
+        data = service.subset("Helvetica", "normal", service.register_glyphs("ab"))
+        assert set(TTFont(io.BytesIO(data)).getBestCmap()) == {ord("A"), ord("B"), ord("a"), ord("b")}
+        assert len(data) < os.path.getsize(tmp_path / "LiberationSans-Regular.ttf")
+
+    def test_cache_pro_zeichensatz_hash(self, tmp_path):
+        service = self.make_service(tmp_path)
+        first = service.register_glyphs("ab")
+        assert service.register_glyphs("ba") == first
+        assert service.register_glyphs("ab\u0416") != first
+        data = service.subset("Helvetica", "normal", first)
+        assert service.subset("Helvetica", "normal", first) is data
+        assert service.stats()["subsets"]["entries"] == 1
+        assert service.subset("Helvetica", "normal", "0" * 16) is None
+
+    def test_typographer_und_entities_im_subset(self, tmp_path):
+        """markdown-it macht aus (c), &rarr; usw. Zeichen, die im Markdown nicht vorkommen"""
+        import html
+        import re
+        from markdown_it import MarkdownIt
+        service = self.make_service(tmp_path)
+        md = '(c) (r) (tm) +- Weiter &rarr; "Zitat" ... -- &times; &hellip;'
+        chars = service.glyphs(service.register_glyphs(md))
+        rendered = MarkdownIt("commonmark", {"typographer": True}).enable(["replacements", "smartquotes"]).render(md)
+        text = html.unescape(re.sub(r"<[^>]+>", "", rendered)).strip()
+        assert "©" in text and "→" in text
+        assert set(text) <= set(chars)
+
+    def test_zeichensatz_ueberlebt_neustart(self, tmp_path):
+        """Subset-URLs sind immutable: ein neuer Prozess (Neustart, zweiter Worker) muss sie neu erzeugen koennen"""
+        from modules.fonts import FontService
+        build_test_font(tmp_path / "LiberationSans-Regular.ttf")
+        glyph_dir = str(tmp_path / "glyphs")
+        first = FontService([str(tmp_path)], glyph_dir=glyph_dir)
+        glyph_hash = first.register_glyphs("abΩ")
+        expected = first.subset("Helvetica", "normal", glyph_hash)
+
+        second = FontService([str(tmp_path)], glyph_dir=glyph_dir)
+        assert second.subset("Helvetica", "normal", glyph_hash) == expected
+
+        # Manipulierte Datei passt nicht zum Hash -> kein falsches Subset
+        with open(os.path.join(glyph_dir, f"{glyph_hash}.txt"), "w", encoding="utf-8") as f:
+            f.write("xyz")
+        assert FontService([str(tmp_path)], glyph_dir=glyph_dir).subset("Helvetica", "normal", glyph_hash) is None
+
+    def test_endpoints(self, tmp_path):
+        self.app_module.font_service = self.make_service(tmp_path)
+        client = TestClient(self.app_module.app)
+
+        response = client.post("/api/fonts/subset", json={"family": "Helvetica", "text": "Abc"})
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert list(data["files"]) == ["normal"]
+
+        font = client.get(data["files"]["normal"])
+        assert font.status_code == 200
+        assert font.headers["content-type"] == "font/ttf"
+        assert "immutable" in font.headers["cache-control"]
+
+    def test_endpoints_fehlerfaelle(self, tmp_path):
+        self.app_module.font_service = self.make_service(tmp_path)
+        client = TestClient(self.app_module.app)
+        assert client.post("/api/fonts/subset", json={"family": "Comic", "text": "a"}).status_code == 400
+        assert client.post("/api/fonts/subset", json={"family": "Roboto", "text": "a"}).status_code == 404
+        assert client.get("/api/fonts/Helvetica/normal/" + "0" * 16 + ".ttf").status_code == 404
+        assert client.get("/api/fonts/Helvetica/normal/..%2F..%2Fetc.ttf").status_code in (400, 404)
+
+
+# ===== COLLECTION EXPORT TESTS =====
+
+class TestCollectionExport:
+    """Tests fuer den serverseitigen Collection-Export als ein PDF"""
+
+    def setup_method(self):
+        import app as app_module
+        self.client = TestClient(app_module.app)
+        self.cache = app_module.outline_cache
+        self.cache.clear()
+        self.ids = [f"00000000-0000-4000-8000-00000000000{i}" for i in range(3)]
+        self.cache.data.set("collections", [{"id": COLLECTION_ID, "name": "Handbuch"}])
+        self.cache.data.set(f"tree:{COLLECTION_ID}", [
+            {"id": self.ids[0], "title": "Eins", "children": [
+                {"id": self.ids[1], "title": "Eins A", "children": []},
+            ]},
+            {"id": self.ids[2], "title": "Zwei", "children": []},
+        ])
+        for doc_id in self.ids:
+            self.cache.data.set(f"document:{doc_id}", {"id": doc_id, "text": "# Kapitel\n\nInhalt mit Umlauten äöü."})
+        self.cache.data.set(f"documents:{COLLECTION_ID}", [
+            {"id": doc_id, "updatedAt": "2024-01-01T00:00:00.000Z"} for doc_id in self.ids
+        ])
+        self.app_module = app_module
+        self.original_export_dir = app_module.EXPORT_CACHE_DIR
+        self.export_dir = tempfile.mkdtemp()
+        app_module.EXPORT_CACHE_DIR = self.export_dir
+
+    def teardown_method(self):
+        self.cache.clear()
+        self.app_module.EXPORT_CACHE_DIR = self.original_export_dir
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+
+    def export(self, style=None):
+        """Export direkt ueber das Modul, zaehlt die geladenen Dokumente"""
+        from modules.pdf_export import export_collection_pdf, pdf_style
+        loaded = []
+        original = self.cache.get_document
+
+        def get_document(doc_id):
+            loaded.append(doc_id)
+            return original(doc_id)
+
+        self.cache.get_document = get_document
+        try:
+            stats = export_collection_pdf(
+                self.cache, COLLECTION_ID, "Handbuch", style or pdf_style({}),
+                os.path.join(self.export_dir, "out.pdf"), workers=2,
+                store_dir=os.path.join(self.export_dir, COLLECTION_ID),
+            )
+        finally:
+            del self.cache.get_document
+        return stats, loaded
+
+    def test_flatten_tree_reihenfolge(self):
+        from modules.pdf_export import flatten_tree
+        entries = flatten_tree(self.cache.data.get(f"tree:{COLLECTION_ID}"))
+        assert [e["title"] for e in entries] == ["Eins", "Eins A", "Zwei"]
+        assert [e["depth"] for e in entries] == [0, 1, 0]
+
+    def test_export_ein_pdf(self):
+        """Titelseite + Inhaltsverzeichnis + je eine Seite pro Dokument, durchgehend nummeriert"""
+        import io
+        from pypdf import PdfReader
+        response = self.client.get(f"/api/collections/{COLLECTION_ID}/export.pdf")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/pdf"
+
+        reader = PdfReader(io.BytesIO(response.content))
+        assert len(reader.pages) == 5
+        toc = reader.pages[1].extract_text()
+        assert "Inhaltsverzeichnis" in toc
+        assert "Eins A" in toc
+        assert "Seite 5 von 5" in reader.pages[4].extract_text()
+        assert [o["/Title"] for o in reader.outline if not isinstance(o, list)] == ["Eins", "Zwei"]
+
+    def test_inkrementeller_export_verwendet_unveraenderte_dokumente(self):
+        """Zweiter Export ohne Aenderungen laedt und rendert kein Dokument neu"""
+        from pypdf import PdfReader
+        stats, loaded = self.export()
+        assert stats["rendered"] == 3 and stats["reused"] == 0
+        assert sorted(loaded) == sorted(self.ids)
+
+        stats, loaded = self.export()
+        assert stats["reused"] == 3 and stats["rendered"] == 0
+        assert loaded == []
+        reader = PdfReader(os.path.join(self.export_dir, "out.pdf"))
+        assert len(reader.pages) == 5
+        assert "Seite 5 von 5" in reader.pages[4].extract_text()
+
+    def test_inkrementeller_export_rendert_geaenderte_dokumente(self):
+        """Neues updatedAt -> nur dieses Dokument wird neu geladen"""
+        self.export()
+        self.cache.data.update(f"documents:{COLLECTION_ID}", lambda docs: [
+            dict(d, updatedAt="2024-02-01T00:00:00.000Z") if d["id"] == self.ids[1] else d for d in docs
+        ])
+        stats, loaded = self.export()
+        assert loaded == [self.ids[1]]
+        assert stats["reused"] == 2
+
+        manifest = json.load(open(os.path.join(self.export_dir, COLLECTION_ID, "manifest.json")))
+        assert manifest["documents"][self.ids[1]]["updatedAt"] == "2024-02-01T00:00:00.000Z"
+
+    def test_inkrementeller_export_andere_vorlage_rendert_alles(self):
+        from modules.pdf_export import pdf_style
+        self.export()
+        stats, loaded = self.export(pdf_style({"fontsize": 14}))
+        assert stats["rendered"] == 3
+        # Pro Dokument bleibt nur die Datei der zuletzt verwendeten Vorlage liegen
+        files = [f for f in os.listdir(os.path.join(self.export_dir, COLLECTION_ID)) if f.endswith(".pdf")]
+        assert len(files) == 3
+
+    def test_inkrementeller_export_entfernt_geloeschte_dokumente(self):
+        self.export()
+        self.cache.data.set(f"tree:{COLLECTION_ID}", [{"id": self.ids[2], "title": "Zwei", "children": []}])
+        stats, loaded = self.export()
+        assert stats["documents"] == 1 and stats["reused"] == 1
+        manifest = json.load(open(os.path.join(self.export_dir, COLLECTION_ID, "manifest.json")))
+        assert list(manifest["documents"]) == [self.ids[2]]
+
+    def test_stream_rohdaten_unveraendert(self, tmp_path):
+        """StreamingPdfWriter kopiert kodierte Streams ueber ein internes pypdf-Attribut - bei Aenderung laut scheitern"""
+        import io
+        import zlib
+        from fpdf import FPDF
+        from PIL import Image
+        from pypdf import PdfReader
+        from modules.pdf_export import StreamingPdfWriter, encoded_stream_data
+
+        jpeg = io.BytesIO()
+        Image.new("RGB", (8, 8), (200, 30, 30)).save(jpeg, "JPEG")
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Helvetica", size=12)
+        pdf.cell(text="Hallo")
+        pdf.image(io.BytesIO(jpeg.getvalue()), w=20)
+        source = PdfReader(io.BytesIO(bytes(pdf.output())))
+
+        page = source.pages[0]
+        content = page["/Contents"].get_object()
+        assert zlib.decompress(encoded_stream_data(content)) == content.get_data()
+        image = next(iter(page["/Resources"]["/XObject"].values())).get_object()
+        assert encoded_stream_data(image) == jpeg.getvalue()
+
+        # Kopie ueber den StreamingPdfWriter: JPEG-Bytes bleiben byte-identisch
+        out_path = tmp_path / "kopie.pdf"
+        with open(out_path, "wb") as f:
+            writer = StreamingPdfWriter(f, 1)
+            writer.append(source, [])
+            writer.close()
+        copied = PdfReader(str(out_path)).pages[0]
+        copied_image = next(iter(copied["/Resources"]["/XObject"].values())).get_object()
+        assert encoded_stream_data(copied_image) == jpeg.getvalue()
+        assert "Hallo" in copied.extract_text()
+
+    def test_speicher_waechst_nicht_mit_dokumentanzahl(self):
+        """Dokumente werden einzeln in die Ausgabedatei geschrieben: Spitzenverbrauch unabhaengig von der Anzahl"""
+        import io
+        import tracemalloc
+        from PIL import Image
+        from pypdf import PdfReader
+        from modules.pdf_export import export_collection_pdf, pdf_style
+
+        buffer = io.BytesIO()
+        Image.frombytes("RGB", (400, 400), os.urandom(400 * 400 * 3)).save(buffer, "PNG")
+        image = buffer.getvalue()
+
+        class ImageCache:
+            def __init__(self, count):
+                self.ids = [f"00000000-0000-4000-8000-{i:012d}" for i in range(count)]
+
+            def get_collection_tree(self, collection_id):
+                return [{"id": doc_id, "title": f"Dokument {i}", "children": []} for i, doc_id in enumerate(self.ids)]
+
+            def get_document(self, doc_id):
+                return {"id": doc_id, "text": "# Kapitel\n\n![Bild](/api/attachments.redirect?id=1)"}
+
+        def peak(count):
+            out_path = os.path.join(self.export_dir, f"{count}.pdf")
+            tracemalloc.start()
+            try:
+                export_collection_pdf(ImageCache(count), COLLECTION_ID, "Handbuch", pdf_style({}), out_path,
+                                      workers=2, load_image=lambda url: image)
+                result = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            assert len(PdfReader(out_path).pages) == count + 2
+            return result
+
+        small, large = peak(3), peak(15)
+        # Vorher wuchs der Bedarf pro Dokument um mindestens die Bildgroesse
+        assert large < small + 3 * len(image)
+
+    def test_unicode_zeichen_bleiben_erhalten(self, tmp_path):
+        """Mit eingebetteter TTF-Schrift kein Latin-1-Ersatz ("?") fuer Euro, Kyrillisch oder Symbole"""
+        from pypdf import PdfReader
+        from modules.fonts import FontService
+        from modules.pdf_export import export_document_pdf, pdf_style, to_latin1
+        text = "Preis 5 € – Привет ✓"
+        assert "?" in to_latin1(text)
+
+        build_test_font(tmp_path / "LiberationSans-Regular.ttf", chars=sorted(set(text + "Seite 1von.")))
+        style = pdf_style({"font": "Roboto"}, FontService([str(tmp_path)]))
+        assert style["font_files"][""].endswith("LiberationSans-Regular.ttf")
+
+        path = str(tmp_path / "unicode.pdf")
+        assert export_document_pdf({"text": text}, text, style, path) == 1
+        content = PdfReader(path).pages[0].extract_text()
+        assert content.count(text) == 3  # Titel, Inhalt, Fusszeile
+        assert "?" not in content
+
+        # Ohne Schriftdatei bleibt der Core-Font als Rueckfall
+        assert "font_files" not in pdf_style({"font": "Roboto"}, FontService([str(tmp_path / "leer")]))
+
+    def test_export_ungueltige_collection_id(self):
+        response = self.client.get("/api/collections/not-valid/export.pdf")
+        assert response.status_code == 400
+
+    def test_export_unbekannte_vorlage(self):
+        response = self.client.get(f"/api/collections/{COLLECTION_ID}/export.pdf?template_id=gibts-nicht")
+        assert response.status_code == 404
+
+
+# ===== EXPORT CLI TESTS =====
+
+class FakeCliClient:
+    """OutlineClient-Ersatz fuer export_cli (zaehlt geladene Dokumente)"""
+
+    base_url = "http://outline.test"
+    api_token = "dummytoken12345"
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.updated_at = {doc_id: "2024-01-01T00:00:00.000Z" for doc_id in ids}
+        self.loaded = []
+        self.failing = set()
+
+    def get_collections(self):
+        return [{"id": COLLECTION_ID, "name": "Handbuch"}]
+
+    def get_collection_tree(self, collection_id):
+        return [
+            {"id": self.ids[0], "title": "Eins", "children": [{"id": self.ids[1], "title": "Eins", "children": []}]},
+            {"id": self.ids[2], "title": "Zwei", "children": []},
+        ]
+
+    def get_documents(self, collection_id=None):
+        return [{"id": doc_id, "updatedAt": updated} for doc_id, updated in self.updated_at.items()]
+
+    def get_document(self, doc_id):
+        self.loaded.append(doc_id)
+        if doc_id in self.failing:
+            raise RuntimeError("Outline nicht erreichbar")
+        return {"id": doc_id, "text": "# Kapitel\n\nInhalt mit Umlauten äöü."}
+
+
+class TestExportCli:
+    """Tests fuer den Kommandozeilen-Export (export_cli.py, ohne Prozess-Pool)"""
+
+    def setup_method(self):
+        import export_cli
+        self.cli = export_cli
+        self.ids = [f"00000000-0000-4000-8000-00000000000{i}" for i in range(3)]
+        self.fake = FakeCliClient(self.ids)
+        export_cli._client = self.fake
+        self.out_dir = tempfile.mkdtemp()
+        self.style = export_cli.load_style("default")
+
+    def teardown_method(self):
+        self.cli._client = None
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+
+    def run(self, jobs):
+        return self.cli.run_export(jobs, self.style, self.out_dir, processes=1, progress=lambda line: None)
+
+    def test_collection_reihenfolge_und_dateinamen(self):
+        jobs = self.cli.collect_collection(self.fake, "handbuch")
+        assert [j["file"] for j in jobs] == ["001_Eins.pdf", "002_Eins.pdf", "003_Zwei.pdf"]
+        assert all(j["updatedAt"] for j in jobs)
+
+    def test_gleiche_titel_bekommen_id_suffix(self):
+        jobs = self.cli.assign_filenames([{"id": "aaaaaaaa-1", "title": "Notiz"}, {"id": "bbbbbbbb-2", "title": "Notiz"}])
+        assert [j["file"] for j in jobs] == ["Notiz.pdf", "Notiz_bbbbbbbb.pdf"]
+
+    def test_export_und_fortsetzen(self):
+        """Zweiter Lauf ueberspringt Unveraendertes, geaenderte Dokumente werden neu exportiert"""
+        from pypdf import PdfReader
+        results = self.run(self.cli.collect_collection(self.fake, COLLECTION_ID))
+        assert [r["status"] for r in results] == ["ok", "ok", "ok"]
+        reader = PdfReader(os.path.join(self.out_dir, "003_Zwei.pdf"))
+        assert "Seite 1 von 1" in reader.pages[0].extract_text()
+
+        self.fake.loaded.clear()
+        self.fake.updated_at[self.ids[2]] = "2024-02-01T00:00:00.000Z"
+        results = self.run(self.cli.collect_collection(self.fake, COLLECTION_ID))
+        assert [r["status"] for r in results] == ["uebersprungen", "uebersprungen", "ok"]
+        assert self.fake.loaded == [self.ids[2]]
+        assert not [f for f in os.listdir(self.out_dir) if f.endswith(".part")]
+
+    def test_gleiche_titel_tauschen_reihenfolge(self):
+        """Umbenennen darf die Datei eines anderen Dokuments nicht ueberschreiben"""
+        from pypdf import PdfReader
+        ids = ["aaaaaaaa-0000-4000-8000-000000000000", "bbbbbbbb-0000-4000-8000-000000000000"]
+
+        class TitleClient(FakeCliClient):
+            def get_document(self, doc_id):
+                self.loaded.append(doc_id)
+                return {"id": doc_id, "title": "Notiz", "updatedAt": "2024-01-01T00:00:00.000Z",
+                        "text": f"Inhalt von {doc_id[:8]}"}
+
+        fake = TitleClient(ids)
+        self.cli._client = fake
+        first = self.run(self.cli.collect_documents(fake, ids))
+        assert [r["file"] for r in first] == ["Notiz.pdf", "Notiz_bbbbbbbb.pdf"]
+
+        second = self.run(self.cli.collect_documents(fake, list(reversed(ids))))
+        assert [r["status"] for r in second] == ["uebersprungen", "uebersprungen"]
+        assert [r["file"] for r in second] == ["Notiz.pdf", "Notiz_aaaaaaaa.pdf"]
+        for r in second:
+            text = PdfReader(os.path.join(self.out_dir, r["file"])).pages[0].extract_text()
+            assert f"Inhalt von {r['id'][:8]}" in text
+        assert sorted(f for f in os.listdir(self.out_dir) if f.endswith(".pdf")) == ["Notiz.pdf", "Notiz_aaaaaaaa.pdf"]
+
+    def test_fehler_wird_beim_naechsten_lauf_wiederholt(self):
+        self.fake.failing.add(self.ids[1])
+        results = self.run(self.cli.collect_collection(self.fake, COLLECTION_ID))
+        assert [r["status"] for r in results] == ["ok", "fehler", "ok"]
+        summary = self.cli.format_summary(results, 1.0, 1)
+        assert "2 exportiert, 0 uebersprungen, 1 Fehler" in summary
+        assert "Outline nicht erreichbar" in summary
+
+        self.fake.failing.clear()
+        results = self.run(self.cli.collect_collection(self.fake, COLLECTION_ID))
+        assert [r["status"] for r in results] == ["uebersprungen", "ok", "uebersprungen"]
+
+    def test_bilder_nur_vom_outline_host(self):
+        """Der API-Token darf nie an fremde Hosts gehen"""
+        assert self.cli._load_image("https://evil.example/bild.png") is None
+        assert self.cli._load_image("http://outline.test.evil.example/bild.png") is None
+        assert self.cli._load_image("/api/../etc/passwd") is None
+
+    def test_unbekannte_vorlage(self):
+        with pytest.raises(ValueError):
+            self.cli.load_style("gibts-nicht")
+
+    def test_suche_ueber_alle_seiten(self, monkeypatch):
+        """documents.search liefert hoechstens 25 Treffer pro Anfrage - die CLI muss weiterblaettern"""
+        from modules.outline_client import OutlineClient
+        hits = [{"document": {"id": f"doc-{i}", "title": f"Treffer {i}", "updatedAt": "2024-01-01"}} for i in range(30)]
+        payloads = []
+
+        class FakeResponse:
+            def __init__(self, data):
+                self.data = data
+
+            def json(self):
+                return {"data": self.data}
+
+        def fake_post(url, payload):
+            payloads.append(payload)
+            return FakeResponse(hits[payload["offset"]:payload["offset"] + payload["limit"]])
+
+        client = OutlineClient()
+        monkeypatch.setattr(client, "_post", fake_post)
+        jobs = self.cli.collect_search(client, "Onboarding")
+        assert len(jobs) == 30
+        assert [(p["offset"], p["limit"]) for p in payloads] == [(0, 25), (25, 25)]
+
+    def test_vorlagen_unabhaengig_vom_arbeitsverzeichnis(self, monkeypatch, tmp_path):
+        """Cron-Jobs starten die CLI aus beliebigen Verzeichnissen"""
+        monkeypatch.chdir(tmp_path)
+        assert self.cli.load_style("formal")
+
+    def test_fehlende_vorlagen_datei(self, monkeypatch, tmp_path, capsys):
+        monkeypatch.setattr(self.cli, "TEMPLATES_FILE", str(tmp_path / "fehlt.json"))
+        assert self.cli.main(["documents", self.ids[0], "--out", self.out_dir]) == 2
+        assert capsys.readouterr().err.startswith("Fehler:")
+
+
+# ===== PREFETCH TESTS =====
+
+class TestPrefetch:
+    """Tests fuer das Vorwaermen des Server-Caches (Budget, Prioritaet, heisse Dokumente)"""
+
+    def run_prefetcher(self, prefetcher, ids, seconds=0.3):
+        import asyncio
+
+        async def scenario():
+            prefetcher.start()
+            prefetcher.enqueue(ids, "test")
+            await asyncio.sleep(seconds)
+            prefetcher.stop()
+
+        asyncio.run(scenario())
+
+    def test_reihenfolge_und_budget(self):
+        """Erstes Dokument zuerst; mehr als das Budget wird nicht sofort geladen"""
+        from modules.prefetch import Prefetcher
+        warmed = []
+        prefetcher = Prefetcher(lambda doc_id: warmed.append(doc_id) or True, budget_per_minute=2)
+        self.run_prefetcher(prefetcher, ["a", "b", "c"])
+        assert warmed == ["a", "b"]
+        assert prefetcher.metrics()["queued"] == 1
+
+    def test_bereits_gecachte_zaehlen_nicht_zum_budget(self):
+        from modules.prefetch import Prefetcher
+        warmed = []
+
+        def warm(doc_id):
+            warmed.append(doc_id)
+            return doc_id != "cached"
+
+        prefetcher = Prefetcher(warm, budget_per_minute=1)
+        self.run_prefetcher(prefetcher, ["cached", "neu"])
+        assert warmed == ["cached", "neu"]
+        assert prefetcher.already_cached == 1 and prefetcher.warmed == 1
+
+    def test_pausiert_bei_last(self):
+        from modules.prefetch import Prefetcher
+        warmed = []
+        prefetcher = Prefetcher(lambda doc_id: warmed.append(doc_id) or True, is_busy=lambda: True, idle_delay=0.05)
+        self.run_prefetcher(prefetcher, ["a"])
+        assert warmed == []
+
+    def test_warteschlange_begrenzt(self):
+        from modules.prefetch import Prefetcher
+        prefetcher = Prefetcher(lambda doc_id: True, max_queue=3)
+        assert prefetcher.enqueue(["a", "b", "c", "a"], "test") == 3
+        prefetcher.enqueue(["d", "e"], "test")
+        assert prefetcher.metrics()["queued"] == 3
+        assert prefetcher.dropped == 2
+
+    def test_heisse_dokumente_ueberleben_neustart(self, tmp_path):
+        from modules.prefetch import Prefetcher
+        hot_file = str(tmp_path / "hot.json")
+        prefetcher = Prefetcher(lambda doc_id: True, hot_file=hot_file)
+        for doc_id in ["a", "b", "b", "c", "b", "c"]:
+            prefetcher.record_access(doc_id)
+        prefetcher.save_hot()
+        assert Prefetcher(lambda doc_id: True, hot_file=hot_file).hottest(2) == ["b", "c"]
+
+    def test_vorgewaermtes_dokument_ohne_zweiten_abruf(self, monkeypatch):
+        """Der Editor muss das vorgewaermte Dokument aus dem Cache bekommen (kein zweites documents.info)"""
+        import app as app_module
+        cache = app_module.outline_cache
+        cache.clear()
+        monkeypatch.setattr(cache, "content_ttl", 86400)
+        doc_id = "00000000-0000-4000-8000-000000000001"
+        fake = FakeCliClient([doc_id])
+        monkeypatch.setattr(cache, "client", fake)
+        try:
+            assert app_module.warm_document(doc_id) is True
+            response = TestClient(app_module.app).get(f"/api/document/{doc_id}")
+            assert response.status_code == 200
+            assert fake.loaded == [doc_id]
+        finally:
+            cache.clear()
+
+    def test_ohne_inhalts_cache_kein_prefetch(self, monkeypatch):
+        """Ohne content_ttl speichert das Vorwaermen nichts -> Prefetch bleibt trotz PREFETCH_ENABLED aus"""
+        import app as app_module
+        monkeypatch.setattr(app_module, "PREFETCH_ENABLED", True)
+        monkeypatch.setattr(app_module.outline_cache, "content_ttl", 0)
+        assert app_module.prefetch_active() is False
+        response = TestClient(app_module.app).post("/api/prefetch", json={"ids": [DOC_ID]})
+        assert response.status_code == 404
+
+    def test_warm_document_fuellt_cache(self):
+        import app as app_module
+        cache = app_module.outline_cache
+        cache.clear()
+        doc_id = "00000000-0000-4000-8000-000000000001"
+        cache.data.set(f"document:{doc_id}", {"id": doc_id, "text": "# Titel\n\nText", "updatedAt": "2024-01-01"})
+        hits = cache.data.stats()["hits"]
+        try:
+            assert app_module.warm_document(doc_id) is True
+            assert cache.data.keys(f"prepared:{doc_id}:")
+            assert app_module.warm_document(doc_id) is False
+            # Hintergrund-Zugriffe verfaelschen die Cache-Statistik nicht
+            assert cache.data.stats()["hits"] == hits
+        finally:
+            cache.clear()
+
+    def test_standardmaessig_aus(self):
+        import app as app_module
+        if "PREFETCH_ENABLED" in os.environ:
+            pytest.skip("PREFETCH_ENABLED ist in der Umgebung gesetzt")
+        assert app_module.PREFETCH_ENABLED is False
+        response = TestClient(app_module.app).post("/api/prefetch", json={"ids": [DOC_ID]})
+        assert response.status_code == 404
+
+    def test_endpoint(self, monkeypatch):
+        import app as app_module
+        monkeypatch.setattr(app_module, "PREFETCH_ENABLED", True)
+        monkeypatch.setattr(app_module.outline_cache, "content_ttl", 86400)
+        client = TestClient(app_module.app)
+        ids = [f"00000000-0000-4000-8000-00000000000{i}" for i in range(3)]
+        try:
+            response = client.post("/api/prefetch", json={"ids": ids, "reason": "search"})
+            assert response.status_code == 200
+            assert response.json()["data"]["queued"] == 3
+            assert app_module.prefetcher.metrics()["queued"] == 3
+
+            assert client.post("/api/prefetch", json={"ids": ["kein-uuid"]}).status_code == 400
+            too_many = [ids[0]] * (app_module.PREFETCH_MAX_IDS + 1)
+            assert client.post("/api/prefetch", json={"ids": too_many}).status_code == 400
+        finally:
+            app_module.prefetcher._queue.clear()
+
+
+# ===== ADMISSION CONTROL TESTS =====
+
+class TestAdmissionControl:
+    """Tests fuer Parallelitaetsgrenzen, faire Warteschlange und Load Shedding"""
+
+    def test_faire_reihenfolge(self):
+        """Freie Slots gehen reihum an die Clients, nicht in Ankunftsreihenfolge"""
+        import asyncio
+        from modules.admission import AdmissionController
+
+        async def scenario():
+            controller = AdmissionController("test", max_concurrent=1, max_queue=10, max_queue_per_client=5)
+            await controller.acquire("blocker")
+            order = []
+
+            async def request(client):
+                await controller.acquire(client)
+                order.append(client)
+                controller.release()
+
+            tasks = [asyncio.create_task(request(c)) for c in ["a", "a", "a", "b"]]
+            await asyncio.sleep(0)
+            controller.release()
+            await asyncio.gather(*tasks)
+            return order
+
+        assert asyncio.run(scenario()) == ["a", "b", "a", "a"]
+
+    def test_queue_voll_sofort_ablehnen(self):
+        import asyncio
+        from modules.admission import AdmissionController, Overloaded
+
+        async def scenario():
+            controller = AdmissionController("test", max_concurrent=1, max_queue=0)
+            await controller.acquire("a")
+            with pytest.raises(Overloaded) as exc:
+                await controller.acquire("b")
+            return controller, exc.value
+
+        controller, error = asyncio.run(scenario())
+        assert error.retry_after >= 1
+        assert controller.metrics()["rejected"] == 1
+
+    def test_wartezeit_abgelaufen(self):
+        import asyncio
+        from modules.admission import AdmissionController, Overloaded
+
+        async def scenario():
+            controller = AdmissionController("test", max_concurrent=1, max_queue=5, max_wait=0.01)
+            await controller.acquire("a")
+            with pytest.raises(Overloaded):
+                await controller.acquire("b")
+            return controller.metrics()
+
+        metrics = asyncio.run(scenario())
+        assert metrics["timeouts"] == 1
+        assert metrics["queued"] == 0
+
+    def test_503_mit_retry_after(self):
+        import app as app_module
+        from modules.admission import AdmissionController
+        original = app_module.admission["image"]
+        controller = AdmissionController("image", max_concurrent=1, max_queue=0)
+        controller.in_flight = 1  # Slot belegt
+        app_module.admission["image"] = controller
+        try:
+            response = TestClient(app_module.app).get("/api/image-proxy?url=/api/attachments.redirect?id=1")
+            assert response.status_code == 503
+            assert int(response.headers["Retry-After"]) >= 1
+        finally:
+            app_module.admission["image"] = original
+
+    def test_metrics_endpoint(self):
+        from app import app
+        response = TestClient(app).get("/api/metrics")
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert set(data["admission"]) == {"image", "document", "export"}
+        assert "queued" in data["admission"]["image"]
+        assert "rejected" in data["admission"]["image"]
+
+
+class TestStructuredLogging:
+    """Tests fuer Log-Queue, JSON-Records, Request-ID und Sampling"""
+
+    def test_json_record_ueber_queue(self):
+        """Records werden im Hintergrund-Thread als JSON mit Request-ID geschrieben"""
+        import io
+        import logging
+        from modules.logging_setup import build_pipeline, start_request, request_context
+
+        stream = io.StringIO()
+        handler, listener = build_pipeline(stream, "json")
+        test_logger = logging.getLogger("outline-pdf.test-json")
+        test_logger.propagate = False
+        test_logger.addHandler(handler)
+        token = request_context.set(None)
+        try:
+            start_request("req-123")
+            test_logger.warning("Dokument %s fehlt", "abc", extra={"duration_ms": 12.5})
+        finally:
+            request_context.reset(token)
+            listener.stop()
+            test_logger.removeHandler(handler)
+
+        record = json.loads(stream.getvalue().strip())
+        assert record["msg"] == "Dokument abc fehlt"
+        assert record["level"] == "WARNING"
+        assert record["request_id"] == "req-123"
+        assert record["duration_ms"] == 12.5
+
+    def test_exception_traceback_im_record(self):
+        import io
+        import logging
+        from modules.logging_setup import build_pipeline
+
+        stream = io.StringIO()
+        handler, listener = build_pipeline(stream, "json")
+        test_logger = logging.getLogger("outline-pdf.test-exc")
+        test_logger.propagate = False
+        test_logger.addHandler(handler)
+        try:
+            try:
+                raise ValueError("kaputt")
+            except ValueError:
+                test_logger.error("Fehler", exc_info=True)
+        finally:
+            listener.stop()
+            test_logger.removeHandler(handler)
+
+        record = json.loads(stream.getvalue().strip())
+        assert "ValueError: kaputt" in record["exc"]
+
+    def test_sampling_fehler_und_langsame_immer(self):
+        import logging
+        from modules.logging_setup import RequestLogSampler
+        sampler = RequestLogSampler(sample_rate=0.0, slow_ms=500)
+        assert sampler.level_for(200, 10) is None
+        assert sampler.level_for(200, 800) == logging.WARNING
+        assert sampler.level_for(404, 10) == logging.WARNING
+        assert sampler.level_for(502, 10) == logging.ERROR
+        assert RequestLogSampler(sample_rate=1.0).level_for(200, 10) == logging.INFO
+
+    def test_timings_pro_request(self):
+        from modules.logging_setup import start_request, add_timing, request_context
+        token = request_context.set(None)
+        try:
+            ctx = start_request("req-1")
+            add_timing("outline_ms", 10)
+            add_timing("outline_ms", 5.5)
+            assert ctx["timings"] == {"outline_ms": 15.5}
+        finally:
+            request_context.reset(token)
+        # Ohne laufenden Request passiert nichts
+        add_timing("outline_ms", 1)
+
+    def test_request_id_header(self):
+        from app import app
+        client = TestClient(app)
+        response = client.get("/api/metrics")
+        assert len(response.headers["X-Request-ID"]) == 16
+        response = client.get("/api/metrics", headers={"X-Request-ID": "proxy-abc.1"})
+        assert response.headers["X-Request-ID"] == "proxy-abc.1"
+        # Ungueltige IDs werden ersetzt
+        response = client.get("/api/metrics", headers={"X-Request-ID": "x" * 100})
+        assert response.headers["X-Request-ID"] != "x" * 100
+
+
+class TestProfiling:
+    """Tests fuer Admin-Profiling (CPU-Sampling, tracemalloc, Event-Loop, Thread-Pool)"""
+
+    def test_cpu_profil_collapsed_stacks(self):
+        """Ein beschaeftigter Thread taucht mit seiner Funktion in den Stacks auf"""
+        import threading
+        from modules.profiling import SamplingProfiler, format_collapsed
+
+        stop = threading.Event()
+
+        def busy_worker():
+            while not stop.is_set():
+                sum(range(1000))
+
+        thread = threading.Thread(target=busy_worker, name="busy")
+        thread.start()
+        try:
+            result = SamplingProfiler().profile(0.2, interval_ms=2)
+        finally:
+            stop.set()
+            thread.join()
+
+        assert result["samples"] > 0
+        lines = format_collapsed(result["stacks"]).strip().split("\n")
+        busy = [line for line in lines if line.startswith("busy;")]
+        assert busy and "busy_worker" in busy[0]
+        # Format: '<stack> <anzahl>'
+        assert busy[0].rsplit(" ", 1)[1].isdigit()
+
+    def test_cpu_profil_nur_einmal_gleichzeitig(self):
+        from modules.profiling import SamplingProfiler, ProfilerBusy
+        profiler = SamplingProfiler()
+        profiler._lock.acquire()
+        try:
+            with pytest.raises(ProfilerBusy):
+                profiler.profile(0.1)
+        finally:
+            profiler._lock.release()
+
+    def test_memory_snapshot_mit_diff(self):
+        from modules.profiling import MemoryTracker
+        tracker = MemoryTracker()
+        tracker.start()
+        try:
+            first = tracker.snapshot(limit=5)
+            assert first["diff"] is None
+            buffers = [bytearray(256 * 1024) for _ in range(4)]  # noqa: F841
+            second = tracker.snapshot(limit=5)
+            assert second["diff"][0]["size_diff"] >= 1024 * 1024
+            assert "test_app.py" in second["diff"][0]["location"]
+        finally:
+            tracker.stop()
+
+    def test_loop_lag_misst_blockierung(self):
+        import asyncio
+        import time
+        from modules.profiling import LoopLagMonitor
+
+        async def scenario():
+            monitor = LoopLagMonitor(interval=0.01)
+            monitor.start()
+            await asyncio.sleep(0.02)
+            time.sleep(0.1)  # blockiert den Loop
+            await asyncio.sleep(0.03)
+            monitor.stop()
+            return monitor.metrics()
+
+        metrics = asyncio.run(scenario())
+        assert metrics["max_ms"] >= 50
+
+    def test_endpoints_ohne_konfiguration_404(self):
+        from app import app
+        client = TestClient(app)
+        assert client.get("/api/admin/runtime").status_code == 404
+        assert client.get("/api/admin/profile/cpu?seconds=1").status_code == 404
+
+    def test_endpoints_mit_token(self, monkeypatch):
+        import app as app_module
+        monkeypatch.setattr(app_module, "ENABLE_PROFILING", True)
+        monkeypatch.setattr(app_module, "ADMIN_TOKEN", "geheim")
+        client = TestClient(app_module.app)
+
+        assert client.get("/api/admin/runtime").status_code == 401
+        assert client.get("/api/admin/runtime", headers={"Authorization": "Bearer falsch"}).status_code == 401
+
+        headers = {"Authorization": "Bearer geheim"}
+        data = client.get("/api/admin/runtime", headers=headers).json()["data"]
+        assert data["threadpool"]["limit"] > 0
+        assert "waiting" in data["threadpool"]
+        assert "samples" in data["event_loop_lag"]
+
+        response = client.get("/api/admin/profile/cpu?seconds=0.1&interval_ms=5", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert int(response.headers["X-Profile-Samples"]) > 0
+
 
 # ===== TEMPLATE CRUD TESTS =====
 